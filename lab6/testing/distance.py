@@ -0,0 +1,113 @@
+"""Edit distances between program output and expected output, used by the
+testers.
+
+Outputs are compared within a tolerance of a few edits, and are often
+hundreds of kilobytes long, so a full edit distance matrix (quadratic in
+their lengths) is out of the question.  editDistance therefore
+
+  * skips the common prefix and suffix of its operands, which never
+    contribute to the distance, comparing them COMPARE_BLOCK characters at
+    a time rather than copying them;
+  * computes, one row at a time (with bandRow), only the diagonal band of
+    the matrix within the tolerance of the main diagonal, since no path
+    through the rest of it can be within the tolerance;
+  * stops as soon as every cell in a row exceeds the tolerance.
+
+Cells outside the band (or the matrix) are treated as being beyond the
+tolerance, so that the result is exact whenever it is within it."""
+
+# Characters compared at a time by commonPrefixLength.
+COMPARE_BLOCK = 4096
+
+def editDistance(s1, s2, limit=None):
+    """Returns the edit distance between S1 and S2.  If LIMIT is not None,
+    returns LIMIT + 1 instead as soon as the distance is known to exceed
+    LIMIT.  In that case only the diagonal band of cells within LIMIT of
+    the main diagonal is computed, taking O(LIMIT * len(S1)) time and
+    O(LIMIT) space (S1 and S2 are not copied)."""
+    if s1 == s2:
+        return 0
+    if limit is None:
+        dist = [list(range(len(s2) + 1))] + \
+               [ [i] + [ 0 ] * len(s2) for i in range(1, len(s1) + 1) ]
+        for i in range(1, len(s1) + 1):
+            for j in range(1, len(s2) + 1):
+                dist[i][j] = min(dist[i-1][j] + 1,
+                                 dist[i][j-1] + 1,
+                                 dist[i-1][j-1] + (s1[i-1] != s2[j-1]))
+        return dist[len(s1)][len(s2)]
+
+    if abs(len(s1) - len(s2)) > limit:
+        return limit + 1
+    # Common prefixes and suffixes never contribute to the distance; the
+    # rest of S1 and S2 starts at START.
+    start = commonPrefixLength(s1, s2)
+    k = commonSuffixLength(s1, s2, min(len(s1), len(s2)) - start)
+    n1, n2 = len(s1) - start - k, len(s2) - start - k
+
+    row = firstBandRow(0, n2, limit)
+    for i in range(1, n1 + 1):
+        row = bandRow(row, i, s1[start + i - 1], s2, start, n2, limit)
+        if min(row) > limit:
+            return limit + 1
+    return row[n2 - n1 + limit]
+
+def firstBandRow(i, n2, limit):
+    """Returns row I of the band of edit distances between a string and
+    one of length N2 with LIMIT, as for bandRow, given that the first I
+    characters of both are the same."""
+    return [abs(d - limit) if 0 <= i - limit + d <= n2 else limit + 1
+            for d in range(2 * limit + 1)]
+
+def bandRow(prev, i, c, s2, start, n2, limit):
+    """Returns row I of the band of edit distances between a string whose
+    Ith character is C and the N2 characters of S2 starting at START, given
+    PREV, row I - 1.  Element d of a row holds the distance between the
+    first I characters of the one and the first I - LIMIT + d of the
+    other, or LIMIT + 1 if that exceeds LIMIT or is outside the matrix."""
+    over = limit + 1
+    width = 2 * limit + 1
+    row = [over] * width
+    for d in range(width):
+        j = i - limit + d
+        if j < 0 or j > n2:
+            continue
+        if j == 0:
+            row[d] = min(i, over)
+            continue
+        best = prev[d] + (c != s2[start + j - 1])
+        if d + 1 < width and prev[d + 1] + 1 < best:
+            best = prev[d + 1] + 1
+        if d > 0 and row[d - 1] + 1 < best:
+            best = row[d - 1] + 1
+        row[d] = min(best, over)
+    return row
+
+def commonPrefixLength(s1, s2):
+    """Returns the length of the longest common prefix of S1 and S2.  They
+    are compared COMPARE_BLOCK characters at a time, so as to copy no more
+    than that."""
+    n = min(len(s1), len(s2))
+    k = 0
+    while k < n:
+        m = min(k + COMPARE_BLOCK, n)
+        if s1[k:m] != s2[k:m]:
+            while s1[k] == s2[k]:
+                k += 1
+            return k
+        k = m
+    return n
+
+def commonSuffixLength(s1, s2, limit):
+    """Returns the length of the longest common suffix of S1 and S2, up to
+    LIMIT, comparing them as commonPrefixLength does."""
+    n1, n2 = len(s1), len(s2)
+    k = 0
+    while k < limit:
+        m = min(k + COMPARE_BLOCK, limit)
+        if s1[n1 - m:n1 - k] != s2[n2 - m:n2 - k]:
+            while s1[n1 - k - 1] == s2[n2 - k - 1]:
+                k += 1
+            return k
+        k = m
+    return limit
@@ -7,6 +7,8 @@ from os import chdir, environ, getcwd, mkdir, remove
 from shutil import copyfile, rmtree
 from math import log
 from glob import glob
+from patterns import outputMatch, PatternTooExpensive, MATCH_LIMIT
+from distance import editDistance
 
 SHORT_USAGE = """\
 Usage: python3 runner.py OPTIONS TEST.in ...
@@ -19,6 +21,10 @@ Usage: python3 runner.py OPTIONS TEST.in ...
                       files referenced by + and =.
        --tolerance=N  Set the maximum allowed edit distance between program
                       output and expected output to N (default 3).
+       --match-limit=SECS  Give up matching the output of a command
+                      against a <<<* pattern after SECS seconds, reporting
+                      the pattern as too expensive (default 10; 0 for
+                      no limit).
        --verbose      Print extra information about execution.
 """
 
@@ -119,16 +125,6 @@ def contents(filename):
     except FileNotFoundError:
         return None
 
-def editDistance(s1, s2):
-    dist = [list(range(len(s2) + 1))] + \
-           [ [i] + [ 0 ] * len(s2) for i in range(1, len(s1) + 1) ]
-    for i in range(1, len(s1) + 1):
-        for j in range(1, len(s2) + 1):
-            dist[i][j] = min(dist[i-1][j] + 1,
-                             dist[i][j-1] + 1,
-                             dist[i-1][j-1] + (s1[i-1] != s2[j-1]))
-    return dist[len(s1)][len(s2)]
-
 def nextCommand(full_cmnd, timeout):
     return check_output(full_cmnd, shell=True, universal_newlines=True,
                         stdin=DEVNULL, stderr=STDOUT, timeout=timeout)
@@ -235,13 +231,17 @@ def correctProgramOutput(expected, actual, last_groups, is_regexp):
     last_groups[:] = (actual,)
     if is_regexp:
         try:
-            if not Match(expected.rstrip() + r"\Z", actual) \
-                    and not Match(expected.rstrip() + r"\Z", actual.rstrip()):
-                return False
-        except:
+            groups = outputMatch(expected.rstrip(), actual, match_limit)
+        except PatternTooExpensive:
+            raise ValueError("pattern too expensive (over {:g} s)"
+                             .format(match_limit))
+        except re.error:
             raise ValueError("bad pattern")
-        last_groups[:] += Mat.groups()
-    elif editDistance(expected.rstrip(), actual.rstrip()) > output_tolerance:
+        if groups is None:
+            return False
+        last_groups[:] += groups
+    elif editDistance(expected.rstrip(), actual.rstrip(),
+                      output_tolerance) > output_tolerance:
         return False
     return True
 
@@ -416,12 +416,13 @@ if __name__ == "__main__":
     src_dir = 'src'
     capers_dir = join(dirname(abspath(getcwd())), "capers")
     output_tolerance = 0
+    match_limit = MATCH_LIMIT
 
     try:
         opts, files = \
             getopt(sys.argv[1:], '',
                    ['show=', 'keep', 'lib=', 'verbose', 'src=',
-                    'tolerance=', 'superverbose', 'debug'])
+                    'tolerance=', 'match-limit=', 'superverbose', 'debug'])
         for opt, val in opts:
             if opt == '--show':
                 show = int(val)
@@ -435,6 +436,8 @@ if __name__ == "__main__":
                 verbose = True
             elif opt == "--tolerance":
                 output_tolerance = int(val)
+            elif opt == "--match-limit":
+                match_limit = float(val)
             elif opt == "--superverbose":
                 superverbose = True
             elif opt == "--debug":
@@ -1,11 +1,17 @@
-import sys, re
+import sys, re, threading
 from subprocess import \
      check_output, PIPE, STDOUT, DEVNULL, CalledProcessError, TimeoutExpired
 from os.path import abspath, basename, dirname, exists, join, splitext
 from getopt import getopt, GetoptError
-from os import chdir, environ, getcwd, mkdir, remove, access, W_OK
+from os import environ, getcwd, mkdir, remove, access, W_OK
 from shutil import copyfile, rmtree
 from math import log
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from shlex import quote
+from cds import ClassDataArchive
+from patterns import outputMatch, PatternTooExpensive, MATCH_LIMIT
+from distance import editDistance
 
 SHORT_USAGE = """\
 Usage: python3 tester.py OPTIONS TEST.in ...
@@ -23,7 +29,15 @@ Usage: python3 tester.py OPTIONS TEST.in ...
                       attach a remote debugger
        --tolerance=N  Set the maximum allowed edit distance between program
                       output and expected output to N (default 3).
+       --match-limit=SECS  Give up matching the output of a command
+                      against a <<<* pattern after SECS seconds, reporting
+                      the pattern as too expensive (default 10; 0 for
+                      no limit).
        --verbose      Print extra information about execution.
+       --jobs=N       Run up to N tests concurrently (default 1).  Output
+                      for each test is still reported in order.
+       --cds          Start each JVM from a class data sharing archive of
+                      capers and the JDK classes it uses.
 """
 
 USAGE = SHORT_USAGE + """\
@@ -68,7 +82,12 @@ For each TEST.in, reports at most one error.  Without the --show option,
 simply indicates tests passed and failed.  If N is positive, also prints details
 of the first N failing tests. With --show=all, shows details of all failing
 tests.  With --keep, keeps the directories created for the tests (with names
-TEST.dir).
+TEST.dir).  With --jobs=N, up to N tests run at once, each in its own
+directory; their output is buffered and printed in the order the tests
+were given.  With --cds, each JVM maps in an archive of the classes
+capers loads (built in the directory .cds and rebuilt when the class files
+or the JVM change) instead of loading them afresh; this needs JDK 10 or
+later, and the time saved on each JVM start is reported at the end.
 
 When finished, reports number of tests passed and failed, and the number of
 faulty TEST.in files."""
@@ -77,6 +96,11 @@ TIMEOUT = 10
 
 JAVA_COMMAND = "java -ea"
 GITLET_CLASS = "capers.Main"
+# Where --cds keeps its archive, and the commands used to find the classes
+# to put in it, run in order.
+CDS_DIR = ".cds"
+CDS_TRAINING = [["story", "hello"], ["dog", "fido", "poodle", "3"],
+                ["birthday", "fido"], []]
 JVM_OPTIONS = "-agentlib:jdwp=transport=dt_socket,server=y,suspend=y,address=5005"
 
 DEBUG = False
@@ -90,14 +114,34 @@ def Usage():
     print(SHORT_USAGE, file=sys.stderr)
     sys.exit(1)
 
-Mat = None
+# Per-thread state: the last Match result, and (when running tests in
+# parallel) the buffer that receives a test's output.
+_tls = threading.local()
+
 def Match(patn, s):
-    global Mat
-    Mat = re.match(patn, s)
-    return Mat
+    _tls.mat = re.match(patn, s)
+    return _tls.mat
 
 def Group(n):
-    return Mat.group(n)
+    return _tls.mat.group(n)
+
+class ThreadOutput:
+    """A stand-in for sys.stdout that sends output written by a thread to
+    that thread's buffer, if it has one, and otherwise to STREAM."""
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        buffer = getattr(_tls, 'buffer', None)
+        if buffer is None:
+            return self.stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
 
 def contents(filename):
     try:
@@ -106,16 +150,6 @@ def contents(filename):
     except FileNotFoundError:
         return None
 
-def editDistance(s1, s2):
-    dist = [list(range(len(s2) + 1))] + \
-           [ [i] + [ 0 ] * len(s2) for i in range(1, len(s1) + 1) ]
-    for i in range(1, len(s1) + 1):
-        for j in range(1, len(s2) + 1):
-            dist[i][j] = min(dist[i-1][j] + 1,
-                             dist[i][j-1] + 1,
-                             dist[i-1][j-1] + (s1[i-1] != s2[j-1]))
-    return dist[len(s1)][len(s2)]
-
 def createTempDir(base):
     for n in range(100):
         name = "{}_{}".format(base, n)
@@ -144,10 +178,8 @@ def doCopy(dest, src, dir):
         raise ValueError("file {} could not be copied to {}".format(src, dest))
 
 def doExecute(cmnd, dir, timeout, line_num):
-    here = getcwd()
     out = ""
     try:
-        chdir(dir)
         full_cmnd = "{} {} {}".format(JAVA_COMMAND, GITLET_CLASS, cmnd)
         skip_first_line = False
 
@@ -163,19 +195,18 @@ def doExecute(cmnd, dir, timeout, line_num):
                 full_cmnd = "{} {} {} {}".format(JAVA_COMMAND, JVM_OPTIONS, GITLET_CLASS, cmnd)
                 timeout, skip_first_line = None, True
 
-        out = doCommand(full_cmnd, timeout, skip_first_line)
+        out = doCommand(full_cmnd, dir, timeout, skip_first_line)
         return "OK", out
     except CalledProcessError as excp:
         return ("java capers.Main exited with code {}".format(excp.args[0]),
                 excp.output)
     except TimeoutExpired:
         return "timeout", None
-    finally:
-        chdir(here)
 
-def doCommand(full_cmnd, timeout, skip_first_line=False):
+def doCommand(full_cmnd, dir, timeout, skip_first_line=False):
     out = check_output(full_cmnd, shell=True, universal_newlines=True,
-                        stdin=DEVNULL, stderr=STDOUT, timeout=timeout)
+                        stdin=DEVNULL, stderr=STDOUT, timeout=timeout,
+                        cwd=dir)
     if skip_first_line:
         out = out.split("\n", 1)[1]
 
@@ -203,17 +234,26 @@ def correctProgramOutput(expected, actual, last_groups, is_regexp):
     last_groups[:] = (actual,)
     if is_regexp:
         try:
-            if not Match(expected.rstrip() + r"\Z", actual) \
-                   and not Match(expected.rstrip() + r"\Z", actual.rstrip()):
-                return False
-        except:
+            groups = outputMatch(expected.rstrip(), actual, match_limit)
+        except PatternTooExpensive:
+            raise ValueError("pattern too expensive (over {:g} s)"
+                             .format(match_limit))
+        except re.error:
             raise ValueError("bad pattern")
-        last_groups[:] += Mat.groups()
-    elif editDistance(expected.rstrip(), actual.rstrip()) > output_tolerance:
+        if groups is None:
+            return False
+        last_groups[:] += groups
+    elif editDistance(expected.rstrip(), actual.rstrip(),
+                      output_tolerance) > output_tolerance:
         return False
     return True
 
 def reportDetails(test, included_files, line_num):
+    if getattr(_tls, 'buffer', None) is not None:
+        # Running in a worker: leave the decision to the main thread, which
+        # sees the tests' results in order.
+        _tls.details = (test, included_files, line_num)
+        return
     if show is None:
         return
     if show <= 0:
@@ -375,6 +415,69 @@ def doTest(test):
         if not keep:
             cleanTempDir(tmpdir)
 
+def runTest(test):
+    """Run TEST, returning "missing" if it does not exist, "passed" or
+    "error" according to its outcome, and "failed" if TEST itself is
+    faulty."""
+    try:
+        if not exists(test):
+            return "missing"
+        elif not doTest(test):
+            return "error"
+        return "passed"
+    except ValueError as excp:
+        print("FAILED ({})".format(excp.args[0]))
+        return "failed"
+
+def runBuffered(test):
+    """Run TEST in a worker thread, returning its result, its output, and
+    the arguments to reportDetails if it requested error details."""
+    _tls.buffer = StringIO()
+    _tls.details = None
+    try:
+        result = runTest(test)
+        return result, _tls.buffer.getvalue(), _tls.details
+    finally:
+        _tls.buffer = None
+
+def runTests(files, jobs):
+    """Run the tests in FILES using up to JOBS concurrent workers, printing
+    each test's output in order.  Returns the number of tests run, the
+    number with errors, and the number of faulty tests."""
+    global show
+    num_tests = len(files)
+    errs = 0
+    fails = 0
+
+    if jobs <= 1:
+        results = (runTest(test) for test in files)
+    else:
+        sys.stdout = ThreadOutput(sys.stdout)
+        pool = ThreadPoolExecutor(max_workers=jobs)
+        results = (future.result() for future in
+                   [pool.submit(runBuffered, test) for test in files])
+
+    try:
+        for result in results:
+            if jobs > 1:
+                result, text, details = result
+                sys.stdout.write(text)
+                if details:
+                    reportDetails(*details)
+            if result == "missing":
+                num_tests -= 1
+            elif result == "error":
+                errs += 1
+                if type(show) is int:
+                    show -= 1
+            elif result == "failed":
+                fails += 1
+    finally:
+        if jobs > 1:
+            pool.shutdown(cancel_futures=True)
+            sys.stdout = sys.stdout.stream
+    return num_tests, errs, fails
+
 if __name__ == "__main__":
     show = None
     keep = False
@@ -382,12 +485,15 @@ if __name__ == "__main__":
     verbose = False
     src_dir = 'src'
     output_tolerance = 0
+    match_limit = MATCH_LIMIT
+    jobs = 1
+    cds = False
 
     try:
         opts, files = \
             getopt(sys.argv[1:], '',
                    ['show=', 'keep', 'progdir=', 'verbose', 'src=',
-                    'tolerance=', 'debug'])
+                    'tolerance=', 'match-limit=', 'debug', 'jobs=', 'cds'])
         for opt, val in opts:
             if opt == '--show':
                 val = val.lower()
@@ -407,8 +513,14 @@ if __name__ == "__main__":
                 verbose = True
             elif opt == "--tolerance":
                 output_tolerance = int(val)
+            elif opt == "--match-limit":
+                match_limit = float(val)
             elif opt == "--debug":
                 DEBUG = True
+            elif opt == "--jobs":
+                jobs = int(val)
+            elif opt == "--cds":
+                cds = True
         if prog_dir is None:
             prog_dir = abspath(getcwd())
             k = 10
@@ -439,23 +551,25 @@ if __name__ == "__main__":
             environ['CLASSPATH'] = "{}".format(prog_dir)
         JAVA_COMMAND = 'exec ' + JAVA_COMMAND
 
-    num_tests = len(files)
-    errs = 0
-    fails = 0
+    if DEBUG:
+        jobs = 1
 
-    for test in files:
-        try:
-            if not exists(test):
-                num_tests -= 1
-            elif not doTest(test):
-                errs += 1
-                if type(show) is int:
-                    show -= 1
-        except ValueError as excp:
-            print("FAILED ({})".format(excp.args[0]))
-            fails += 1
+    cds_archive = None
+    if cds and not DEBUG:
+        cds_archive = ClassDataArchive(JAVA_COMMAND, GITLET_CLASS, prog_dir,
+                                       CDS_DIR, CDS_TRAINING)
+        if cds_archive.enabled:
+            cds_archive.measure()
+            environ['CLASSPATH'] = cds_archive.classpath(cds_archive.jar)
+            JAVA_COMMAND = " ".join([JAVA_COMMAND] +
+                                    [quote(opt) for opt in cds_archive.options])
+
+    num_tests, errs, fails = runTests(files, jobs)
 
     print()
+    if cds_archive and cds_archive.saving is not None:
+        print("Class data sharing saved about {:.0f} ms per JVM start."
+              .format(1000 * cds_archive.saving))
     print("Ran {} tests. ".format(num_tests), end="")
     if errs == fails == 0:
         print("All passed.")
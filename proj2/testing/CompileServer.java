@@ -0,0 +1,144 @@
+import java.io.BufferedInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+import java.net.SocketTimeoutException;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.nio.file.StandardCopyOption;
+import java.nio.file.attribute.PosixFilePermissions;
+import java.security.SecureRandom;
+import javax.tools.JavaCompiler;
+import javax.tools.ToolProvider;
+
+/** A Java compiler that stays up between runs of runner.py (see
+ *  javacache.py), so that javac's classes are loaded and compiled by the
+ *  JIT only once.
+ *
+ *  Usage: java CompileServer PORTFILE IDLE
+ *
+ *  Listens on a local port and writes the port number and a random token
+ *  to PORTFILE (readable only by its owner).  Each connection carries one
+ *  request: a line "COMPILE TOKEN N" followed by N fields, each a line
+ *  containing a byte count followed by that many bytes of UTF-8 text,
+ *  which are the arguments to javac (with absolute paths, since the
+ *  server's working directory is its own).  The reply is a line "STATUS
+ *  COUNT" followed by COUNT bytes of javac's output.  Requests with the
+ *  wrong token are dropped.  The server deletes PORTFILE and exits after
+ *  IDLE seconds without a request.
+ */
+public class CompileServer {
+
+    /** Serve compilation requests as described above. */
+    public static void main(String[] args) throws IOException {
+        Path portFile = Paths.get(args[0]);
+        int idle = Integer.parseInt(args[1]);
+        JavaCompiler javac = ToolProvider.getSystemJavaCompiler();
+        if (javac == null) {
+            System.err.println("CompileServer: no system Java compiler");
+            System.exit(1);
+        }
+        byte[] random = new byte[16];
+        new SecureRandom().nextBytes(random);
+        StringBuilder token = new StringBuilder();
+        for (byte b : random) {
+            token.append(String.format("%02x", b));
+        }
+
+        try (ServerSocket server =
+             new ServerSocket(0, 0, InetAddress.getLoopbackAddress())) {
+            writePortFile(portFile, server.getLocalPort() + " " + token);
+            server.setSoTimeout(idle * 1000);
+            while (true) {
+                try (Socket conn = server.accept()) {
+                    serve(javac, token.toString(), conn);
+                } catch (SocketTimeoutException excp) {
+                    break;
+                } catch (IOException | RuntimeException excp) {
+                    continue;
+                }
+            }
+        } finally {
+            Files.deleteIfExists(portFile);
+        }
+    }
+
+    /** Write CONTENTS to PORTFILE, readable only by this user, replacing
+     *  it all at once. */
+    static void writePortFile(Path portFile, String contents)
+        throws IOException {
+        Path temp = portFile.resolveSibling(portFile.getFileName() + ".tmp");
+        Files.deleteIfExists(temp);
+        try {
+            Files.createFile(temp, PosixFilePermissions.asFileAttribute(
+                                 PosixFilePermissions.fromString("rw-------")));
+        } catch (UnsupportedOperationException excp) {
+            Files.createFile(temp);
+        }
+        Files.write(temp, contents.getBytes(StandardCharsets.UTF_8));
+        Files.move(temp, portFile, StandardCopyOption.REPLACE_EXISTING,
+                   StandardCopyOption.ATOMIC_MOVE);
+    }
+
+    /** Run the request on CONN, if it carries TOKEN, with JAVAC. */
+    static void serve(JavaCompiler javac, String token, Socket conn)
+        throws IOException {
+        InputStream inp = new BufferedInputStream(conn.getInputStream());
+        String[] header = readLine(inp).split(" ");
+        if (header.length != 3 || !header[0].equals("COMPILE")
+            || !header[1].equals(token)) {
+            return;
+        }
+        int n = Integer.parseInt(header[2]);
+        String[] javacArgs = new String[n];
+        for (int i = 0; i < n; i += 1) {
+            int len = Integer.parseInt(readLine(inp).trim());
+            javacArgs[i] = new String(readBytes(inp, len),
+                                      StandardCharsets.UTF_8);
+        }
+
+        ByteArrayOutputStream captured = new ByteArrayOutputStream();
+        PrintStream out = new PrintStream(captured, true, "UTF-8");
+        int status = javac.run(null, out, out, javacArgs);
+        out.flush();
+        OutputStream reply = conn.getOutputStream();
+        reply.write((status + " " + captured.size() + "\n")
+                    .getBytes(StandardCharsets.UTF_8));
+        captured.writeTo(reply);
+        reply.flush();
+    }
+
+    /** Returns the next line of INP, without its terminator. */
+    static String readLine(InputStream inp) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int c;
+        while ((c = inp.read()) != '\n') {
+            if (c == -1) {
+                throw new IOException("truncated request");
+            }
+            line.write(c);
+        }
+        return line.toString("UTF-8");
+    }
+
+    /** Returns the next LEN bytes of INP. */
+    static byte[] readBytes(InputStream inp, int len) throws IOException {
+        byte[] result = new byte[len];
+        int k = 0;
+        while (k < len) {
+            int n = inp.read(result, k, len - k);
+            if (n < 0) {
+                throw new IOException("truncated request");
+            }
+            k += n;
+        }
+        return result;
+    }
+}
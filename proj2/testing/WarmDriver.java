@@ -0,0 +1,216 @@
+import java.io.BufferedInputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.File;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.MalformedURLException;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+import java.util.ArrayList;
+
+/** A long-lived JVM used by tester.py and runner.py to run a program's
+ *  main class many times without paying JVM startup for each run.
+ *
+ *  Usage: java -Djava.security.manager=allow WarmDriver MAINCLASS
+ *
+ *  After starting, prints READY (or NOEXIT, if it cannot intercept
+ *  System.exit, after which it quits).  Then repeatedly reads a request
+ *  from the standard input, consisting of a line "RUN N" followed by N
+ *  fields, each a line containing a byte count followed by that many bytes
+ *  of UTF-8 text.  The first field is the working directory, and the rest
+ *  are the arguments to MAINCLASS.main.  Each request runs in a fresh class
+ *  loader, so that static fields are initialized anew, with user.dir set to
+ *  the working directory, the standard input empty, and the standard output
+ *  and error captured.  The reply is a line "STATUS COUNT" followed by
+ *  COUNT bytes of captured output, where STATUS is the argument to
+ *  System.exit, 0 if main returns normally, or 1 if it throws.
+ *
+ *  The working directory must be the one the JVM was started in: since
+ *  JDK 11, java.io.File and java.nio.file resolve relative paths against
+ *  the JVM's initial directory whatever user.dir is set to, and a JVM
+ *  cannot change its directory.  A request for any other directory is
+ *  not run; its reply is the line "WRONGDIR".
+ */
+public class WarmDriver {
+
+    /** Thrown in place of exiting the JVM. */
+    static class ExitTrap extends SecurityException {
+        ExitTrap(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+
+        /** The status passed to System.exit. */
+        final int status;
+    }
+
+    /** Turns System.exit into an ExitTrap and allows everything else. */
+    static class ExitGuard extends SecurityManager {
+        @Override
+        public void checkExit(int status) {
+            if (Thread.currentThread() == runner) {
+                exitStatus = status;
+                throw new ExitTrap(status);
+            }
+        }
+
+        @Override
+        public void checkPermission(Permission perm) {
+        }
+
+        @Override
+        public void checkPermission(Permission perm, Object context) {
+        }
+
+        /** The thread running the current request. */
+        volatile Thread runner;
+        /** The status of the last trapped System.exit, or null. */
+        volatile Integer exitStatus;
+    }
+
+    /** Run MAINCLASS (ARGS[0]) once per request, as described above. */
+    public static void main(String[] args) throws IOException {
+        PrintStream reply = new PrintStream(System.out, false, "UTF-8");
+        InputStream requests = new BufferedInputStream(System.in);
+        ExitGuard guard = new ExitGuard();
+        try {
+            System.setSecurityManager(guard);
+        } catch (UnsupportedOperationException | SecurityException excp) {
+            reply.print("NOEXIT\n");
+            reply.flush();
+            return;
+        }
+        reply.print("READY\n");
+        reply.flush();
+
+        URL[] classPath = classPathURLs();
+        File home = new File(System.getProperty("user.dir"))
+            .getCanonicalFile();
+        while (true) {
+            String header = readLine(requests);
+            if (header == null || !header.startsWith("RUN ")) {
+                break;
+            }
+            int n = Integer.parseInt(header.substring(4).trim());
+            String[] fields = new String[n];
+            for (int i = 0; i < n; i += 1) {
+                int len = Integer.parseInt(readLine(requests).trim());
+                fields[i] = new String(readBytes(requests, len),
+                                       StandardCharsets.UTF_8);
+            }
+            if (!new File(fields[0]).getCanonicalFile().equals(home)) {
+                reply.print("WRONGDIR\n");
+                reply.flush();
+                continue;
+            }
+            String[] mainArgs = new String[n - 1];
+            System.arraycopy(fields, 1, mainArgs, 0, n - 1);
+
+            ByteArrayOutputStream captured = new ByteArrayOutputStream();
+            int status = runOnce(args[0], classPath, fields[0], mainArgs,
+                                 guard, captured);
+            reply.print(status + " " + captured.size() + "\n");
+            reply.write(captured.toByteArray());
+            reply.flush();
+        }
+        guard.runner = null;
+        System.setSecurityManager(null);
+    }
+
+    /** Run MAINCLASS.main(ARGS) with class path CLASSPATH in directory DIR,
+     *  capturing its output in CAPTURED and using GUARD to trap exits.
+     *  Returns its exit status. */
+    static int runOnce(String mainClass, URL[] classPath, String dir,
+                       String[] args, ExitGuard guard,
+                       ByteArrayOutputStream captured) {
+        PrintStream out = new PrintStream(captured, true);
+        PrintStream savedOut = System.out, savedErr = System.err;
+        InputStream savedIn = System.in;
+        String savedDir = System.getProperty("user.dir");
+        ClassLoader savedLoader =
+            Thread.currentThread().getContextClassLoader();
+        int status = 0;
+        try (URLClassLoader loader =
+             new URLClassLoader(classPath,
+                                ClassLoader.getPlatformClassLoader())) {
+            System.setOut(out);
+            System.setErr(out);
+            System.setIn(new ByteArrayInputStream(new byte[0]));
+            System.setProperty("user.dir", new File(dir).getAbsolutePath());
+            Thread.currentThread().setContextClassLoader(loader);
+            guard.exitStatus = null;
+            guard.runner = Thread.currentThread();
+            Method main =
+                loader.loadClass(mainClass).getMethod("main", String[].class);
+            main.invoke(null, (Object) args);
+        } catch (InvocationTargetException excp) {
+            if (guard.exitStatus == null) {
+                out.print("Exception in thread \"main\" ");
+                excp.getCause().printStackTrace(out);
+                status = 1;
+            }
+        } catch (ReflectiveOperationException | IOException excp) {
+            out.println("Error: could not run " + mainClass + ": " + excp);
+            status = 1;
+        } finally {
+            guard.runner = null;
+            out.flush();
+            System.setOut(savedOut);
+            System.setErr(savedErr);
+            System.setIn(savedIn);
+            System.setProperty("user.dir", savedDir);
+            Thread.currentThread().setContextClassLoader(savedLoader);
+        }
+        if (guard.exitStatus != null) {
+            status = guard.exitStatus;
+        }
+        return status;
+    }
+
+    /** Returns the entries of this JVM's class path as URLs. */
+    static URL[] classPathURLs() throws MalformedURLException {
+        ArrayList<URL> urls = new ArrayList<>();
+        for (String entry
+                 : System.getProperty("java.class.path")
+                   .split(File.pathSeparator)) {
+            if (!entry.isEmpty()) {
+                urls.add(new File(entry).toURI().toURL());
+            }
+        }
+        return urls.toArray(new URL[0]);
+    }
+
+    /** Returns the next line of INP, without its terminator, or null at
+     *  end of input. */
+    static String readLine(InputStream inp) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int c;
+        while ((c = inp.read()) != '\n') {
+            if (c == -1) {
+                return line.size() == 0 ? null : line.toString("UTF-8");
+            }
+            line.write(c);
+        }
+        return line.toString("UTF-8");
+    }
+
+    /** Returns the next LEN bytes of INP. */
+    static byte[] readBytes(InputStream inp, int len) throws IOException {
+        byte[] result = new byte[len];
+        int k = 0;
+        while (k < len) {
+            int n = inp.read(result, k, len - k);
+            if (n < 0) {
+                throw new IOException("truncated request");
+            }
+            k += n;
+        }
+        return result;
+    }
+}
@@ -0,0 +1,125 @@
+"""Checks that tester.py reruns only the tests that failed or whose
+fingerprints (see ResultCache) changed since they last passed, and that
+it compiles a test again only when it or a file it includes changes.
+
+Usage: python3 cache_test.py"""
+
+import unittest
+from os import listdir, makedirs, stat
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from directives_test import makeTests, runTester, outcomes, generateFile
+
+CASES = {
+    "copy": "+ f.txt f\n= f.txt f\n",
+    "other": "+ g.txt g\n= g.txt g\n",
+    "echo": "> echo hello\nhello\n<<<\n",
+    "wrong": "> echo hello\ngoodbye\n<<<\n",
+}
+FILES = { "f": (100, "1"), "g": (100, "2") }
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp(prefix="cache")
+        self.names = makeTests(self.dir, CASES, FILES)
+
+    def tearDown(self):
+        rmtree(self.dir, ignore_errors=True)
+
+    def results(self, *options):
+        """The result of each test on a run with the result cache and
+        OPTIONS."""
+        report = runTester(self.dir, self.names,
+                           ["--cachedir=" + join(self.dir, "cache")]
+                           + list(options))
+        return { name: result for name, (result, message)
+                 in outcomes(report, self.names).items() }
+
+    def assertResults(self, expected, *options):
+        self.assertEqual(self.results(*options), expected)
+
+    def testUnchanged(self):
+        self.assertResults({ "copy": "passed", "other": "passed",
+                             "echo": "passed", "wrong": "error" })
+        self.assertResults({ "copy": "unchanged", "other": "unchanged",
+                             "echo": "unchanged", "wrong": "error" })
+
+    def testNoCache(self):
+        self.results()
+        self.assertResults({ "copy": "passed", "other": "passed",
+                             "echo": "passed", "wrong": "error" },
+                           "--no-cache")
+
+    def testChangedFixture(self):
+        self.results()
+        generateFile(join(self.dir, "src", "g"), 100, "3")
+        self.assertResults({ "copy": "unchanged", "other": "passed",
+                             "echo": "unchanged", "wrong": "error" })
+
+    def testChangedTest(self):
+        self.results()
+        with open(join(self.dir, "echo.in"), 'a') as out:
+            out.write("# changed\n")
+        self.assertResults({ "copy": "unchanged", "other": "unchanged",
+                             "echo": "passed", "wrong": "error" })
+
+    def testChangedClasses(self):
+        self.results()
+        makedirs(join(self.dir, "gitlet"))
+        with open(join(self.dir, "gitlet", "Main.class"), 'wb') as out:
+            out.write(b"\xca\xfe\xba\xbe")
+        self.assertResults({ "copy": "passed", "other": "passed",
+                             "echo": "passed", "wrong": "error" })
+
+    def testChangedSettings(self):
+        self.results()
+        self.assertResults({ "copy": "passed", "other": "passed",
+                             "echo": "passed", "wrong": "error" },
+                           "--tolerance=0")
+        self.assertResults({ "copy": "unchanged", "other": "unchanged",
+                             "echo": "unchanged", "wrong": "error" },
+                           "--tolerance=0")
+
+class CompiledTestCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp(prefix="cache")
+        self.names = makeTests(self.dir, {
+            "seeded": "I seed.inc\nG f.txt 100 ${SEED}\n= f.txt s1\n" },
+            { "s1": (100, "s1") })
+        self.compiled = join(self.dir, "cache", "compiled")
+
+    def tearDown(self):
+        rmtree(self.dir, ignore_errors=True)
+
+    def result(self, seed):
+        """The result of the test, run with the compiled test cache, with
+        SEED.inc defining SEED as SEED."""
+        with open(join(self.dir, "seed.inc"), 'w') as out:
+            out.write('D SEED "{}"\n'.format(seed))
+        report = runTester(self.dir, self.names,
+                           ["--cachedir=" + join(self.dir, "cache"),
+                            "--no-cache"])
+        return outcomes(report, self.names)["seeded"][0]
+
+    def snapshot(self):
+        """The names and modification times of the compiled tests."""
+        return { name: stat(join(self.compiled, name)).st_mtime_ns
+                 for name in listdir(self.compiled) }
+
+    def testReused(self):
+        self.assertEqual(self.result("s1"), "passed")
+        compiled = self.snapshot()
+        self.assertEqual(len(compiled), 1)
+        self.assertEqual(self.result("s1"), "passed")
+        self.assertEqual(self.snapshot(), compiled)
+
+    def testIncludeChanged(self):
+        self.assertEqual(self.result("s1"), "passed")
+        self.assertEqual(self.result("s2"), "error")
+        self.assertEqual(self.result("s1"), "passed")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+"""Support for Class Data Sharing (CDS) archives, used by the testers with
+--cds to shorten the startup of each JVM that runs the program under test.
+
+The JVM archives only classes that come from JAR files, so a
+ClassDataArchive first packs the program's class files into a JAR.  It
+then runs the program on a few training commands with
+-XX:DumpLoadedClassList to learn which of its own and the JDK's classes
+it loads, and dumps those classes into an archive with -Xshare:dump.  Both
+files are named by a digest of the class files and of the JVM's version,
+so an archive is built once per compiled program and rebuilt (deleting
+the stale one) whenever the class files or the JVM change.
+
+A JVM uses the archive only if the JAR comes first on its class path, and
+the JVM quietly ignores an archive that does not fit (so a bad archive
+costs time, not correctness).  If anything goes wrong, the archive is
+disabled with a warning and the tester runs as it would without --cds."""
+
+import shlex, sys, hashlib, atexit
+from subprocess import run, PIPE, STDOUT, DEVNULL
+from os import environ, pathsep, listdir, makedirs, remove, replace, sep
+from os.path import abspath, exists, join, relpath
+from glob import glob
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+from zipfile import ZipFile, ZIP_STORED
+
+# Options that make a JVM use an archive without complaining when it
+# cannot.
+SHARING_OPTIONS = ["-Xshare:auto", "-Xlog:cds*=off,class+path*=off"]
+
+class ClassDataArchive:
+    """A CDS archive for MAIN_CLASS, whose class files are under PROG_DIR,
+    run with JAVA_COMMAND (e.g., "exec java -ea").  The archive is kept in
+    ARCHIVE_DIR (a temporary directory if None).  TRAINING is a list of
+    argument lists for MAIN_CLASS, run in order in a directory containing
+    the files in the dictionary FILES (names to contents) to find the
+    classes worth archiving.  If ENABLED, JAR is the JAR that must begin
+    the class path, OPTIONS is the list of JVM options that use the
+    archive, and SAVING is the measured startup time it saves, in seconds
+    (None if not measured)."""
+
+    def __init__(self, java_command, main_class, prog_dir, archive_dir,
+                 training, files=None):
+        self.java = shlex.split(java_command)
+        if self.java and self.java[0] == "exec":
+            self.java = self.java[1:]
+        self.main_class = main_class
+        self.enabled = False
+        self.jar = self.archive = None
+        self.options = []
+        self.saving = None
+        if archive_dir is None:
+            archive_dir = mkdtemp(prefix="cds")
+            atexit.register(rmtree, archive_dir, ignore_errors=True)
+        archive_dir = abspath(archive_dir)
+        package = main_class.rsplit(".", 1)[0].replace(".", sep)
+        class_files = sorted(glob(join(prog_dir, package, "**", "*.class"),
+                                  recursive=True))
+        if not class_files:
+            self.disable("no class files for {}".format(main_class))
+            return
+        try:
+            makedirs(archive_dir, exist_ok=True)
+            key = self.key(class_files)
+            if key is None:
+                return
+            jar = join(archive_dir, key + ".jar")
+            archive = join(archive_dir, key + ".jsa")
+            if not (exists(jar) and exists(archive)):
+                work = mkdtemp(prefix="build", dir=archive_dir)
+                try:
+                    if not self.build(prog_dir, class_files, jar, archive,
+                                      work, training, files):
+                        if exists(jar):
+                            remove(jar)
+                        return
+                finally:
+                    rmtree(work, ignore_errors=True)
+            for name in listdir(archive_dir):
+                if name.endswith((".jar", ".jsa")) \
+                   and not name.startswith(key):
+                    remove(join(archive_dir, name))
+        except OSError as excp:
+            self.disable(excp)
+            return
+        self.jar, self.archive = jar, archive
+        self.options = ["-XX:SharedArchiveFile=" + archive] + SHARING_OPTIONS
+        self.enabled = True
+
+    def disable(self, why):
+        self.enabled = False
+        print("Warning: --cds disabled ({}).".format(why),
+              file=sys.__stderr__)
+
+    def key(self, class_files):
+        """Returns the digest naming the archive for CLASS_FILES and this
+        JVM, or None (after disabling) if the JVM will not run."""
+        try:
+            version = run(self.java + ["-version"], stdin=DEVNULL,
+                          stdout=PIPE, stderr=STDOUT).stdout
+        except OSError as excp:
+            self.disable(excp)
+            return None
+        digest = hashlib.sha1(repr((self.java, self.main_class)).encode()
+                              + version)
+        for name in class_files:
+            with open(name, 'rb') as inp:
+                digest.update(name.encode() + inp.read())
+        return digest.hexdigest()
+
+    def classpath(self, jar):
+        """Returns the class path for a JVM using JAR's archive."""
+        if environ.get('CLASSPATH'):
+            return jar + pathsep + environ['CLASSPATH']
+        return jar
+
+    def build(self, prog_dir, class_files, jar, archive, work, training,
+              files):
+        """Write CLASS_FILES (under PROG_DIR) to JAR and the classes loaded
+        when running TRAINING (with FILES) to ARCHIVE, working in the
+        directory WORK.  Returns true iff successful."""
+        with ZipFile(join(work, "classes.jar"), 'w', ZIP_STORED) as out:
+            for name in class_files:
+                out.write(name, relpath(name, prog_dir))
+        replace(join(work, "classes.jar"), jar)
+
+        rundir = join(work, "run")
+        makedirs(rundir)
+        for name, contents in (files or {}).items():
+            with open(join(rundir, name), 'w') as out:
+                out.write(contents)
+        classes = {}
+        for k, args in enumerate(training):
+            classlist = join(work, "classlist{}".format(k))
+            run(self.java + ["-XX:DumpLoadedClassList=" + classlist,
+                             "-cp", self.classpath(jar), self.main_class]
+                + args, cwd=rundir, stdin=DEVNULL, stdout=DEVNULL,
+                stderr=DEVNULL)
+            if exists(classlist):
+                with open(classlist) as inp:
+                    for line in inp:
+                        # Class ids are local to each list; without
+                        # them, classes are found by name on the class path.
+                        line = line.split(" id:")[0].strip()
+                        if line and line[0] not in "#@" \
+                           and " " not in line:
+                            classes[line] = None
+        if not classes:
+            self.disable("JVM does not support -XX:DumpLoadedClassList")
+            return False
+        with open(join(work, "classlist"), 'w') as out:
+            out.write("\n".join(classes) + "\n")
+
+        built = join(work, "classes.jsa")
+        dump = run(self.java + ["-Xshare:dump",
+                                "-XX:SharedClassListFile="
+                                + join(work, "classlist"),
+                                "-XX:SharedArchiveFile=" + built,
+                                "-cp", jar],
+                   cwd=work, stdin=DEVNULL, stdout=PIPE, stderr=STDOUT)
+        check = run(self.java + ["-Xshare:on",
+                                 "-XX:SharedArchiveFile=" + built,
+                                 "-cp", self.classpath(jar), "-version"],
+                    cwd=work, stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL)
+        if dump.returncode != 0 or check.returncode != 0:
+            self.disable("could not dump archive: {}"
+                         .format(dump.stdout.decode(errors="replace")
+                                 .strip().split("\n")[-1]))
+            return False
+        replace(built, archive)
+        return True
+
+    def measure(self, samples=5):
+        """Set SAVING to the difference between the median times, over
+        SAMPLES runs each, of starting MAIN_CLASS (with no arguments)
+        without and with the archive."""
+        if not self.enabled:
+            return
+        work = mkdtemp(prefix="cds")
+        try:
+            def median(options):
+                times = []
+                for _ in range(samples):
+                    start = perf_counter()
+                    run(self.java + options
+                        + ["-cp", self.classpath(self.jar), self.main_class],
+                        cwd=work, stdin=DEVNULL, stdout=DEVNULL,
+                        stderr=DEVNULL)
+                    times.append(perf_counter() - start)
+                return sorted(times)[samples // 2]
+            self.saving = median([]) - median(self.options)
+        except OSError:
+            pass
+        finally:
+            rmtree(work, ignore_errors=True)
@@ -0,0 +1,206 @@
+"""Checks tester.py's R (repeat), G (generate), and H (tree digest)
+instructions by running small tests that use no gitlet commands, so that
+no gitlet is needed.
+
+Usage: python3 directives_test.py
+
+Each case is a test's text and the result tester.py should report for it
+("passed", "error" if the test fails, or "failed" if it is faulty).  The
+reference files the tests compare against (with =) are written here with
+tester.generateFile, so that the cases also check that G's output depends
+only on its seed.  So are the trees whose digests (from treedigest.py)
+the H cases expect.
+
+The other *_test.py modules that run tester.py on tests of their own use
+makeTests, runTester, and outcomes from here; their tests' gitlet
+commands are run by FAKE_JAVA."""
+
+import sys, json, unittest
+from subprocess import run, DEVNULL
+from os import chmod, environ, makedirs, pathsep
+from os.path import abspath, dirname, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from treedigest import treeDigest
+
+TESTER = join(dirname(abspath(__file__)), "tester.py")
+
+def loadTester():
+    """The tester module, imported as it is when run."""
+    saved = sys.argv
+    sys.argv = [TESTER]
+    try:
+        import tester
+    finally:
+        sys.argv = saved
+    return tester
+
+generateFile = loadTester().generateFile
+
+# A stand-in for java running gitlet.Main, for tests of the tester itself.
+# "echo WORDS" prints WORDS, "cat FILE" prints FILE, "touch N" creates N
+# files, "sleep SECS" sleeps, "spin" runs until killed, and "exit N" exits
+# with code N.
+FAKE_JAVA = """\
+#!{}
+import sys, time
+args = sys.argv[sys.argv.index("gitlet.Main") + 1:]
+if args[0] == "echo":
+    print(" ".join(args[1:]))
+elif args[0] == "cat":
+    print(open(args[1]).read(), end="")
+elif args[0] == "touch":
+    for k in range(int(args[1])):
+        open("t{{}}".format(k), "w").close()
+elif args[0] == "sleep":
+    time.sleep(float(args[1]))
+elif args[0] == "spin":
+    while True:
+        pass
+elif args[0] == "exit":
+    sys.exit(int(args[1]))
+"""
+
+def makeTests(dir, cases, files=()):
+    """Write the tests CASES, a dictionary of test names and texts, to
+    NAME.in in DIR, with a src directory containing FILES, a dictionary of
+    names and (SIZE, SEED) arguments to generateFile, and a bin directory
+    containing FAKE_JAVA as java.  Returns a dictionary of the tests' file
+    names and names."""
+    makedirs(join(dir, "src"), exist_ok=True)
+    makedirs(join(dir, "bin"), exist_ok=True)
+    for name, (size, seed) in dict(files).items():
+        generateFile(join(dir, "src", name), size, seed)
+    with open(join(dir, "bin", "java"), 'w') as out:
+        out.write(FAKE_JAVA.format(sys.executable))
+    chmod(join(dir, "bin", "java"), 0o755)
+    names = {}
+    for name, text in cases.items():
+        names[join(dir, name + ".in")] = name
+        with open(join(dir, name + ".in"), 'w') as out:
+            out.write(text)
+    return names
+
+def runTester(dir, tests, options=(), report="report"):
+    """Run tester.py with OPTIONS on the TESTS in DIR, as made by
+    makeTests, with FAKE_JAVA as java.  Returns the report that tester.py
+    writes for --report=DIR/REPORT."""
+    report = join(dir, report)
+    run([sys.executable, TESTER, "--workdir=" + dir,
+         "--src=" + join(dir, "src"), "--report=" + report,
+         "--progdir=" + dir] + list(options) + list(tests),
+        stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL,
+        env=dict(environ, PATH=join(dir, "bin") + pathsep
+                 + environ.get("PATH", "")))
+    with open(report + ".json") as inp:
+        return json.load(inp)
+
+def outcomes(report, names):
+    """A dictionary of the name (from NAMES, as returned by makeTests),
+    result ("passed", "error", "failed", "unchanged", or "skipped"), and
+    message of each test in REPORT."""
+    return { names[info["file"]]: (info["result"], info["message"])
+             for info in report["tests"] }
+
+def runTests(cases, files=(), options=()):
+    """Run the tests CASES, a dictionary of test names and texts, with
+    tester.py, with a src directory containing FILES, as for makeTests,
+    and with OPTIONS, without caching.  Returns a dictionary of the name,
+    result ("passed", "error", or "failed"), and message of each test."""
+    dir = mkdtemp(prefix="directives")
+    try:
+        names = makeTests(dir, cases, files)
+        return outcomes(runTester(dir, names, ["--cachedir=", "--no-cache"]
+                                  + list(options)), names)
+    finally:
+        rmtree(dir, ignore_errors=True)
+
+def generatedDigest(files):
+    """The tree digest of a directory containing FILES, a dictionary of
+    names and (SIZE, SEED) arguments to generateFile."""
+    dir = mkdtemp(prefix="directives")
+    try:
+        for name, (size, seed) in files.items():
+            generateFile(join(dir, name), size, seed)
+        return treeDigest(dir)
+    finally:
+        rmtree(dir, ignore_errors=True)
+
+class DirectivesTest(unittest.TestCase):
+
+    def assertOutcomes(self, cases, files=()):
+        """Check that each test in CASES, a dictionary of test names and
+        (TEXT, RESULT), has the result RESULT, with FILES as for
+        runTests."""
+        results = runTests({ name: text
+                             for name, (text, result) in cases.items() },
+                           files)
+        for name, (text, result) in cases.items():
+            with self.subTest(test=name):
+                self.assertEqual(results[name][0], result, results[name][1])
+
+    def testGenerate(self):
+        files = { "g7": (1000, "7"), "g8": (1000, "8"), "big": (70000, "7") }
+        self.assertOutcomes({
+            "same": ("G f.txt 1000 7\n= f.txt g7\n", "passed"),
+            "twice": ("G f.txt 1000 7\nG g.txt 1000 7\n"
+                      "= f.txt g7\n= g.txt g7\n", "passed"),
+            "seed": ("G f.txt 1000 8\n= f.txt g7\n", "error"),
+            "size": ("G f.txt 999 7\n= f.txt g7\n", "error"),
+            "blocks": ("G f.txt 70000 7\n= f.txt big\n", "passed"),
+            "suffix": ("G f.txt 1K 7\n= f.txt g7\n", "error"),
+        }, files)
+
+    def testRepeat(self):
+        files = { "s{}".format(k): (100, "s{}".format(k))
+                  for k in range(1, 4) }
+        self.assertOutcomes({
+            "expanded": ("R I 3\nG f${I}.txt 100 s${I}\nR\n"
+                         "= f1.txt s1\n= f2.txt s2\n= f3.txt s3\n", "passed"),
+            "count": ("R I 3\nG f${I}.txt 100 s${I}\nR\nE f4.txt\n", "error"),
+            "seeds": ("R I 3\nG f${I}.txt 100 s${I}\nR\n= f1.txt s2\n",
+                      "error"),
+            "nested": ("R I 2\nR J 3\nG f${I}${J}.txt 100 s${J}\nR\nR\n"
+                       "= f11.txt s1\n= f23.txt s3\n* f24.txt\n* f31.txt\n",
+                       "passed"),
+            "defined": ('R I 2\nD F "f${I}.txt"\nG ${F} 100 s${I}\nR\n'
+                        "= f2.txt s2\n", "passed"),
+            "zero": ("R I 0\nG f${I}.txt 100 s1\nR\n* f1.txt\n* f0.txt\n",
+                     "passed"),
+            "redefined": ('D F "a"\nR I 2\nG ${F}${I}.txt 100 s${I}\n'
+                          'D F "b"\nR\n= a1.txt s1\n= b2.txt s2\n'
+                          '* a2.txt\n', "passed"),
+            "skipped": ('D F "a"\nR I 0\nD F "b"\nR\nG ${F}.txt 100 s1\n'
+                        '= a.txt s1\n', "passed"),
+            "accumulated": ('D F "f"\nR I 3\nD F "${F}${I}"\nR\n'
+                            'G ${F}.txt 100 s1\n= f123.txt s1\n', "passed"),
+            "unclosed": ("R I 2\nG f${I}.txt 100 s1\n", "failed"),
+        }, files)
+
+    def testTreeDigest(self):
+        both = generatedDigest({ "a.txt": (100, "s1"), "b.txt": (50, "s2") })
+        make = "G a.txt 100 s1\nG b.txt 50 s2\n"
+        self.assertOutcomes({
+            "full": (make + "H {}\n".format(both), "passed"),
+            "prefix": (make + "H {}\n".format(both[:8]), "passed"),
+            "deleted": (make + "- b.txt\nH {}\n".format(both), "error"),
+            "changed": ("G a.txt 100 s1\nG b.txt 50 s3\nH {}\n"
+                        .format(both), "error"),
+            "added": (make + "G c.txt 1 s1\nH {}\n".format(both), "error"),
+            "renamed": ("G a.txt 100 s1\nG c.txt 50 s2\nH {}\n"
+                        .format(both), "error"),
+            "missing": (make + "H {} nodir\n".format(both), "error"),
+            "short": (make + "H {}\n".format(both[:7]), "failed"),
+        })
+
+    def testMismatchReportsDigest(self):
+        both = generatedDigest({ "a.txt": (100, "s1"), "b.txt": (50, "s2") })
+        one = generatedDigest({ "a.txt": (100, "s1") })
+        result, message = runTests({
+            "deleted": "G a.txt 100 s1\nG b.txt 50 s2\n- b.txt\nH {}\n"
+                       .format(both) })["deleted"]
+        self.assertEqual(result, "error")
+        self.assertIn(one, message)
+
+if __name__ == "__main__":
+    unittest.main()
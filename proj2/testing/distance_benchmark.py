@@ -0,0 +1,64 @@
+"""Compares the time taken by distance.editDistance with and without a
+limit on outputs resembling the log of a repository with many commits.
+
+Usage: python3 distance_benchmark.py [COMMITS ...]
+
+For each COMMITS (default 10 25 200 2000), builds a log with that many
+entries and times comparisons against a copy with no changes, with
+TOLERANCE small edits, and with one more edit than TOLERANCE.  The full
+matrix is skipped when it would have more than FULL_LIMIT cells."""
+
+import sys, random
+from time import perf_counter
+from distance import editDistance
+
+TOLERANCE = 3
+FULL_LIMIT = 10**7
+
+def fakeLog(commits):
+    rand = random.Random(commits)
+    entries = []
+    for n in range(commits):
+        entries.append("===\ncommit {:040x}\n"
+                       "Date: Thu Nov 9 20:00:05 2017 -0800\n"
+                       "commit number {}\n"
+                       .format(rand.getrandbits(160), n))
+    return "\n".join(entries)
+
+def mutate(s, edits, seed):
+    rand = random.Random(seed)
+    s = list(s)
+    for _ in range(edits):
+        k = rand.randrange(len(s))
+        s[k] = '#' if s[k] != '#' else '@'
+    return "".join(s)
+
+def timed(func, *args):
+    start = perf_counter()
+    result = func(*args)
+    return result, perf_counter() - start
+
+def main(sizes):
+    print("{:>8} {:>10} {:>6} {:>12} {:>12} {:>9}"
+          .format("commits", "chars", "edits", "full (s)", "banded (s)",
+                  "speedup"))
+    for commits in sizes:
+        expected = fakeLog(commits)
+        for edits in 0, TOLERANCE, TOLERANCE + 1:
+            actual = mutate(expected, edits, commits)
+            banded, banded_time = timed(editDistance, expected, actual,
+                                        TOLERANCE)
+            if len(expected) * len(actual) <= FULL_LIMIT:
+                full, full_time = timed(editDistance, expected, actual)
+                assert min(full, TOLERANCE + 1) == banded
+                full_report = "{:12.4f}".format(full_time)
+                speedup = "{:8.0f}x".format(full_time / max(banded_time,
+                                                             1e-9))
+            else:
+                full_report, speedup = "{:>12}".format("skipped"), ""
+            print("{:8d} {:10d} {:6d} {} {:12.4f} {:>9}"
+                  .format(commits, len(expected), edits, full_report,
+                          banded_time, speedup))
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 25, 200, 2000])
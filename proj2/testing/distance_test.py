@@ -0,0 +1,121 @@
+"""Checks distance.editDistance, with and without a limit, and tester.py's
+OutputCheck, which keeps the same band of distances as output arrives,
+against a plain edit distance computation.
+
+Usage: python3 distance_test.py"""
+
+import unittest, random
+from distance import editDistance, commonPrefixLength, commonSuffixLength, \
+     COMPARE_BLOCK
+from directives_test import loadTester
+
+def plainDistance(s1, s2):
+    """The edit distance between S1 and S2, computed one full row of the
+    matrix at a time."""
+    row = list(range(len(s2) + 1))
+    for i, c in enumerate(s1, 1):
+        prev, row = row, [i]
+        for j, c2 in enumerate(s2, 1):
+            row.append(min(prev[j] + 1, row[j - 1] + 1,
+                           prev[j - 1] + (c != c2)))
+    return row[-1]
+
+def mutated(s, edits, rand):
+    """S with EDITS random insertions, deletions, and replacements from
+    the alphabet "ab", chosen with RAND."""
+    s = list(s)
+    for _ in range(edits):
+        k = rand.randrange(len(s) + 1)
+        kind = rand.randrange(3)
+        if kind == 0 or k == len(s):
+            s.insert(k, rand.choice("ab"))
+        elif kind == 1:
+            del s[k]
+        else:
+            s[k] = rand.choice("ab")
+    return "".join(s)
+
+class EditDistanceTest(unittest.TestCase):
+
+    def testEmpty(self):
+        self.assertEqual(editDistance("", ""), 0)
+        self.assertEqual(editDistance("", "", 0), 0)
+        self.assertEqual(editDistance("", "abc"), 3)
+        self.assertEqual(editDistance("abc", "", 3), 3)
+        self.assertEqual(editDistance("abc", "", 2), 3)
+        self.assertEqual(editDistance("", "a", 0), 1)
+
+    def testWithinLimit(self):
+        self.assertEqual(editDistance("kitten", "sitting", 3), 3)
+        self.assertEqual(editDistance("kitten", "sitting", 5), 3)
+        self.assertEqual(editDistance("abcdef", "abXdef", 1), 1)
+        self.assertEqual(editDistance("abcdef", "abdef", 1), 1)
+
+    def testOverLimit(self):
+        self.assertEqual(editDistance("kitten", "sitting", 2), 3)
+        self.assertEqual(editDistance("kitten", "sitting", 0), 1)
+        self.assertEqual(editDistance("abc", "xyz", 1), 2)
+        self.assertEqual(editDistance("a", "abcdef", 2), 3)
+
+    def testLongPrefixAndSuffix(self):
+        same = "x" * (3 * COMPARE_BLOCK + 17)
+        self.assertEqual(editDistance(same + "ab" + same,
+                                      same + "ba" + same, 1), 2)
+        self.assertEqual(editDistance(same + "ab" + same,
+                                      same + "ba" + same, 2), 2)
+        self.assertEqual(editDistance(same + "a", same + "b", 1), 1)
+        self.assertEqual(editDistance("a" + same, "b" + same, 1), 1)
+        self.assertEqual(editDistance(same, same + "yy", 1), 2)
+        self.assertEqual(editDistance("yy" + same, same, 3), 2)
+
+    def testCommonEnds(self):
+        same = "x" * (COMPARE_BLOCK + 5)
+        self.assertEqual(commonPrefixLength(same + "a", same + "b"),
+                         len(same))
+        self.assertEqual(commonPrefixLength(same, same + "b"), len(same))
+        self.assertEqual(commonPrefixLength("", same), 0)
+        self.assertEqual(commonSuffixLength("a" + same, "b" + same,
+                                            len(same) + 1), len(same))
+        self.assertEqual(commonSuffixLength("a" + same, "b" + same, 10), 10)
+        self.assertEqual(commonSuffixLength(same, same, len(same)),
+                         len(same))
+
+    def testRandom(self):
+        rand = random.Random(61)
+        for n in range(300):
+            s1 = "".join(rand.choice("ab") for _ in range(rand.randrange(30)))
+            s2 = mutated(s1, rand.randrange(6), rand)
+            full = plainDistance(s1, s2)
+            self.assertEqual(editDistance(s1, s2), full)
+            for limit in range(6):
+                with self.subTest(s1=s1, s2=s2, limit=limit):
+                    self.assertEqual(editDistance(s1, s2, limit),
+                                     min(full, limit + 1))
+
+class OutputCheckTest(unittest.TestCase):
+
+    def testRandom(self):
+        tester = loadTester()
+        rand = random.Random(29)
+        for n in range(300):
+            expected = ["".join(rand.choice("ab") for _ in range(
+                                rand.randrange(8)))
+                        for _ in range(rand.randrange(1, 5))]
+            actual = mutated("\n".join(expected) + "\n",
+                             rand.randrange(6), rand)
+            tolerance = rand.randrange(4)
+            check = tester.OutputCheck(expected, tolerance)
+            k = 0
+            while k < len(actual):
+                m = k + rand.randrange(1, 6)
+                check.feed(actual[k:m])
+                k = m
+            with self.subTest(expected=expected, actual=actual,
+                              tolerance=tolerance):
+                self.assertEqual(check.finish(), actual)
+                self.assertEqual(check.failed,
+                                 plainDistance("\n".join(expected).rstrip(),
+                                               actual.rstrip()) > tolerance)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""The files in a tester's src directory, used by tester.py and runner.py
+for the + and = instructions.
+
+A FixtureStore reads each src file once, remembering the size and a
+digest of its canonical form (as the testers have always compared files:
+as text, with \r\n and lone \r taken as \n), and, for small files, the
+contents themselves.  An entry is reused as long as the file's size and
+modification time are unchanged, so that a long-lived tester (--watch)
+sees edits.
+
+An = check reads only the file under test, and not even that if it is too
+small to match (canonicalization only shortens a file).  Otherwise, the
+file's canonical digest is computed as it is read, a block at a time, or
+directly from a memory map of a large file with no carriage returns.
+
+A + copy writes a small fixture from memory.  A large one is cloned where
+the file system can share its blocks copy-on-write (FICLONE, as in cp
+--reflink, on Btrfs, XFS, and the like) and copied otherwise.  Hard links,
+though cheaper still, are never used: gitlet overwrites files in place,
+which would change the fixture itself."""
+
+import os, hashlib, threading, mmap
+from os.path import join
+from shutil import copyfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Fixtures no larger than this are kept in memory.
+SMALL_FIXTURE = 1 << 16
+# Files at least this large are hashed from a memory map, if possible.
+MMAP_SIZE = 1 << 20
+BLOCK = 1 << 20
+# From <linux/fs.h>.
+FICLONE = 0x40049409
+
+class Fixture:
+    """The src file at PATH, whose size and modification time are STAT.
+    SIZE and DIGEST are those of its canonical form; DATA is its contents
+    if it is small, and otherwise None."""
+
+    def __init__(self, path, stat, size, digest, data):
+        self.path = path
+        self.stat = stat
+        self.size = size
+        self.digest = digest
+        self.data = data
+
+def canonical(data):
+    """DATA (bytes) with \r\n and \r replaced by \n."""
+    if b"\r" not in data:
+        return data
+    return data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+def canonicalDigest(path, limit=None):
+    """Returns the size and sha1 digest of the canonical contents of the
+    file PATH, or None if the canonical size is found to exceed LIMIT (not
+    None) before all of it is read."""
+    digest = hashlib.sha1()
+    size = 0
+    with open(path, 'rb') as inp:
+        if os.fstat(inp.fileno()).st_size >= MMAP_SIZE:
+            try:
+                with mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ) \
+                     as mapped:
+                    if mapped.find(b"\r") < 0:
+                        if limit is not None and len(mapped) > limit:
+                            return None
+                        digest.update(mapped)
+                        return len(mapped), digest.digest()
+            except (OSError, ValueError):
+                pass
+        held = b""
+        while True:
+            block = inp.read(BLOCK)
+            if not block:
+                break
+            block = held + block
+            # A \r that ends a block may begin a \r\n.
+            held = b"\r" if block.endswith(b"\r") else b""
+            block = canonical(block[:len(block) - len(held)])
+            size += len(block)
+            if limit is not None and size > limit:
+                return None
+            digest.update(block)
+        if held:
+            size += 1
+            digest.update(b"\n")
+    if limit is not None and size > limit:
+        return None
+    return size, digest.digest()
+
+class FixtureStore:
+    """The files in the directory SRC_DIR."""
+
+    def __init__(self, src_dir):
+        self.src_dir = src_dir
+        self.lock = threading.Lock()
+        self.fixtures = {}
+        self.cloning = fcntl is not None and hasattr(fcntl, 'ioctl')
+
+    def get(self, name):
+        """Returns the Fixture for src file NAME, or None if there is no
+        such file."""
+        path = join(self.src_dir, name)
+        try:
+            info = os.stat(path)
+        except FileNotFoundError:
+            return None
+        stat = (info.st_size, info.st_mtime_ns)
+        with self.lock:
+            fixture = self.fixtures.get(path)
+        if fixture is not None and fixture.stat == stat:
+            return fixture
+        if info.st_size <= SMALL_FIXTURE:
+            with open(path, 'rb') as inp:
+                data = inp.read()
+            text = canonical(data)
+            fixture = Fixture(path, stat, len(text),
+                              hashlib.sha1(text).digest(), data)
+        else:
+            size, digest = canonicalDigest(path)
+            fixture = Fixture(path, stat, size, digest, None)
+        with self.lock:
+            self.fixtures[path] = fixture
+        return fixture
+
+    def matches(self, path, name):
+        """True iff the file PATH has the same canonical contents as src
+        file NAME (or neither exists)."""
+        fixture = self.get(name)
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            return fixture is None
+        if fixture is None or size < fixture.size:
+            return False
+        result = canonicalDigest(path, fixture.size)
+        return result == (fixture.size, fixture.digest)
+
+    def copy(self, name, dest):
+        """Copy src file NAME to DEST (which does not exist)."""
+        fixture = self.get(name)
+        if fixture is None:
+            raise FileNotFoundError(join(self.src_dir, name))
+        if fixture.data is not None:
+            with open(dest, 'wb') as out:
+                out.write(fixture.data)
+        elif not self.clone(fixture.path, dest):
+            copyfile(fixture.path, dest)
+
+    def clone(self, src, dest):
+        """Make DEST a copy-on-write clone of SRC, returning true iff
+        successful.  Stops trying after the first failure."""
+        if not self.cloning:
+            return False
+        try:
+            with open(src, 'rb') as inp, open(dest, 'wb') as out:
+                fcntl.ioctl(out.fileno(), FICLONE, inp.fileno())
+            return True
+        except OSError:
+            self.cloning = False
+            return False
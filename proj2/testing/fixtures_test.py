@@ -0,0 +1,129 @@
+"""Checks fixtures.FixtureStore: its reuse of a src file's digest until the
+file changes, its comparison of files as text (with \r\n and \r taken as
+\n) by each of the ways it reads them, and its copies, and tester.py's
+report of an = check of a file with other contents.
+
+Usage: python3 fixtures_test.py
+
+The sizes at which FixtureStore switches from keeping a file in memory to
+hashing it a block at a time or from a memory map are lowered here, so
+that small files exercise every path."""
+
+import os, unittest
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+import fixtures
+from fixtures import FixtureStore
+from directives_test import runTests
+
+# Contents that fixtures of each kind are given here.
+TEXT = b"".join(b"line %d\n" % k for k in range(200))
+
+class FixtureStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = fixtures.SMALL_FIXTURE, fixtures.MMAP_SIZE, \
+                     fixtures.BLOCK
+        fixtures.SMALL_FIXTURE, fixtures.MMAP_SIZE, fixtures.BLOCK = \
+            64, 1024, 16
+        self.dir = mkdtemp(prefix="fixtures")
+        self.src = join(self.dir, "src")
+        os.mkdir(self.src)
+        self.store = FixtureStore(self.src)
+
+    def tearDown(self):
+        fixtures.SMALL_FIXTURE, fixtures.MMAP_SIZE, fixtures.BLOCK = \
+            self.saved
+        rmtree(self.dir, ignore_errors=True)
+
+    def write(self, name, data, src=True):
+        """Write DATA to NAME in the src directory if SRC, and otherwise in
+        the test directory.  Returns its path."""
+        path = join(self.src if src else self.dir, name)
+        with open(path, 'wb') as out:
+            out.write(data)
+        return path
+
+    def testReused(self):
+        path = self.write("f", TEXT)
+        first = self.store.get("f")
+        self.assertIs(self.store.get("f"), first)
+        self.write("f", TEXT + b"more\n")
+        second = self.store.get("f")
+        self.assertIsNot(second, first)
+        self.assertNotEqual(second.digest, first.digest)
+        self.assertIs(self.store.get("f"), second)
+        # Same size, different contents and modification time.
+        self.write("f", TEXT.replace(b"line", b"LINE") + b"more\n")
+        info = os.stat(path)
+        os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns + 10**9))
+        self.assertNotEqual(self.store.get("f").digest, second.digest)
+        os.remove(path)
+        self.assertIsNone(self.store.get("f"))
+
+    def testMatches(self):
+        cases = {
+            "small": TEXT[:40],
+            "blocks": TEXT[:500],
+            "mapped": TEXT,
+        }
+        for name, text in cases.items():
+            with self.subTest(fixture=name):
+                self.write(name, text)
+                self.assertTrue(self.store.matches(
+                    self.write("same", text, False), name))
+                self.assertTrue(self.store.matches(
+                    self.write("crlf", text.replace(b"\n", b"\r\n"), False),
+                    name))
+                self.assertTrue(self.store.matches(
+                    self.write("cr", text.replace(b"\n", b"\r"), False),
+                    name))
+                self.assertFalse(self.store.matches(
+                    self.write("longer", text + b"x", False), name))
+                self.assertFalse(self.store.matches(
+                    self.write("shorter", text[:-2] + b"\n", False), name))
+                self.assertFalse(self.store.matches(
+                    self.write("other", text[:-2] + b"x\n", False), name))
+                self.assertFalse(self.store.matches(
+                    join(self.dir, "none"), name))
+        self.assertTrue(self.store.matches(join(self.dir, "none"), "none"))
+        self.assertFalse(self.store.matches(join(self.dir, "same"), "none"))
+
+    def testCarriageReturnAtBlockEnd(self):
+        self.write("f", b"x" * (fixtures.BLOCK - 1) + b"\n" + b"y\n" * 40)
+        text = b"x" * (fixtures.BLOCK - 1) + b"\r\n" + b"y\r" * 40
+        self.assertEqual(fixtures.canonicalDigest(join(self.src, "f")),
+                         fixtures.canonicalDigest(self.write("g", text,
+                                                             False)))
+        self.assertTrue(self.store.matches(join(self.dir, "g"), "f"))
+
+    def testCopy(self):
+        for name, text in ("small", TEXT[:40]), ("large", TEXT + b"\r\n"):
+            with self.subTest(fixture=name):
+                self.write(name, text)
+                dest = join(self.dir, name + ".copy")
+                self.store.copy(name, dest)
+                with open(dest, 'rb') as inp:
+                    self.assertEqual(inp.read(), text)
+        with self.assertRaises(FileNotFoundError):
+            self.store.copy("none", join(self.dir, "none.copy"))
+
+class FixtureCheckTest(unittest.TestCase):
+
+    def testWrongFile(self):
+        files = { "g7": (1000, "7"), "g8": (1000, "8") }
+        results = runTests({
+            "same": "+ f.txt g7\n= f.txt g7\n",
+            "other": "+ f.txt g7\n= f.txt g8\n",
+            "missing": "= f.txt g7\n",
+            "absent": "+ f.txt g7\n= f.txt g9\n",
+        }, files)
+        self.assertEqual(results["same"][0], "passed")
+        for name in "other", "missing", "absent":
+            with self.subTest(test=name):
+                self.assertEqual(results[name][0], "error")
+                self.assertIn("f.txt", results[name][1])
+
+if __name__ == "__main__":
+    unittest.main()
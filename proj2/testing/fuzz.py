@@ -0,0 +1,359 @@
+"""Random gitlet command sequences, run by tester.py, for finding the bugs
+that the hand-written tests miss.  See USAGE."""
+
+import sys, re, json, random, hashlib
+from subprocess import run, DEVNULL
+from os import cpu_count, makedirs
+from os.path import abspath, dirname, join
+from getopt import getopt, GetoptError
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+
+SHORT_USAGE = """\
+Usage: python3 fuzz.py OPTIONS
+
+   OPTIONS may include
+       --count=N      Run N random command sequences (default 1000).
+       --length=N     Make each sequence up to N instructions long
+                      (default 30).
+       --seed=S       Seed the generator with S (default random), so that
+                      a run can be repeated.
+       --diff         Run each sequence with staff-gitlet as well (as for
+                      tester.py --diff), so that a difference from it
+                      counts as a failure.
+       --jobs=N       Run up to N sequences at once (default the number
+                      of processors).
+       --batch=N      Hand sequences to tester.py N at a time (default
+                      200).
+       --warm         Run gitlet commands in long-lived JVMs (as for
+                      tester.py --warm).
+       --progdir=DIR  Directory or JAR files containing gitlet application
+                      (default ..).
+       --timeout=SEC  Number of seconds allowed to each execution of gitlet
+                      (default 10).
+       --workdir=DIR  Create the sequences' tests and directories in DIR
+                      (default a temporary directory).
+       --out=DIR      Write minimized failing tests to DIR (default
+                      fuzz-failures).
+       --max-failures=N  Stop after finding N distinct failures (default
+                      10).
+"""
+
+USAGE = SHORT_USAGE + """\
+
+Generates random command sequences, each starting with init and followed
+by adds, rms, commits, branches, checkouts (of branches, of files, and of
+files from earlier commits), resets, merges, statuses, logs, and changes
+to the working files, whose contents are random lines (see the G
+instruction in tester.py).  Commands mostly refer to files, branches, and
+commits that exist, but not always, so that gitlet's error cases are
+exercised too.
+
+Each sequence is written as a test and run by tester.py, a batch at a time
+with --jobs tests at once, each in its own test directory.  Expected
+output is not checked, so a sequence fails only if a command crashes
+(exits with a nonzero code), times out, or produces too much output, or,
+with --diff, behaves differently from staff-gitlet.
+
+A failing sequence is shrunk by delta debugging: parts of it are removed,
+the candidates being run in batches like the sequences themselves, as long
+as the rest still fails in the same way, until removing any one step (an
+instruction, or a find and the reset or checkout that uses its output)
+makes it pass.  The result is written to OUT/fuzz-SEED.in, where SEED
+regenerates the original sequence, with a comment giving the error and
+the tester.py command that reproduces it.  Sequences whose minimized
+tests are the same, apart from the names of files, branches, and commit
+messages and the contents of generated files, count as one failure.
+
+Reports the number of sequences run and failures found, and exits with
+status 1 if there were any failures."""
+
+TESTER = join(dirname(abspath(__file__)), "tester.py")
+TIMEOUT = 10
+
+FILE_NAMES = ["f{}.txt".format(k) for k in range(1, 6)]
+# Largest file generated, in bytes.
+MAX_FILE = 300
+# Matches any output.
+ANY_OUTPUT = r"(?:.|\n)*"
+# Matches any output, capturing its first line.
+FIRST_LINE = r"([^\n]*)(?:.|\n)*"
+# The kinds of step generated, with their relative frequencies.
+STEP_WEIGHTS = {
+    "write": 24, "delete": 5, "add": 20, "rm": 6, "commit": 12,
+    "branch": 4, "checkout": 6, "restore": 4, "revert": 3, "reset": 2,
+    "merge": 4, "status": 4, "log": 3,
+}
+# The names of files, branches, and commit messages that steps use, which
+# are numbered in order of appearance when comparing failures.
+NAME_KINDS = [
+    (r'\bf\d+\.txt\b', "file"),
+    (r'\b(?:master|b\d+)\b', "branch"),
+    (r'\bc\d+\b', "commit"),
+]
+# The error messages of tester.py that indicate the same kind of failure.
+FAILURE_KINDS = [
+    (r'^timeout$', "timeout"),
+    (r'exited with code', "crash"),
+    (r'^output exceeded', "output limit"),
+    (r'^exit status', "exit status"),
+    (r'^output differs', "output"),
+    (r'^files differ', "files"),
+]
+
+def Usage():
+    print(SHORT_USAGE, file=sys.stderr)
+    sys.exit(1)
+
+def command(cmnd, pattern=ANY_OUTPUT):
+    """The lines of a ">" instruction running CMND, whose output must match
+    PATTERN."""
+    return ["> " + cmnd, pattern, "<<<*"]
+
+def randomSteps(seed, length):
+    """Returns a random command sequence determined by SEED and about
+    LENGTH instructions long, as a list of steps, each a list of test
+    lines."""
+    rand = random.Random(seed)
+    kinds, weights = list(STEP_WEIGHTS), list(STEP_WEIGHTS.values())
+    files = set()
+    branches = ["master"]
+    messages = []
+    steps = [command("init")]
+    size = rand.randint(max(1, length // 2), max(1, length))
+    while len(steps) < size:
+        kind = rand.choices(kinds, weights)[0]
+        name = rand.choice(FILE_NAMES)
+        if kind == "write":
+            files.add(name)
+            steps.append(["G {} {} {}".format(name, rand.randint(0, MAX_FILE),
+                                              rand.randrange(1 << 30))])
+        elif kind == "delete" and files:
+            name = rand.choice(sorted(files))
+            files.discard(name)
+            steps.append(["- " + name])
+        elif kind == "add":
+            if files and rand.random() < 0.9:
+                name = rand.choice(sorted(files))
+            steps.append(command("add " + name))
+        elif kind == "rm":
+            steps.append(command("rm " + name))
+        elif kind == "commit":
+            messages.append("c{}".format(len(messages) + 1))
+            steps.append(command("commit " + messages[-1]))
+        elif kind == "branch":
+            if rand.random() < 0.8:
+                branches.append("b{}".format(len(branches)))
+            steps.append(command("branch " + branches[-1]))
+        elif kind in ("checkout", "merge"):
+            steps.append(command("{} {}".format(kind, rand.choice(branches))))
+        elif kind == "restore":
+            steps.append(command("checkout -- " + name))
+        elif kind in ("revert", "reset") and messages:
+            target = "reset ${1}" if kind == "reset" \
+                     else "checkout ${1} -- " + name
+            steps.append(command("find " + rand.choice(messages), FIRST_LINE)
+                         + command(target))
+        elif kind in ("status", "log"):
+            steps.append(command(kind))
+    return steps
+
+def testText(steps, comments=()):
+    """The text of a test consisting of STEPS, preceded by the lines of
+    COMMENTS as comments."""
+    lines = ["# " + line for line in comments]
+    lines.append("T {:g}".format(timeout))
+    for step in steps:
+        lines += step
+    return "\n".join(lines) + "\n"
+
+def failureKind(message):
+    """The kind of failure described by tester.py's error MESSAGE."""
+    for pattern, kind in FAILURE_KINDS:
+        if re.search(pattern, message):
+            return kind
+    return message
+
+def runBatch(tests):
+    """Run the tests whose step lists are TESTS with tester.py.  Returns a
+    list of the result of each ("passed", "error", or "failed", as in
+    tester.py's reports) and its error message."""
+    dir = mkdtemp(prefix="batch", dir=work_dir)
+    try:
+        files = []
+        for k, steps in enumerate(tests):
+            files.append(join(dir, "t{}.in".format(k)))
+            with open(files[-1], 'w') as out:
+                out.write(testText(steps))
+        report = join(dir, "report")
+        run([sys.executable, TESTER, "--cachedir=", "--no-cache",
+             "--workdir=" + dir, "--report=" + report,
+             "--jobs={}".format(jobs), "--progdir=" + prog_dir]
+            + tester_options + files,
+            stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL)
+        try:
+            with open(report + ".json") as inp:
+                outcomes = { info["file"]: (info["result"], info["message"])
+                             for info in json.load(inp)["tests"] }
+        except (OSError, ValueError):
+            outcomes = {}
+        return [outcomes.get(name, ("failed", "not run")) for name in files]
+    finally:
+        rmtree(dir, ignore_errors=True)
+
+def fails(candidates, kind):
+    """For each list of steps in CANDIDATES, whether it fails with an error
+    of kind KIND."""
+    return [result == "error" and failureKind(message) == kind
+            for result, message in runBatch(candidates)]
+
+def minimized(steps, kind):
+    """Returns a sublist of STEPS that fails with an error of kind KIND and
+    from which no single step can be removed without it passing (assuming
+    STEPS itself fails that way), found by delta debugging."""
+    n = 2
+    while len(steps) >= 2:
+        n = min(n, len(steps))
+        bounds = [len(steps) * k // n for k in range(n + 1)]
+        chunks = [steps[bounds[k]:bounds[k + 1]] for k in range(n)]
+        complements = [steps[:bounds[k]] + steps[bounds[k + 1]:]
+                       for k in range(n)] if n > 2 else []
+        results = fails(chunks + complements, kind)
+        if True in results[:n]:
+            steps, n = chunks[results.index(True)], 2
+        elif True in results[n:]:
+            steps, n = complements[results.index(True, n) - n], max(n - 1, 2)
+        elif n >= len(steps):
+            break
+        else:
+            n = min(2 * n, len(steps))
+    return steps
+
+def failureKey(kind, steps):
+    """A digest that identifies a failure of kind KIND by its minimized
+    sequence STEPS, but not by the names it happens to use, nor by the
+    sizes and contents of the files it generates, so that, for example,
+    a merge of master and one of b3 that crash in the same way count as
+    one failure."""
+    names = {}
+    def number(M, what):
+        return names.setdefault((what, M.group(0)), "<{} {}>".format(
+            what, sum(1 for other, _ in names if other == what) + 1))
+    lines = []
+    for step in steps:
+        for line in step:
+            line = re.sub(r'^(G\s+\S+)\s.*', r'\1', line)
+            for pattern, what in NAME_KINDS:
+                line = re.sub(pattern, lambda M: number(M, what), line)
+            lines.append(line)
+    return hashlib.sha1(repr((kind, lines)).encode()).hexdigest()
+
+def reportFailure(seed, steps, message, seen):
+    """Minimize the sequence STEPS, generated from SEED, which failed with
+    MESSAGE, and write it to the --out directory, unless it is the same as
+    one of the minimized sequences in SEEN.  Returns true iff it is new."""
+    kind = failureKind(message)
+    steps = minimized(steps, kind)
+    key = failureKey(kind, steps)
+    if key in seen:
+        return False
+    seen.add(key)
+    makedirs(out_dir, exist_ok=True)
+    name = join(out_dir, "fuzz-{}.in".format(seed))
+    options = " --diff" if diff else ""
+    with open(name, 'w') as out:
+        out.write(testText(steps, [
+            "Found by fuzz.py: ERROR ({})".format(message),
+            "Reproduce with: python3 tester.py{} {}".format(options, name)]))
+    print("{}: {} ({} steps)".format(name, message, len(steps)))
+    return True
+
+def fuzz(count, length, seed, max_failures):
+    """Run COUNT random sequences of about LENGTH instructions, generated
+    from SEED, stopping after MAX_FAILURES distinct failures.  Returns the
+    number of sequences run and of failures found."""
+    rand = random.Random(seed)
+    seen = set()
+    done = 0
+    start = perf_counter()
+    while done < count and len(seen) < max_failures:
+        seeds = [rand.randrange(1 << 32)
+                 for k in range(min(batch, count - done))]
+        tests = [randomSteps(s, length) for s in seeds]
+        for s, steps, (result, message) in zip(seeds, tests,
+                                                runBatch(tests)):
+            if result == "error" and len(seen) < max_failures:
+                reportFailure(s, steps, message, seen)
+            elif result == "failed":
+                print("fuzz-{}: test not run ({})".format(s, message))
+        done += len(tests)
+        minutes = (perf_counter() - start) / 60
+        print("{} sequences, {} failures, {:.0f} sequences/minute"
+              .format(done, len(seen), done / minutes if minutes else 0))
+    return done, len(seen)
+
+if __name__ == "__main__":
+    count = 1000
+    length = 30
+    seed = None
+    diff = False
+    jobs = cpu_count() or 1
+    batch = 200
+    prog_dir = abspath("..")
+    timeout = TIMEOUT
+    work_dir = None
+    out_dir = "fuzz-failures"
+    max_failures = 10
+    tester_options = []
+
+    try:
+        opts, args = \
+            getopt(sys.argv[1:], '',
+                   ['count=', 'length=', 'seed=', 'diff', 'jobs=', 'batch=',
+                    'warm', 'progdir=', 'timeout=', 'workdir=', 'out=',
+                    'max-failures='])
+        for opt, val in opts:
+            if opt == "--count":
+                count = int(val)
+            elif opt == "--length":
+                length = int(val)
+            elif opt == "--seed":
+                seed = val
+            elif opt == "--diff":
+                diff = True
+                tester_options.append(opt)
+            elif opt == "--jobs":
+                jobs = int(val)
+            elif opt == "--batch":
+                batch = max(1, int(val))
+            elif opt == "--warm":
+                tester_options.append(opt)
+            elif opt == "--progdir":
+                prog_dir = abspath(val)
+            elif opt == "--timeout":
+                timeout = float(val)
+            elif opt == "--workdir":
+                work_dir = val
+            elif opt == "--out":
+                out_dir = val
+            elif opt == "--max-failures":
+                max_failures = int(val)
+    except (GetoptError, ValueError):
+        Usage()
+    if args:
+        Usage()
+
+    scratch = mkdtemp(prefix="fuzz", dir=work_dir)
+    work_dir = scratch
+    try:
+        done, found = fuzz(count, length, seed, max_failures)
+    finally:
+        rmtree(scratch, ignore_errors=True)
+    print()
+    print("Ran {} sequences. ".format(done), end="")
+    if found == 0:
+        print("No failures.")
+    else:
+        print("{} failures, in {}.".format(found, out_dir))
+        sys.exit(1)
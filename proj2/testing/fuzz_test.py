@@ -0,0 +1,101 @@
+"""Checks fuzz.py's minimization of failing sequences and its counting of
+distinct failures, with fuzz.fails replaced by a stand-in that decides
+which sequences fail without running them, so that no gitlet is needed.
+
+Usage: python3 fuzz_test.py"""
+
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+import fuzz
+from fuzz import command
+
+def failsWith(*needed):
+    """A replacement for fuzz.fails under which a sequence fails iff it
+    contains all of the steps NEEDED."""
+    def fails(candidates, kind):
+        return [all(step in steps for step in needed)
+                for steps in candidates]
+    return fails
+
+class FuzzTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = fuzz.fails
+        fuzz.out_dir = mkdtemp(prefix="fuzz")
+        fuzz.diff = False
+        fuzz.timeout = fuzz.TIMEOUT
+
+    def tearDown(self):
+        fuzz.fails = self.saved
+        rmtree(fuzz.out_dir, ignore_errors=True)
+
+    def steps(self, n):
+        return [command("add f{}.txt".format(k)) for k in range(n)]
+
+    def testMinimizedOne(self):
+        steps = self.steps(20)
+        fuzz.fails = failsWith(steps[13])
+        self.assertEqual(fuzz.minimized(steps, "crash"), [steps[13]])
+
+    def testMinimizedSeveral(self):
+        steps = self.steps(30)
+        fuzz.fails = failsWith(steps[0], steps[7], steps[29])
+        self.assertEqual(fuzz.minimized(steps, "crash"),
+                         [steps[0], steps[7], steps[29]])
+
+    def testMinimizedKeepsOrder(self):
+        steps = self.steps(9)
+        fuzz.fails = failsWith(steps[5], steps[2])
+        self.assertEqual(fuzz.minimized(steps, "crash"),
+                         [steps[2], steps[5]])
+
+    def testSameNames(self):
+        key = fuzz.failureKey
+        self.assertEqual(
+            key("crash", [command("init"), command("merge master")]),
+            key("crash", [command("init"), command("merge b3")]))
+        self.assertEqual(
+            key("crash", [["G f1.txt 10 5"], command("add f1.txt"),
+                          command("commit c1"), command("find c1")]),
+            key("crash", [["G f4.txt 200 9"], command("add f4.txt"),
+                          command("commit c3"), command("find c3")]))
+
+    def testDifferentSteps(self):
+        key = fuzz.failureKey
+        self.assertNotEqual(
+            key("crash", [command("init"), command("merge master")]),
+            key("crash", [command("init"), command("checkout master")]))
+        self.assertNotEqual(
+            key("crash", [command("add f1.txt"), command("rm f1.txt")]),
+            key("crash", [command("add f1.txt"), command("rm f2.txt")]))
+        self.assertNotEqual(
+            key("crash", [command("merge master")]),
+            key("timeout", [command("merge master")]))
+
+    def testReportedOnce(self):
+        with redirect_stdout(StringIO()):
+            self.checkReportedOnce()
+
+    def checkReportedOnce(self):
+        seen = set()
+        merge = command("merge master")
+        fuzz.fails = failsWith(merge)
+        self.assertTrue(fuzz.reportFailure(
+            1, [command("init"), command("status"), merge],
+            "java gitlet.Main exited with code 1", seen))
+        merge = command("merge b3")
+        fuzz.fails = failsWith(merge)
+        self.assertFalse(fuzz.reportFailure(
+            2, [command("init"), command("branch b3"), merge,
+                command("log")], "java gitlet.Main exited with code 1",
+            seen))
+        self.assertEqual(len(seen), 1)
+        with open(join(fuzz.out_dir, "fuzz-1.in")) as inp:
+            self.assertIn("> merge master\n", inp.read())
+
+if __name__ == "__main__":
+    unittest.main()
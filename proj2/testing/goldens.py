@@ -0,0 +1,119 @@
+"""Recorded reference behavior of tests, written by staff-runner.py with
+--record and checked by tester.py with --replay.
+
+A GoldenStore holds, for each test it has recorded, a digest of the text
+of the test and its included files, and the golden result of each of its
+">" commands (steps), in the order they ran: the line of the test that ran
+it, its exit status (0, the code it exited with, or a description such as
+"timeout"), its output, and the digest of the test directory afterwards
+(without .gitlet, as for H).  Outputs are kept as the testers compare
+them, with blanks normalized, commit ids replaced by their numbers in
+order of first appearance in the test (abbreviations included), and the
+contents of "Date:" lines replaced by a placeholder, since these differ
+between correct implementations.  Each distinct output is stored once, so
+the many repetitions of a test's common outputs ("=== Status ===", for
+example) cost little, and the whole is kept as gzipped JSON.  Tests are
+named by their paths relative to the directory of the store, so that the
+store can be used from any directory.
+
+A test's golden steps are used only while the test's digest is unchanged;
+a test that has been edited since it was recorded must be recorded again.
+The src files that tests copy are not part of the digest."""
+
+import re, json, gzip, hashlib
+from os import getpid, replace
+from os.path import abspath, dirname, join, relpath
+
+VERSION = 1
+# Commit ids, full and (at least 7 digits) abbreviated, and dates, which
+# vary between correct implementations.
+COMMIT_ID = re.compile(r'\b[0-9a-f]{40}\b')
+ABBREVIATED_ID = re.compile(r'\b[0-9a-f]{7,39}\b')
+DATE_LINE = re.compile(r'(?m)^Date: .*$')
+
+def maskedOutput(out, ids):
+    """OUT, a command's output with its blanks normalized, without
+    trailing whitespace and with commit ids and dates masked.  IDS maps
+    the commit ids seen so far in the same test to their numbers, and is
+    updated with any new ones."""
+    def full(M):
+        return "<commit {}>".format(ids.setdefault(M.group(0), len(ids) + 1))
+    def abbreviated(M):
+        for id, number in ids.items():
+            if id.startswith(M.group(0)):
+                return "<commit {}>".format(number)
+        return M.group(0)
+    out = COMMIT_ID.sub(full, out.rstrip())
+    out = ABBREVIATED_ID.sub(abbreviated, out)
+    return DATE_LINE.sub("Date: <date>", out)
+
+def commandStatus(msg):
+    """The status of a command as described by a tester's message MSG
+    ("OK", or one ending in "exited with code N"): 0 for success, N if it
+    exited with code N, and otherwise MSG."""
+    if msg == "OK":
+        return 0
+    mat = re.search(r'exited with code (-?\d+)$', msg)
+    return int(mat.group(1)) if mat else msg
+
+def testDigest(test, included_files):
+    """A digest of the text of TEST and of INCLUDED_FILES (named relative
+    to the directory of TEST)."""
+    digest = hashlib.sha1()
+    for name in [test] + [join(dirname(test), f) for f in included_files]:
+        with open(name, 'rb') as inp:
+            data = inp.read()
+        digest.update(b"%d\0" % len(data) + data)
+    return digest.hexdigest()
+
+class GoldenStore:
+    """The golden steps in the file FILENAME (which need not exist)."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.tests = {}
+        try:
+            with gzip.open(filename, 'rt') as inp:
+                state = json.load(inp)
+        except (OSError, ValueError, EOFError):
+            return
+        if state.get("version") != VERSION:
+            return
+        outputs = state["outputs"]
+        for name, (digest, steps) in state["tests"].items():
+            self.tests[name] = (digest, [(line_num, status, outputs[out], tree)
+                                         for line_num, status, out, tree
+                                         in steps])
+
+    def key(self, test):
+        return relpath(abspath(test), dirname(abspath(self.filename)))
+
+    def steps(self, test, digest):
+        """The golden steps (tuples of line number, status, output, and
+        directory digest) recorded for TEST, whose digest is DIGEST, or
+        None if there are none or they were recorded from a different
+        version of TEST."""
+        entry = self.tests.get(self.key(test))
+        if entry is None or entry[0] != digest:
+            return None
+        return entry[1]
+
+    def record(self, test, digest, steps):
+        """Set the golden steps of TEST, whose digest is DIGEST, to
+        STEPS."""
+        self.tests[self.key(test)] = (digest, list(steps))
+
+    def save(self):
+        outputs = {}
+        tests = {}
+        for name, (digest, steps) in sorted(self.tests.items()):
+            tests[name] = \
+                (digest, [(line_num, status,
+                           outputs.setdefault(out, len(outputs)), tree)
+                          for line_num, status, out, tree in steps])
+        state = { "version": VERSION, "outputs": list(outputs),
+                  "tests": tests }
+        temp = "{}.{}".format(self.filename, getpid())
+        with gzip.open(temp, 'wt') as out:
+            json.dump(state, out, separators=(',', ':'))
+        replace(temp, self.filename)
@@ -0,0 +1,272 @@
+"""How gitlet's repositories grow: the size of the .gitlet directory after
+each gitlet command, recorded by tester.py with --growth, and a benchmark
+of scaling scenarios that runs tester.py and reports the growth.
+
+Usage: python3 growth.py OPTIONS
+
+   OPTIONS may include
+       --scales=N,...  Run each scenario with each N (default 10,20,40).
+       --files=M       Change M files in each commit (default 4).
+       --size=SIZE     Make each file SIZE bytes (optionally followed by K
+                       or M; default 1K).
+       --scenarios=NAME,...
+                       Run only the scenarios NAME (default all).
+       --progdir=DIR   Directory or JAR files containing gitlet
+                       application (default ..).
+       --jobs=N        Run up to N scenarios at once (default 1).
+       --warm          Run gitlet commands in long-lived JVMs.
+       --out=FILE      Also write the measurements and summaries to FILE
+                       as JSON.
+
+The scenarios, each run for every N, are
+
+  commits   N commits, each of M files with new contents;
+  dedup     2N commits, alternating between the same two versions of M
+            files, so that a repository that stores each distinct file
+            once stops growing after the first two;
+  branches  one commit of M files, then N branches, each checked out and
+            given a commit changing one file.
+
+Reports, for each scenario and N, the number of gitlet commands run, the
+total bytes, number of files, and largest file in .gitlet at the end, and
+the mean growth of bytes and files per commit, and then the mean and
+largest growth per command for each subcommand over all the runs.  Growth
+that is proportional to N shows as constant bytes per commit; growth per
+commit that increases with N (a commit object that lists every earlier
+commit, say) shows as bytes per commit that increase with N."""
+
+import sys, re, json, threading
+from subprocess import run, DEVNULL
+from os import scandir
+from os.path import abspath, dirname, join, splitext, basename
+from getopt import getopt, GetoptError
+from shutil import rmtree
+from tempfile import mkdtemp
+
+GITLET_DIR = ".gitlet"
+TESTER = join(dirname(abspath(__file__)), "tester.py")
+# Matches any output.
+ANY_OUTPUT = r"(?:.|\n)*"
+SCENARIOS = ("commits", "dedup", "branches")
+
+def gitletUsage(dir):
+    """The total bytes, number of files, and size of the largest file in
+    the .gitlet directory in DIR (all 0 if there is none)."""
+    total = files = largest = 0
+    pending = [join(dir, GITLET_DIR)]
+    while pending:
+        try:
+            with scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        size = entry.stat(follow_symlinks=False).st_size
+                        total += size
+                        files += 1
+                        largest = max(largest, size)
+        except OSError:
+            pass
+    return total, files, largest
+
+class GrowthLog:
+    """The sizes of .gitlet directories after gitlet commands, for
+    tester.py --growth."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def record(self, tests, line_num, cmnd, before, after):
+        """Record that gitlet CMND, from line LINE_NUM of TESTS (those
+        sharing the command), changed the usage (as from gitletUsage) of
+        its .gitlet directory from BEFORE to AFTER."""
+        entry = {
+            "line": line_num,
+            "command": cmnd,
+            "subcommand": (cmnd.split() or [""])[0],
+            "bytes": after[0],
+            "files": after[1],
+            "largest": after[2],
+            "added_bytes": after[0] - before[0],
+            "added_files": after[1] - before[1],
+        }
+        with self.lock:
+            for test in tests:
+                self.series.setdefault(test, []).append(entry)
+
+    def summary(self):
+        """Returns the series of each test and the growth by subcommand as
+        a dictionary suitable for JSON."""
+        with self.lock:
+            series = dict(self.series)
+        return {
+            "tests": [{ "name": splitext(basename(test))[0], "file": test,
+                        "series": entries }
+                      for test, entries in sorted(series.items())],
+            "subcommands": subcommandGrowth(
+                entry for entries in series.values() for entry in entries),
+        }
+
+    def write(self, filename):
+        with open(filename, 'w') as out:
+            json.dump(self.summary(), out, indent=1)
+
+def subcommandGrowth(entries):
+    """The number of ENTRIES (as recorded by GrowthLog) of each subcommand
+    and their mean and largest growth."""
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry["subcommand"], []).append(entry)
+    result = {}
+    for sub, group in sorted(groups.items()):
+        added = [entry["added_bytes"] for entry in group]
+        result[sub] = {
+            "count": len(group),
+            "mean_bytes": sum(added) / len(group),
+            "max_bytes": max(added),
+            "mean_files": sum(entry["added_files"]
+                              for entry in group) / len(group),
+        }
+    return result
+
+def command(cmnd):
+    return ["> " + cmnd, ANY_OUTPUT, "<<<*"]
+
+def scenarioText(scenario, n, m, size):
+    """The text of a test running SCENARIO with N and M files of SIZE
+    bytes.  The files are generated with G, so that their contents differ
+    with each seed."""
+    def change(files, seed):
+        lines = []
+        for j in range(1, files + 1):
+            lines.append("G f{}.txt {} {}-{}".format(j, size, seed, j))
+            lines += command("add f{}.txt".format(j))
+        return lines
+    lines = ["# Growth scenario {}, N={}, M={}.".format(scenario, n, m)]
+    lines += command("init")
+    if scenario == "commits":
+        lines += ["R I {}".format(n)] + change(m, "v${I}") \
+                 + command('commit "version ${I}"') + ["R"]
+    elif scenario == "dedup":
+        lines += ["R I {}".format(n)]
+        for version in "ab":
+            lines += change(m, version) \
+                     + command('commit "{} ${{I}}"'.format(version))
+        lines += ["R"]
+    elif scenario == "branches":
+        lines += change(m, "base") + command('commit "base"')
+        lines += ["R I {}".format(n)] + command("branch b${I}") \
+                 + command("checkout b${I}") + change(1, "b${I}") \
+                 + command('commit "on b${I}"') + ["R"]
+    return "\n".join(lines) + "\n"
+
+def runScenarios(scenarios, scales, m, size, options):
+    """Run each of SCENARIOS for each N in SCALES with M files of SIZE
+    bytes, with tester.py and its OPTIONS.  Returns tester.py's exit
+    status and the --growth summary, with each test's scenario and N."""
+    dir = mkdtemp(prefix="growth")
+    try:
+        tests = {}
+        for scenario in scenarios:
+            for n in scales:
+                name = join(dir, "{}-{}.in".format(scenario, n))
+                with open(name, 'w') as out:
+                    out.write(scenarioText(scenario, n, m, size))
+                tests[name] = (scenario, n)
+        log = join(dir, "growth.json")
+        status = run([sys.executable, TESTER, "--cachedir=", "--no-cache",
+                      "--workdir=" + dir, "--growth=" + log]
+                     + options + list(tests),
+                     stdin=DEVNULL, stdout=DEVNULL).returncode
+        try:
+            with open(log) as inp:
+                summary = json.load(inp)
+        except (OSError, ValueError):
+            summary = { "tests": [], "subcommands": {} }
+        for info in summary["tests"]:
+            info["scenario"], info["n"] = tests[info["file"]]
+            info["file"] = basename(info["file"])
+        return status, summary
+    finally:
+        rmtree(dir, ignore_errors=True)
+
+def report(summary, m):
+    """The text of the growth report for SUMMARY, from runScenarios with M
+    files per commit."""
+    lines = ["Growth of .gitlet, with M={}:".format(m), "",
+             "  scenario      N  commands       bytes   files     largest"
+             "  bytes/commit  files/commit"]
+    for info in sorted(summary["tests"],
+                       key=lambda info: (SCENARIOS.index(info["scenario"]),
+                                         info["n"])):
+        series = info["series"]
+        if not series:
+            continue
+        last = series[-1]
+        commits = subcommandGrowth(series).get("commit",
+                                               { "mean_bytes": 0,
+                                                 "mean_files": 0 })
+        lines.append("  {:10s} {:4d}  {:8d}  {:10d}  {:6d}  {:10d}  {:12.0f}"
+                     "  {:12.1f}".format(
+                         info["scenario"], info["n"], len(series),
+                         last["bytes"], last["files"], last["largest"],
+                         commits["mean_bytes"], commits["mean_files"]))
+    lines += ["", "Growth per command, over all scenarios:", "",
+              "  subcommand  commands  mean bytes   max bytes  mean files"]
+    for sub, growth in summary["subcommands"].items():
+        lines.append("  {:10s}  {:8d}  {:10.0f}  {:10d}  {:10.2f}".format(
+            sub, growth["count"], growth["mean_bytes"], growth["max_bytes"],
+            growth["mean_files"]))
+    return "\n".join(lines)
+
+def Usage():
+    print(__doc__.split("Usage: ")[1], file=sys.stderr)
+    sys.exit(1)
+
+def main(args):
+    scales = [10, 20, 40]
+    m = 4
+    size = "1K"
+    scenarios = list(SCENARIOS)
+    options = []
+    out_file = None
+    try:
+        opts, args = getopt(args, '',
+                            ['scales=', 'files=', 'size=', 'scenarios=',
+                             'progdir=', 'jobs=', 'warm', 'out='])
+        for opt, val in opts:
+            if opt == "--scales":
+                scales = [int(n) for n in val.split(",")]
+            elif opt == "--files":
+                m = int(val)
+            elif opt == "--size":
+                if not re.match(r'\d+[KkMm]?$', val):
+                    Usage()
+                size = val
+            elif opt == "--scenarios":
+                scenarios = val.split(",")
+                if not set(scenarios) <= set(SCENARIOS):
+                    Usage()
+            elif opt in ("--progdir", "--jobs"):
+                options.append("{}={}".format(opt, val))
+            elif opt == "--warm":
+                options.append(opt)
+            elif opt == "--out":
+                out_file = val
+    except (GetoptError, ValueError):
+        Usage()
+    if args:
+        Usage()
+
+    status, summary = runScenarios(scenarios, scales, m, size, options)
+    print(report(summary, m))
+    if out_file:
+        with open(out_file, 'w') as out:
+            json.dump(summary, out, indent=1)
+    if status != 0:
+        print("\nSome scenarios failed; run tester.py on them for details.")
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
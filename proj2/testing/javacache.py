@@ -0,0 +1,342 @@
+"""Incremental compilation of Java sources, used by runner.py's doCompile
+and by gitlet's Makefile.
+
+A CompileCache remembers, in a JSON file, a digest of each source it has
+compiled successfully and the class files it produced (those javac wrote
+or rewrote while compiling it, found by comparing the class files in the
+output directories before and after, so that nested, anonymous, and
+auxiliary top-level classes are all included), together with a
+digest of the javac command and of the JAR files on the class path.  Asked
+to compile a set of sources, it skips javac entirely if none of them has
+changed and the class files they produced are all present.  Otherwise, it
+runs javac on the sources that changed, plus those that refer, directly
+or indirectly, to a class defined in one of them, since a change to a
+class can change what its users compile to (an inlined constant, for
+example).
+A source is taken to refer to another if it mentions the other's name
+anywhere, which may recompile a file needlessly but does not miss a
+dependency on a class named after its file.
+
+With a CompileServer (see CompileServer.java), javac runs in a JVM that
+outlives the tester, so that later runs do not pay to start a JVM and
+warm up javac.  If the server cannot be started or fails, javac is run
+as usual.
+
+Usage: python3 javacache.py [--server] CACHE JAVAC-OPTIONS ... SOURCE.java ...
+
+compiles the SOURCEs with javac and JAVAC-OPTIONS, keeping the record of
+what was compiled in the file CACHE (and, with --server, the compile
+server's files in .javac-server in the same directory)."""
+
+import sys, re, json, hashlib, socket
+from subprocess import run, Popen, PIPE, STDOUT, DEVNULL
+from os import environ, pathsep, makedirs, remove, replace, getpid, stat, \
+     scandir
+from os.path import abspath, basename, dirname, exists, getmtime, join, \
+     splitext
+from glob import glob
+from time import sleep, monotonic
+
+# Changed whenever the format of the cache file changes.
+CACHE_FORMAT = 2
+SERVER_SOURCE = join(dirname(abspath(__file__)), "CompileServer.java")
+SERVER_CLASS = "CompileServer"
+# Seconds that an unused compile server stays up, and that a new one is
+# allowed to start.
+SERVER_IDLE = 900
+SERVER_START = 20
+
+def optionValue(argv, *names):
+    """The value following the first of the options NAMES in ARGV, or
+    None."""
+    for k, arg in enumerate(argv[:-1]):
+        if arg in names:
+            return argv[k + 1]
+    return None
+
+def classpathDigest(classpath):
+    """Returns a digest of the names, sizes, and modification times of the
+    JAR files on CLASSPATH (directories, which hold the classes being
+    compiled, are left out)."""
+    digest = hashlib.sha1()
+    for entry in classpath.replace('"', '').split(pathsep):
+        if entry.endswith('*'):
+            jars = sorted(glob(join(entry[:-1] or '.', '*.jar')))
+        else:
+            jars = [entry] if entry.endswith(('.jar', '.zip')) else []
+        for jar in jars:
+            try:
+                info = stat(jar)
+            except OSError:
+                continue
+            digest.update(repr((abspath(jar), info.st_size,
+                                info.st_mtime_ns)).encode())
+    return digest.hexdigest()
+
+class CompileCache:
+    """Compiles Java sources by running JAVAC (an argument list, such as
+    ["javac", "-d", "."]), remembering what it compiled in the JSON file
+    FILENAME.  CLASSPATH is the class path javac sees.  If SERVER is not
+    None, it is the CompileServer used to run javac."""
+
+    def __init__(self, filename, javac, classpath, server=None):
+        self.filename = filename
+        self.javac = javac
+        self.classpath = classpath
+        self.server = server
+        self.outdir = optionValue(javac, "-d")
+        self.key = hashlib.sha1(repr((CACHE_FORMAT, javac,
+                                      classpathDigest(classpath)))
+                                .encode()).hexdigest()
+        try:
+            with open(filename) as inp:
+                self.state = json.load(inp)
+        except (OSError, ValueError):
+            self.state = {}
+        if self.state.get("key") != self.key:
+            self.state = { "key": self.key, "sources": {}, "classes": {} }
+
+    def classSnapshot(self, sources):
+        """The class files that javac may write when compiling SOURCES
+        (those under the -d directory, or else in the directories of
+        SOURCES), each mapped to its size and modification time."""
+        if self.outdir is None:
+            dirs, recursive = { dirname(source) for source in sources }, False
+        else:
+            dirs, recursive = [abspath(self.outdir)], True
+        snapshot = {}
+        pending = list(dirs)
+        while pending:
+            try:
+                with scandir(pending.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir() and recursive:
+                            pending.append(entry.path)
+                        elif entry.name.endswith(".class") \
+                             and entry.is_file():
+                            info = entry.stat()
+                            snapshot[abspath(entry.path)] = \
+                                (info.st_size, info.st_mtime_ns)
+            except OSError:
+                pass
+        return snapshot
+
+    def owners(self, name, sources, texts):
+        """The sources, among SOURCES (whose contents are given by TEXTS),
+        from which javac produced the class file NAME: the one named after
+        its top-level class, or else those that declare that class, or
+        else (not knowing) all of SOURCES."""
+        top = basename(name)[:-len(".class")].split("$")[0]
+        named = [source for source in sources
+                 if splitext(basename(source))[0] == top]
+        if named:
+            return named
+        declaring = re.compile(r'\b(?:class|interface|enum|record)\s+'
+                               + re.escape(top) + r'\b')
+        return [source for source in sources
+                if declaring.search(texts[source])] or sources
+
+    def compile(self, sources):
+        """Bring the class files for SOURCES up to date.  Returns javac's
+        exit status, its output, and the list of sources compiled (empty
+        if javac was not needed)."""
+        texts = {}
+        for source in sources:
+            with open(source, 'rb') as inp:
+                texts[abspath(source)] = inp.read().decode('latin-1')
+        digests = { source: hashlib.sha1(text.encode('latin-1')).hexdigest()
+                    for source, text in texts.items() }
+        names = { source: splitext(basename(source))[0] for source in texts }
+        old = self.state["sources"]
+        classes = self.state["classes"]
+        removed = [source for source in old if source not in texts]
+        todo = { source for source in texts
+                 if old.get(source) != digests[source]
+                 or not classes.get(source)
+                 or not all(exists(name) for name in classes[source]) }
+        if not todo and not removed:
+            return 0, "", []
+
+        words = { source: set(re.findall(r'[A-Za-z_$][\w$]*', text))
+                  for source, text in texts.items() }
+        def users(name):
+            return { source for source in texts
+                     if name in words[source] and names[source] != name }
+        for source in removed:
+            for name in classes.pop(source, []):
+                self.delete(name)
+            del old[source]
+            todo |= users(splitext(basename(source))[0])
+        frontier = list(todo)
+        while frontier:
+            for user in users(names[frontier.pop()]):
+                if user not in todo:
+                    todo.add(user)
+                    frontier.append(user)
+
+        deleted = set()
+        while True:
+            for source in todo:
+                deleted.update(classes.pop(source, []))
+                old.pop(source, None)
+            sharing = { source for source, names in classes.items()
+                        if source in texts and deleted.intersection(names) }
+            if not sharing:
+                break
+            todo |= sharing
+        for name in deleted:
+            self.delete(name)
+        todo = sorted(todo)
+        before = self.classSnapshot(todo)
+        status, out = self.runJavac(todo) if todo else (0, "")
+        if status == 0:
+            for source in todo:
+                old[source] = digests[source]
+                classes[source] = []
+            for name, info in sorted(self.classSnapshot(todo).items()):
+                if before.get(name) != info:
+                    for source in self.owners(name, todo, texts):
+                        classes[source].append(name)
+        self.save()
+        return status, out, todo
+
+    def delete(self, name):
+        try:
+            remove(name)
+        except OSError:
+            pass
+
+    def runJavac(self, sources):
+        """Run javac on SOURCES, returning its exit status and output."""
+        if self.server:
+            try:
+                return self.server.run(self.javac[1:], self.classpath,
+                                       sources)
+            except OSError as excp:
+                print("Warning: compile server disabled ({}).".format(excp),
+                      file=sys.stderr)
+                self.server = None
+        proc = run(self.javac + sources, stdin=DEVNULL, stdout=PIPE,
+                   stderr=STDOUT, universal_newlines=True)
+        return proc.returncode, proc.stdout
+
+    def save(self):
+        try:
+            makedirs(dirname(self.filename) or '.', exist_ok=True)
+            temp = "{}.{}".format(self.filename, getpid())
+            with open(temp, 'w') as out:
+                json.dump(self.state, out, indent=1, sort_keys=True)
+            replace(temp, self.filename)
+        except OSError:
+            pass
+
+class CompileServer:
+    """A client of the CompileServer JVM whose class file and port file are
+    kept in the directory DIR, starting the server with JAVA (an argument
+    list) after compiling it with JAVAC if it is not running."""
+
+    def __init__(self, dir, java, javac):
+        self.dir = abspath(dir)
+        self.java = java
+        self.javac = javac
+        self.port_file = join(self.dir, "compile-server.port")
+
+    def run(self, options, classpath, sources):
+        """Run javac with OPTIONS (javac options other than the class path),
+        the class path CLASSPATH, and SOURCES.  Returns the exit status and
+        output.  Raises OSError if the server cannot do so."""
+        classpath = [abspath(entry) if entry else entry
+                     for entry in classpath.split(pathsep)]
+        fields = self.absolute(options) + ["-cp", pathsep.join(classpath)] \
+                 + [abspath(source) for source in sources]
+        with self.connect() as conn:
+            conn.sendall("COMPILE {} {}\n".format(self.token, len(fields))
+                         .encode())
+            for field in fields:
+                field = field.encode()
+                conn.sendall("{}\n".format(len(field)).encode() + field)
+            reply = conn.makefile('rb')
+            header = reply.readline().split()
+            if len(header) != 2:
+                raise OSError("no reply from compile server")
+            out = reply.read(int(header[1]))
+        return int(header[0]), out.decode(errors="replace")
+
+    def absolute(self, options):
+        """OPTIONS, with the operand of -d made absolute and any class path
+        removed (since run supplies its own)."""
+        result = []
+        k = 0
+        while k < len(options):
+            if options[k] in ("-cp", "-classpath", "--class-path"):
+                k += 1
+            elif options[k] == "-d" and k + 1 < len(options):
+                result += ["-d", abspath(options[k + 1])]
+                k += 1
+            else:
+                result.append(options[k])
+            k += 1
+        return result
+
+    def connect(self):
+        """Returns a connection to the server, starting it if need be."""
+        for attempt in range(2):
+            try:
+                with open(self.port_file) as inp:
+                    port, self.token = inp.read().split()
+                return socket.create_connection(("127.0.0.1", int(port)))
+            except (OSError, ValueError):
+                if attempt == 0:
+                    self.start()
+        raise OSError("cannot connect to compile server")
+
+    def start(self):
+        """Start a server in the background, compiling it first if its
+        class file is out of date, and wait for its port file."""
+        makedirs(self.dir, exist_ok=True)
+        class_file = join(self.dir, SERVER_CLASS + ".class")
+        if not exists(class_file) \
+           or getmtime(class_file) < getmtime(SERVER_SOURCE):
+            run(self.javac[:1] + ["-nowarn", "-d", self.dir, SERVER_SOURCE],
+                stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL)
+        self.deletePortFile()
+        Popen(self.java + ["-cp", self.dir, SERVER_CLASS, self.port_file,
+                           str(SERVER_IDLE)],
+              cwd=self.dir, stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL,
+              start_new_session=True)
+        deadline = monotonic() + SERVER_START
+        while not exists(self.port_file) and monotonic() < deadline:
+            sleep(0.05)
+
+    def deletePortFile(self):
+        try:
+            remove(self.port_file)
+        except OSError:
+            pass
+
+def main(args):
+    server = args[:1] == ["--server"]
+    if server:
+        args = args[1:]
+    if not args:
+        print(__doc__.split("Usage: ")[1], file=sys.stderr)
+        sys.exit(1)
+    filename, args = args[0], args[1:]
+    sources = [arg for arg in args if arg.endswith(".java")]
+    javac = ["javac"] + [arg for arg in args if not arg.endswith(".java")]
+    classpath = optionValue(javac, "-cp", "-classpath", "--class-path") \
+                or environ.get('CLASSPATH', '')
+    cache = CompileCache(filename, javac, classpath,
+                         server and CompileServer(join(dirname(filename) or '.',
+                                                       ".javac-server"),
+                                                  ["java"], ["javac"]))
+    status, out, compiled = cache.compile(sources)
+    sys.stdout.write(out)
+    if compiled:
+        print("Compiled {} of {} sources.".format(len(compiled), len(sources)))
+    else:
+        print("All {} sources up to date.".format(len(sources)))
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
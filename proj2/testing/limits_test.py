@@ -0,0 +1,90 @@
+"""Checks tester.py's --limit-cpu and --limit-files options, its timeouts,
+and --max-output: that each stops only the commands that exceed it, with
+its own message, that the report counts them by kind, and that none of
+the stopped commands' processes outlive the run.
+
+Usage: python3 limits_test.py"""
+
+import unittest
+from subprocess import run, DEVNULL
+from shutil import rmtree, which
+from tempfile import mkdtemp
+from directives_test import makeTests, runTester, outcomes
+
+CASES = {
+    "spin": "> spin\n<<<\n",
+    "slow": "T 0.5\n> sleep 5\n<<<\n",
+    "files": "> touch 20\n<<<\n",
+    "output": "> echo {}\n{}\n<<<\n".format("x" * 3000, "x" * 3000),
+    "ok": "> touch 3\n<<<\n> echo hi\nhi\n<<<\n",
+}
+
+class LimitsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp(prefix="limits")
+
+    def tearDown(self):
+        rmtree(self.dir, ignore_errors=True)
+
+    def runCases(self, cases, options):
+        """Run the tests named CASES (from CASES) with OPTIONS, returning
+        their outcomes and the report's counts of commands stopped by each
+        kind of limit."""
+        names = makeTests(self.dir, { name: CASES[name] for name in cases })
+        report = runTester(self.dir, names, ["--cachedir=", "--no-cache"]
+                           + options)
+        return outcomes(report, names), report["limits"]
+
+    def assertNoneLeft(self):
+        """Check that no process mentioning the test directory remains
+        (where pgrep is available)."""
+        if which("pgrep") is None:
+            return
+        self.assertNotEqual(run(["pgrep", "-f", self.dir],
+                                stdout=DEVNULL).returncode, 0,
+                            "commands still running")
+
+    def testCpu(self):
+        results, limits = self.runCases(("spin", "ok"), ["--limit-cpu=1"])
+        self.assertEqual(results["spin"], ("error", "CPU limit exceeded"))
+        self.assertEqual(results["ok"][0], "passed")
+        self.assertEqual(limits, dict(timeout=0, memory=0, cpu=1, output=0,
+                                      files=0))
+        self.assertNoneLeft()
+
+    def testFiles(self):
+        results, limits = self.runCases(("files", "ok"), ["--limit-files=5"])
+        self.assertEqual(results["files"], ("error", "more than 5 files"))
+        self.assertEqual(results["ok"][0], "passed")
+        self.assertEqual(limits["files"], 1)
+        self.assertEqual(sum(limits.values()), 1)
+
+    def testTimeout(self):
+        results, limits = self.runCases(("slow", "ok"), ["--limit-cpu=10"])
+        self.assertEqual(results["slow"][0], "error")
+        self.assertEqual(results["ok"][0], "passed")
+        self.assertEqual(limits["timeout"], 1)
+        self.assertEqual(sum(limits.values()), 1)
+        self.assertNoneLeft()
+
+    def testOutput(self):
+        results, limits = self.runCases(("output", "ok"),
+                                        ["--max-output=1K"])
+        self.assertEqual(results["output"][0], "error")
+        self.assertEqual(results["ok"][0], "passed")
+        self.assertEqual(limits["output"], 1)
+        self.assertEqual(sum(limits.values()), 1)
+
+    def testGenerous(self):
+        results, limits = self.runCases(
+            CASES.keys() - {"spin", "slow"},
+            ["--limit-cpu=30", "--limit-files=100", "--limit-memory=64G",
+             "--max-output=1M", "--jobs=2"])
+        self.assertEqual({ name: result for name, (result, _) in
+                           results.items() },
+                         dict(files="passed", output="passed", ok="passed"))
+        self.assertEqual(sum(limits.values()), 0)
+
+if __name__ == "__main__":
+    unittest.main()
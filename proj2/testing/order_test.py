@@ -0,0 +1,74 @@
+"""Checks tester.py's --order, which runs the longest tests or the most
+recently failed tests first, and --maxfail, which skips the gitlet
+commands of the tests after a given number have failed.
+
+Usage: python3 order_test.py"""
+
+import unittest
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from directives_test import makeTests, runTester
+
+CASES = {
+    "a_quick": "> echo hello\nhello\n<<<\n",
+    "b_wrong": "> echo hello\ngoodbye\n<<<\n",
+    "c_long": "> sleep 0.3\n<<<\n",
+    "d_files": "G f.txt 100 s\nE f.txt\n",
+    "e_middling": "> sleep 0.15\n<<<\n",
+    "f_wrong": "> echo hello\ngoodbye\n<<<\n",
+}
+
+class OrderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp(prefix="order")
+        self.names = makeTests(self.dir, CASES)
+        self.files = sorted(self.names)
+
+    def tearDown(self):
+        rmtree(self.dir, ignore_errors=True)
+
+    def results(self, *options):
+        """The names and results of the tests, in the order run, with the
+        cache directory and OPTIONS."""
+        report = runTester(self.dir, self.files,
+                           ["--cachedir=" + join(self.dir, "cache"),
+                            "--no-cache"] + list(options))
+        return [(self.names[info["file"]], info["result"])
+                for info in report["tests"]]
+
+    def testGiven(self):
+        self.assertEqual([name for name, result in self.results()],
+                         sorted(CASES))
+
+    def testLongest(self):
+        self.results()
+        order = [name for name, result in self.results("--order=longest")]
+        self.assertEqual(order[:2], ["c_long", "e_middling"])
+
+    def testFailed(self):
+        self.results()
+        del self.files[5]
+        with open(join(self.dir, "b_wrong.in"), 'w') as out:
+            out.write(CASES["a_quick"])
+        with open(join(self.dir, "d_files.in"), 'w') as out:
+            out.write("E nothing.txt\n")
+        self.assertEqual(self.results("--order=failed")[0],
+                         ("b_wrong", "passed"))
+        self.assertEqual(self.results("--order=failed")[:2],
+                         [("d_files", "error"), ("b_wrong", "passed")])
+
+    def testMaxfail(self):
+        self.assertEqual(self.results("--maxfail=1"),
+                         [("a_quick", "passed"), ("b_wrong", "error"),
+                          ("c_long", "skipped"), ("d_files", "passed"),
+                          ("e_middling", "skipped"), ("f_wrong", "skipped")])
+        self.assertEqual(
+            sorted(self.results("--maxfail=2", "--jobs=3")),
+            [("a_quick", "passed"), ("b_wrong", "error"),
+             ("c_long", "passed"), ("d_files", "passed"),
+             ("e_middling", "passed"), ("f_wrong", "error")])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+"""Matching program output against the regular expressions in <<<* blocks,
+used by the testers.
+
+Test authors' patterns, such as ${ARBLINES} and ${COMMIT_LOG} in
+definitions.inc, are full of (?:.|\n)* and (?:.|\n)*?, and a few of them
+in one block can keep Python's backtracking matcher busy for minutes
+before it decides that a long log does not match.  outputMatch therefore
+
+  * compiles each block once (compiled patterns are cached by their text),
+    rewriting (?:.|\n) as the equivalent, but much cheaper, (?s:.);
+  * matches against the output and, only if that fails and the output
+    ends in whitespace, against the output with its trailing whitespace
+    removed (as the testers always have, so that the groups captured are
+    the same), all within one time limit;
+  * gives up after a time limit, raising PatternTooExpensive.
+
+Python's re cannot count the steps it takes, but it does check for
+signals as it goes, so in the main thread the limit is enforced with
+SIGALRM.  Other threads (the testers' --jobs workers) cannot receive
+signals, so each hands its matches to a helper process of its own, which
+is killed (and replaced when next needed) if it runs over.  Where neither
+is possible (on Windows), matches are not limited."""
+
+import os, sys, re, signal, struct, threading, pickle, select
+from subprocess import Popen, PIPE, DEVNULL
+from os.path import abspath
+from functools import lru_cache
+
+# Default limit, in seconds, on the time taken to match one block.
+MATCH_LIMIT = 10.0
+
+# (?:.|\n), where it is not escaped.
+ANY_CHAR = re.compile(r'(?<!\\)((?:\\\\)*)\(\?:\.\|(?:\\n|\n)\)')
+
+HEADER = struct.Struct("!I")
+# This file, which helper processes run.
+HELPER = abspath(__file__)
+
+class PatternTooExpensive(Exception):
+    """Raised when matching a pattern takes longer than its limit."""
+
+@lru_cache(maxsize=256)
+def compiledPattern(expected):
+    """The compiled pattern that matches all of an output against the
+    <<<* block EXPECTED.  Raises re.error if EXPECTED is invalid."""
+    return re.compile(ANY_CHAR.sub(r'\1(?s:.)', expected) + r'\Z')
+
+def outputMatch(expected, actual, limit=MATCH_LIMIT):
+    """Returns the groups of the match of the <<<* block EXPECTED (without
+    trailing whitespace) against all of ACTUAL or, failing that, all of
+    ACTUAL without its trailing whitespace, or None if neither matches.
+    Raises re.error if EXPECTED is invalid, and PatternTooExpensive if
+    matching takes more than LIMIT seconds (no limit if LIMIT is None or
+    0)."""
+    pattern = compiledPattern(expected)
+    if not limit:
+        return fullMatch(pattern, actual)
+    if threading.current_thread() is threading.main_thread() \
+       and hasattr(signal, 'setitimer'):
+        return alarmMatch(pattern, actual, limit)
+    if os.name != 'nt':
+        try:
+            return helperMatch(expected, actual, limit)
+        except OSError:
+            pass
+    return fullMatch(pattern, actual)
+
+def fullMatch(pattern, actual):
+    """The groups of the match of the compiled PATTERN against all of
+    ACTUAL, or else against ACTUAL without trailing whitespace, or None."""
+    mat = pattern.match(actual)
+    if mat is None:
+        stripped = actual.rstrip()
+        if stripped != actual:
+            mat = pattern.match(stripped)
+    return None if mat is None else mat.groups()
+
+def _expired(signum, frame):
+    raise PatternTooExpensive()
+
+def alarmMatch(pattern, actual, limit):
+    """Match PATTERN against ACTUAL in the main thread, interrupting it
+    after LIMIT seconds."""
+    previous = signal.signal(signal.SIGALRM, _expired)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, limit)
+        return fullMatch(pattern, actual)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+# The helper process of each thread.
+_helpers = threading.local()
+
+def helperMatch(expected, actual, limit):
+    """Match EXPECTED against ACTUAL in this thread's helper process,
+    killing it after LIMIT seconds.  Raises OSError if the helper
+    fails."""
+    helper = getattr(_helpers, 'proc', None)
+    if helper is None or helper.poll() is not None:
+        helper = _helpers.proc = \
+            Popen([sys.executable, HELPER],
+                  stdin=PIPE, stdout=PIPE, stderr=DEVNULL)
+    request = pickle.dumps((expected, actual))
+    failed = True
+    try:
+        helper.stdin.write(HEADER.pack(len(request)) + request)
+        helper.stdin.flush()
+        ready, _, _ = select.select([helper.stdout], [], [], limit)
+        if not ready:
+            failed = False
+        else:
+            header = helper.stdout.read(HEADER.size)
+            if len(header) == HEADER.size:
+                ok, result = pickle.loads(
+                    helper.stdout.read(HEADER.unpack(header)[0]))
+                if not ok:
+                    raise re.error(result)
+                return result
+    except (OSError, ValueError, EOFError, pickle.PickleError):
+        pass
+    helper.kill()
+    helper.wait()
+    _helpers.proc = None
+    if failed:
+        raise OSError("pattern helper failed")
+    raise PatternTooExpensive()
+
+def serve():
+    """Answer the requests of helperMatch on the standard input."""
+    inp, out = sys.stdin.buffer, sys.stdout.buffer
+    while True:
+        header = inp.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        expected, actual = pickle.loads(inp.read(HEADER.unpack(header)[0]))
+        try:
+            reply = (True, fullMatch(compiledPattern(expected), actual))
+        except re.error as excp:
+            reply = (False, str(excp))
+        reply = pickle.dumps(reply)
+        out.write(HEADER.pack(len(reply)) + reply)
+        out.flush()
+
+if __name__ == "__main__":
+    serve()
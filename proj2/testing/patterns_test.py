@@ -0,0 +1,99 @@
+"""Checks patterns.outputMatch, with and without time limits, in the main
+thread and in others, and tester.py's report of a pattern that takes too
+long to match.
+
+Usage: python3 patterns_test.py"""
+
+import re, threading, unittest
+from time import perf_counter
+from patterns import outputMatch, PatternTooExpensive
+from directives_test import runTests
+
+# A pattern that takes Python's matcher exponential time to fail on a
+# line of a's, and such a line.
+EXPENSIVE = r"(?:a|a)*b"
+AS = "a" * 40
+
+def inThread(func, *args):
+    """The result of FUNC(*ARGS), called in another thread, or the
+    exception it raised."""
+    outcome = []
+    def run():
+        try:
+            outcome.append(func(*args))
+        except Exception as excp:
+            outcome.append(excp)
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    return outcome[0]
+
+class OutputMatchTest(unittest.TestCase):
+
+    def testGroups(self):
+        out = "commit abc123\nmore\nlines\n"
+        for limit in None, 5:
+            with self.subTest(limit=limit):
+                self.assertEqual(
+                    outputMatch(r"commit ([0-9a-f]+)\n(?:.|\n)*", out, limit),
+                    ("abc123",))
+                self.assertEqual(
+                    inThread(outputMatch, r"commit ([0-9a-f]+)\n(?:.|\n)*",
+                             out, limit), ("abc123",))
+
+    def testWhole(self):
+        self.assertIsNone(outputMatch("abc", "abcd"))
+        self.assertIsNone(outputMatch("bcd", "abcd"))
+        self.assertEqual(outputMatch("abc", "abc\n\n"), ())
+        self.assertEqual(outputMatch(r"(abc\s*)", "abc \n"), ("abc \n",))
+        self.assertIsNone(inThread(outputMatch, "abc", "abcd"))
+        self.assertEqual(inThread(outputMatch, "abc", "abc\n\n"), ())
+
+    def testAnyChar(self):
+        self.assertEqual(outputMatch(r"a(?:.|\n)*b", "a\n\nb"), ())
+        self.assertEqual(outputMatch(r"x\\(?:.|\n)*", "x\\y\nz"), ())
+        self.assertIsNone(outputMatch(r"a(?:.|\n)b", "a\n\nb"))
+
+    def testBadPattern(self):
+        with self.assertRaises(re.error):
+            outputMatch("(", "x")
+        self.assertIsInstance(inThread(outputMatch, "(", "x"), re.error)
+
+    def testMainThreadLimit(self):
+        start = perf_counter()
+        with self.assertRaises(PatternTooExpensive):
+            outputMatch(EXPENSIVE, AS, 0.2)
+        self.assertLess(perf_counter() - start, 5)
+
+    def testWorkerLimit(self):
+        def twice():
+            start = perf_counter()
+            try:
+                outputMatch(EXPENSIVE, AS, 0.2)
+                first = None
+            except PatternTooExpensive as excp:
+                first = excp
+            # The helper killed above must be replaced.
+            return first, perf_counter() - start, \
+                outputMatch("(a+)", AS, 5)
+        first, elapsed, second = inThread(twice)
+        self.assertIsInstance(first, PatternTooExpensive)
+        self.assertLess(elapsed, 5)
+        self.assertEqual(second, (AS,))
+
+    def testTesterReports(self):
+        cases = {
+            "slow{}".format(k): ("> echo {}\n{}\n<<<*\n"
+                                 .format(AS, EXPENSIVE))
+            for k in range(3)
+        }
+        for options in [[], ["--jobs=3"]]:
+            results = runTests(cases, options=["--match-limit=0.2"] + options)
+            for name in cases:
+                with self.subTest(test=name, options=options):
+                    self.assertEqual(results[name],
+                                     ("failed",
+                                      "pattern too expensive (over 0.2 s)"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Checks that tester.py --share-prefixes, which runs the instructions that
+begin several tests once, gives the same results as running each test on
+its own.
+
+Usage: python3 prefix_test.py"""
+
+import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
+from directives_test import makeTests, runTester, outcomes
+
+PREFIX = "G a.txt 100 s1\n> echo one\none\n<<<\nD X \"x\"\n"
+CASES = {
+    "alone": "> echo alone\nalone\n<<<\n",
+    "prefix": PREFIX,
+    "longer": PREFIX + "> cat a.txt\n(?s:.*)\n<<<*\n",
+    "sibling": PREFIX + "G b.txt 10 s2\n= a.txt s1\nE b.txt\n",
+    "isolated": PREFIX + "* b.txt\n= a.txt s1\n",
+    "subdir": PREFIX + "C sub\nG a.txt 10 s2\nC\n= a.txt s1\n= sub/a.txt s2\n",
+    "defined": PREFIX + "> echo ${X}\nx\n<<<\n",
+    "wrong": PREFIX + "> echo two\nsomething else\n<<<\n",
+    "after": PREFIX + "> echo two\nsomething else\n<<<\n= a.txt s1\n",
+    "missing": PREFIX + "E nothing.txt\n",
+    "faulty": PREFIX + "Q nonsense\n",
+    "differs": "G a.txt 100 s3\n> echo one\none\n<<<\n= a.txt s1\n",
+}
+FILES = { "s1": (100, "s1"), "s2": (10, "s2") }
+
+class SharedPrefixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp(prefix="prefixes")
+        self.names = makeTests(self.dir, CASES, FILES)
+
+    def tearDown(self):
+        rmtree(self.dir, ignore_errors=True)
+
+    def outcomes(self, *options):
+        return outcomes(runTester(self.dir, self.names,
+                                  ["--cachedir=", "--no-cache"]
+                                  + list(options)), self.names)
+
+    def testSameResults(self):
+        unshared = self.outcomes()
+        self.assertEqual(unshared["sibling"][0], "passed")
+        self.assertEqual(unshared["longer"][0], "passed")
+        self.assertEqual(unshared["wrong"][0], "error")
+        self.assertEqual(unshared["faulty"][0], "failed")
+        for options in [["--share-prefixes"],
+                        ["--share-prefixes", "--jobs=3"]]:
+            with self.subTest(options=options):
+                self.assertEqual(self.outcomes(*options), unshared)
+
+if __name__ == "__main__":
+    unittest.main()
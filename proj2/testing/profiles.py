@@ -0,0 +1,196 @@
+"""Profiles of gitlet commands taken with Java Flight Recorder, used by
+tester.py with --profile.
+
+A Profiler gives each profiled command the JVM options that make it
+record execution and allocation samples (JFR's "profile" settings) in a
+file of its own, in the Profiler's directory.  When the tests are done,
+summarize reads all the recordings with the JDK's jfr tool (once for all
+of them, since JFR files can be concatenated, and file by file only if
+that fails) and writes
+
+  * PREFIX.txt, the methods in which most samples were taken, both in the
+    method itself and in it or the methods it called, and the classes and
+    methods that allocated the most (as estimated from JFR's allocation
+    samples), and
+  * PREFIX.collapsed, the number of samples of each distinct stack, one
+    per line, as "ROOT;...;LEAF COUNT", the input to flame graph tools
+    such as flamegraph.pl and speedscope."""
+
+import json, threading
+from subprocess import run, PIPE, DEVNULL
+from collections import Counter
+from os import listdir, remove
+from os.path import dirname, exists, join, realpath
+from shutil import which
+
+# Methods and classes listed in each table of the summary.
+TOP = 25
+SAMPLE_EVENTS = ("jdk.ExecutionSample",)
+ALLOCATION_EVENTS = ("jdk.ObjectAllocationSample",
+                     "jdk.ObjectAllocationInNewTLAB",
+                     "jdk.ObjectAllocationOutsideTLAB")
+# The size of the allocations represented by each kind of allocation event.
+ALLOCATION_WEIGHTS = ("weight", "tlabSize", "allocationSize")
+
+class Profiler:
+    """Records profiles of the gitlet commands whose subcommands are in
+    SUBCOMMANDS (all of them if it is None) in directory DIR, using the
+    JDK whose java command is JAVA."""
+
+    def __init__(self, dir, subcommands, java):
+        self.dir = dir
+        self.subcommands = subcommands
+        self.jfr = jfrCommand(java)
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def wanted(self, cmnd):
+        """True iff gitlet command CMND is to be profiled."""
+        return self.subcommands is None \
+            or (cmnd.split() or [""])[0] in self.subcommands
+
+    def options(self, name):
+        """The JVM options that record a profile in a new file named after
+        NAME."""
+        with self.lock:
+            self.count += 1
+            path = join(self.dir, "{}-{}.jfr".format(name, self.count))
+        return ["-XX:StartFlightRecording=filename={},settings=profile,"
+                "dumponexit=true".format(path),
+                "-Xlog:jfr+startup=error"]
+
+    def recordings(self):
+        return sorted(join(self.dir, name) for name in listdir(self.dir)
+                      if name.endswith(".jfr"))
+
+    def summarize(self, prefix, keep=False):
+        """Write the summary of the recordings so far to PREFIX.txt and
+        PREFIX.collapsed, and delete the recordings unless KEEP.  Returns
+        the number of recordings read, or None if there is no jfr tool."""
+        recordings = self.recordings()
+        if self.jfr is None:
+            return None
+        profile = Profile()
+        read = 0
+        combined = join(self.dir, "all.jfr-combined")
+        with open(combined, 'wb') as out:
+            for name in recordings:
+                with open(name, 'rb') as inp:
+                    out.write(inp.read())
+        if profile.read(self.jfr, combined):
+            read = len(recordings)
+        else:
+            for name in recordings:
+                read += profile.read(self.jfr, name)
+        remove(combined)
+        if not keep:
+            for name in recordings:
+                remove(name)
+        with open(prefix + ".txt", 'w') as out:
+            out.write(profile.report(read, self.subcommands))
+        with open(prefix + ".collapsed", 'w') as out:
+            for stack, count in sorted(profile.stacks.items()):
+                out.write("{} {}\n".format(stack, count))
+        return read
+
+class Profile:
+    """Samples aggregated from JFR recordings."""
+
+    def __init__(self):
+        self.self_samples = Counter()
+        self.total_samples = Counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self.allocated = Counter()
+        self.allocators = Counter()
+
+    def read(self, jfr, recording):
+        """Add the samples in the file RECORDING, read with the jfr command
+        JFR.  Returns true iff successful."""
+        proc = run([jfr, "print", "--json", "--events",
+                    ",".join(SAMPLE_EVENTS + ALLOCATION_EVENTS), recording],
+                   stdin=DEVNULL, stdout=PIPE, stderr=DEVNULL)
+        if proc.returncode != 0:
+            return False
+        try:
+            events = json.loads(proc.stdout)["recording"]["events"]
+        except (ValueError, KeyError, TypeError):
+            return False
+        for event in events:
+            values = event.get("values", {})
+            frames = stackFrames(values.get("stackTrace"))
+            if event.get("type") in SAMPLE_EVENTS:
+                if not frames:
+                    continue
+                self.samples += 1
+                self.self_samples[frames[0]] += 1
+                for method in set(frames):
+                    self.total_samples[method] += 1
+                self.stacks[";".join(reversed(frames))] += 1
+            else:
+                size = next((values[key] for key in ALLOCATION_WEIGHTS
+                             if values.get(key)), 0)
+                self.allocated[className(values.get("objectClass"))] += size
+                if frames:
+                    self.allocators[frames[0]] += size
+        return True
+
+    def report(self, recordings, subcommands):
+        """The text of the summary of this profile, taken from RECORDINGS
+        recordings of the gitlet subcommands SUBCOMMANDS (None for all)."""
+        lines = ["Profile of {} gitlet commands ({}): {} execution samples, "
+                 "{} sampled bytes allocated.".format(
+                     recordings, ", ".join(sorted(subcommands or ["all"])),
+                     self.samples, sum(self.allocated.values())),
+                 "",
+                 "Hot methods, by samples in the method itself:",
+                 "   self%  total%  method"]
+        for method, count in self.self_samples.most_common(TOP):
+            lines.append("  {:5.1f}%  {:5.1f}%  {}".format(
+                percent(count, self.samples),
+                percent(self.total_samples[method], self.samples), method))
+        lines += ["", "Hot methods, by samples in the method and those it "
+                  "calls:", "  total%  method"]
+        for method, count in self.total_samples.most_common(TOP):
+            lines.append("  {:5.1f}%  {}".format(
+                percent(count, self.samples), method))
+        total = sum(self.allocated.values())
+        for title, heading, table in (
+                ("class allocated", "class", self.allocated),
+                ("allocating method", "method", self.allocators)):
+            lines += ["", "Allocation, by {}:".format(title),
+                      "         bytes       %  {}".format(heading)]
+            for name, size in table.most_common(TOP):
+                lines.append("  {:12d}  {:5.1f}%  {}".format(
+                    size, percent(size, total), name))
+        return "\n".join(lines) + "\n"
+
+def percent(count, total):
+    return 100.0 * count / total if total else 0.0
+
+def className(cls):
+    """The name of the class described by CLS, a class in jfr's JSON."""
+    if not isinstance(cls, dict):
+        return "?"
+    return str(cls.get("name", "?")).replace("/", ".")
+
+def stackFrames(trace):
+    """The methods of the stack trace TRACE (in jfr's JSON), innermost
+    first, as CLASS.METHOD."""
+    if not isinstance(trace, dict):
+        return []
+    return ["{}.{}".format(className(frame["method"].get("type")),
+                           frame["method"].get("name", "?"))
+            for frame in trace.get("frames", [])
+            if isinstance(frame, dict)
+            and isinstance(frame.get("method"), dict)]
+
+def jfrCommand(java):
+    """The jfr tool of the JDK whose java command is JAVA, or None if there
+    is none."""
+    path = which(java)
+    if path:
+        jfr = join(dirname(realpath(path)), "jfr")
+        if exists(jfr):
+            return jfr
+    return which("jfr")
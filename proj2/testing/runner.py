@@ -1,12 +1,23 @@
-import sys, re
+import sys, re, threading, hashlib
 from subprocess import \
     check_output, PIPE, STDOUT, DEVNULL, CalledProcessError, TimeoutExpired
 from os.path import abspath, basename, dirname, exists, join, splitext, isdir
 from getopt import getopt, GetoptError
-from os import chdir, environ, getcwd, mkdir, remove
-from shutil import copyfile, rmtree
+from os import environ, getcwd, mkdir, makedirs, remove
+from shutil import rmtree
 from math import log
 from glob import glob
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from warmjvm import WarmPool, WarmJVMError, java_argv
+from spawn import directArgv
+from javacache import CompileCache, CompileServer
+from watch import Watcher
+from patterns import outputMatch, PatternTooExpensive, MATCH_LIMIT
+from distance import editDistance
+from fixtures import FixtureStore
+from tester import compileTest, substituted, TestState, checkTree, \
+     generateFile, fileSize
 
 SHORT_USAGE = """\
 Usage: python3 runner.py OPTIONS TEST.in ...
@@ -19,7 +30,21 @@ Usage: python3 runner.py OPTIONS TEST.in ...
                       files referenced by + and =.
        --tolerance=N  Set the maximum allowed edit distance between program
                       output and expected output to N (default 3).
+       --match-limit=SECS  Give up matching the output of a command
+                      against a <<<* pattern after SECS seconds, reporting
+                      the pattern as too expensive (default 10; 0 for
+                      no limit).
        --verbose      Print extra information about execution.
+       --jobs=N       Run up to N tests concurrently (default 1).  Output
+                      for each test is still reported in order.
+       --warm         Run gitlet commands in a long-lived JVM (one per test
+                      directory and job) rather than starting a new JVM
+                      for each command.
+       --shell        Run every gitlet command through the shell, rather
+                      than directly when its operands need only quoting.
+       --javac-server Compile with a javac that stays up between runs.
+       --watch        After running the tests, wait for changes to gitlet's
+                      sources or the tests and rerun the affected tests.
 """
 
 USAGE = SHORT_USAGE + """\
@@ -68,16 +93,55 @@ The instructions each have one of the following forms:
    E NAME
           Check that file or directory NAME exists, and report an error if it
           does not.
+   H DIGEST [DIR]
+          Check that directory DIR (default the current test directory) and
+          all it contains, except .gitlet directories, have digest DIGEST
+          (as printed by treedigest.py; a prefix of 8 or more hex digits
+          will do), and report an error, with the actual digest, if not.
+          H* DIGEST [DIR] includes the .gitlet directories.
    D VAR "VALUE"
           Defines the variable VAR to have the literal value VALUE.  VALUE is
           taken to be a raw Python string (as in r"VALUE").  Substitutions are
           first applied to VALUE.
+   R VAR N
+   ...
+   R
+          Execute the instructions between the two R lines N times, with
+          ${VAR} defined as 1, 2, ..., N in turn.  Blocks may be nested.
+          The instructions are not copied for each repetition, so even
+          very long repetitions take little memory.
+   G NAME SIZE SEED
+          Create a file named NAME containing SIZE bytes (SIZE may end in
+          K, M, or G) of lines of random lowercase letters, which are
+          always the same for a given SEED.  The file is written in pieces,
+          so that its size is not limited by memory.
 
 For each TEST.in, reports at most one error.  Without the --show option,
 simply indicates tests passed and failed.  If N is postive, also prints details
 of the first N failing tests. With --show=all, shows details of all failing
 tests.  With --keep, keeps the directories created for the tests (with names
-TEST.dir).
+TEST.dir).  With --jobs=N, up to N tests run at once, each in its own
+directory; their output is buffered and printed in the order the tests
+were given.  With --warm, each ">" command is run by WarmDriver in a JVM
+that stays up between the commands of a test.  The JVM is started in the
+test's directory, since Java resolves relative file names against the
+directory a JVM started in, whatever user.dir says; a JVM is replaced
+when its job moves on to another directory.  A command that crashes that
+JVM or times out is rerun in a JVM of its own.
+
+Before running the tests, compiles only the gitlet sources that changed
+since the last run, and those that refer to them; if nothing changed, javac
+is not run at all (see javacache.py).  The classes and the record of what
+was compiled are kept in .testcache.  With --javac-server, javac runs in
+a JVM that stays up (until it has been idle for 15 minutes) to serve later
+runs as well.
+
+With --watch, the runner does not exit after running the tests.  Instead,
+it waits for a change to a gitlet source file, a TEST.in or file it
+includes, or a file in the src directory, then recompiles what needs it
+and reruns the tests, and so on until interrupted.  If any class was
+recompiled, all the tests are rerun; otherwise, only those whose files
+changed and those that did not pass last time.
 
 When finished, reports number of tests passed and failed, and the number of
 faulty TEST.in files."""
@@ -110,7 +174,14 @@ That's what mine looks like. Go back to lab1 if you are still having issues"""
 
 JAVA_COMMAND = "java"
 CAPERS_COMMAND = "gitlet.Main"
-JAVAC_COMMAND = "javac -d ."
+# Where the gitlet classes are compiled to, the record of the sources
+# compiled there (see javacache.py), and where the compile server for
+# --javac-server keeps its files.  The classes are kept between runs, so
+# that unchanged sources need not be compiled again.
+CLASS_DIR = join(".testcache", "classes")
+COMPILE_CACHE = join(".testcache", "javac.json")
+COMPILE_SERVER_DIR = join(".testcache", "javac-server")
+JAVAC_COMMAND = "javac -d " + CLASS_DIR
 JVM_COMMAND = "-agentlib:jdwp=transport=dt_socket,server=y,suspend=y,address=*:5005"
 TIMEOUT = 10
 DEBUG = False
@@ -138,14 +209,34 @@ def Usage():
     print(SHORT_USAGE, file=sys.stderr)
     sys.exit(1)
 
-Mat = None
+# Per-thread state: the last Match result, and (when running tests in
+# parallel) the buffer that receives a test's output.
+_tls = threading.local()
+
 def Match(patn, s):
-    global Mat
-    Mat = re.match(patn, s)
-    return Mat
+    _tls.mat = re.match(patn, s)
+    return _tls.mat
 
 def Group(n):
-    return Mat.group(n)
+    return _tls.mat.group(n)
+
+class ThreadOutput:
+    """A stand-in for sys.stdout that sends output written by a thread to
+    that thread's buffer, if it has one, and otherwise to STREAM."""
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        buffer = getattr(_tls, 'buffer', None)
+        if buffer is None:
+            return self.stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
 
 def contents(filename):
     try:
@@ -154,22 +245,14 @@ def contents(filename):
     except FileNotFoundError:
         return None
 
-def editDistance(s1, s2):
-    dist = [list(range(len(s2) + 1))] + \
-           [ [i] + [ 0 ] * len(s2) for i in range(1, len(s1) + 1) ]
-    for i in range(1, len(s1) + 1):
-        for j in range(1, len(s2) + 1):
-            dist[i][j] = min(dist[i-1][j] + 1,
-                             dist[i][j-1] + 1,
-                             dist[i-1][j-1] + (s1[i-1] != s2[j-1]))
-    return dist[len(s1)][len(s2)]
-
-def nextCommand(full_cmnd, timeout):
-    return check_output(full_cmnd, shell=True, universal_newlines=True,
-                        stdin=DEVNULL, stderr=STDOUT, timeout=timeout)
-def stepIntoCommand(full_cmnd):
+def nextCommand(full_cmnd, dir, timeout):
+    argv = direct and directArgv(full_cmnd)
+    return check_output(argv or full_cmnd, shell=not argv,
+                        universal_newlines=True, stdin=DEVNULL,
+                        stderr=STDOUT, timeout=timeout, cwd=dir)
+def stepIntoCommand(full_cmnd, dir):
     out = check_output(full_cmnd, shell=True, universal_newlines=True,
-                       stdin=DEVNULL, stderr=STDOUT, timeout=None)
+                       stdin=DEVNULL, stderr=STDOUT, cwd=dir)
     return out.split("\n", 1)[1]
 
 def createTempDir(base):
@@ -195,26 +278,32 @@ def doDelete(name, dir):
 def doCopy(dest, src, dir):
     try:
         doDelete(dest, dir)
-        copyfile(join(src_dir, src), join(dir, dest))
+        fixture_store.copy(src, join(dir, dest))
     except OSError:
         raise ValueError("file {} could not be copied to {}".format(src, dest))
 
-def doCompile(target):
-    out = ""
-    try:
-        full_cmnd = "{} {}".format(JAVAC_COMMAND, target)
-        out = check_output(full_cmnd, shell=True, universal_newlines=True,
-                           stdin=DEVNULL, stderr=STDOUT)
-        return "OK", out
-    except CalledProcessError as excp:
-        return ("javac exited with code {}".format(excp.args[0]),
-                excp.output)
+def doCompile(sources):
+    """Compile those of SOURCES that changed since the last run, and those
+    that depend on them.  Returns a status message, javac's output, and
+    the list of sources compiled."""
+    server = None
+    if javac_server:
+        server = CompileServer(COMPILE_SERVER_DIR, java_argv(JAVA_COMMAND),
+                               java_argv(JAVAC_COMMAND))
+    cache = CompileCache(COMPILE_CACHE, java_argv(JAVAC_COMMAND),
+                         environ.get('CLASSPATH', ''), server)
+    makedirs(CLASS_DIR, exist_ok=True)
+    status, out, compiled = cache.compile(sources)
+    if verbose:
+        print("Compiled {} of {} sources.".format(len(compiled),
+                                                  len(sources)))
+    if status != 0:
+        return "javac exited with code {}".format(status), out, compiled
+    return "OK", out, compiled
 
 def doExecute(cmnd, dir, timeout):
-    here = getcwd()
     out = ""
     try:
-        chdir(dir)
         full_cmnd = "{} {} {}".format(JAVA_COMMAND, CAPERS_COMMAND, cmnd)
 
         if DEBUG:
@@ -225,16 +314,25 @@ def doExecute(cmnd, dir, timeout):
                 next_cmd = input("> ").strip().lower()
 
             if next_cmd == "n":
-                out = nextCommand(full_cmnd, timeout)
+                out = nextCommand(full_cmnd, dir, timeout)
             elif next_cmd == "s":
                 full_cmnd = "{} {} {} {}".format(JAVA_COMMAND, JVM_COMMAND, CAPERS_COMMAND, cmnd)
                 print(f"Ready to debug the command `gitlet {cmnd}`")
                 print("Open IntelliJ and hit the \"Debug\" button. Don't forget to set a breakpoint!")
-                out = stepIntoCommand(full_cmnd)
+                out = stepIntoCommand(full_cmnd, dir)
             elif next_cmd == "q":
                 return "User Exit", None
         else:
-            out = nextCommand(full_cmnd, timeout)
+            out = None
+            if warm_pool:
+                try:
+                    status, out = warm_pool.run(cmnd, dir, timeout)
+                    if status != 0:
+                        raise CalledProcessError(status, full_cmnd, out)
+                except WarmJVMError:
+                    out = None
+            if out is None:
+                out = nextCommand(full_cmnd, dir, timeout)
 
         if superverbose:
             print(out)
@@ -245,21 +343,12 @@ def doExecute(cmnd, dir, timeout):
                 excp.output)
     except TimeoutExpired:
         return "timeout", None
-    finally:
-        chdir(here)
-
-def canonicalize(s):
-    if s is None:
-        return None
-    return re.sub('\r', '', s)
 
 def fileExists(f, dir):
     return exists(join(dir, f))
 
 def correctFileOutput(name, expected, dir):
-    userData = canonicalize(contents(join(dir, name)))
-    stdData = canonicalize(contents(join(src_dir, expected)))
-    return userData == stdData
+    return fixture_store.matches(join(dir, name), expected)
 
 def correctProgramOutput(expected, actual, last_groups, is_regexp):
     expected = re.sub(r'[ \t]+\n', '\n', '\n'.join(expected))
@@ -270,17 +359,26 @@ def correctProgramOutput(expected, actual, last_groups, is_regexp):
     last_groups[:] = (actual,)
     if is_regexp:
         try:
-            if not Match(expected.rstrip() + r"\Z", actual) \
-                    and not Match(expected.rstrip() + r"\Z", actual.rstrip()):
-                return False
-        except:
+            groups = outputMatch(expected.rstrip(), actual, match_limit)
+        except PatternTooExpensive:
+            raise ValueError("pattern too expensive (over {:g} s)"
+                             .format(match_limit))
+        except re.error:
             raise ValueError("bad pattern")
-        last_groups[:] += Mat.groups()
-    elif editDistance(expected.rstrip(), actual.rstrip()) > output_tolerance:
+        if groups is None:
+            return False
+        last_groups[:] += groups
+    elif editDistance(expected.rstrip(), actual.rstrip(),
+                      output_tolerance) > output_tolerance:
         return False
     return True
 
 def reportDetails(test, included_files, line_num):
+    if getattr(_tls, 'buffer', None) is not None:
+        # Running in a worker: leave the decision to the main thread, which
+        # sees the tests' results in order.
+        _tls.details = (test, included_files, line_num)
+        return
     if show is None:
         return
     if show <= 0:
@@ -305,142 +403,268 @@ def chop_nl(s):
     else:
         return s
 
-def line_reader(f, prefix):
-    n = 0
-    try:
-        with open(f) as inp:
-            while True:
-                L = inp.readline()
-                if L == '':
-                    return
-                n += 1
-                included_file = yield (prefix + str(n), L)
-                if included_file:
-                    yield None
-                    yield from line_reader(included_file, prefix + str(n) + ".")
-    except FileNotFoundError:
-        raise ValueError("file {} not found".format(f))
+def doStep(state, instr):
+    """Execute the compiled instruction INSTR (see tester.compileTest) in
+    STATE, a tester.TestState.  Returns None if it succeeds, and otherwise
+    a description of the error ("User Exit" if the user quit --debug)."""
+    line_num, _, _, op, _ = instr
+    state.line_num = line_num
+    text, args = substituted(state, instr)
+    if verbose:
+        print("+ {}".format(text))
+    if op == 'C':
+        state.sub = args[0]
+        if not exists(state.cdir):
+            mkdir(state.cdir)
+    elif op == 'T':
+        try:
+            state.timeout = float(args[0])
+        except:
+            ValueError("bad time: {}".format(text))
+    elif op == '+':
+        doCopy(args[0], args[1], state.cdir)
+    elif op == '-':
+        doDelete(args[0], state.cdir)
+    elif op == '>':
+        cmnd, expected, is_regexp = args
+        msg, out = doExecute(cmnd, state.cdir, state.timeout)
+        if verbose:
+            if out:
+                print(re.sub(r'(?m)^', '- ', chop_nl(out)))
+        if msg == "OK":
+            if not correctProgramOutput(expected, out, state.last_groups,
+                                        is_regexp):
+                msg = "incorrect output"
+        if msg != "OK":
+            return msg
+    elif op == '=':
+        if not correctFileOutput(args[0], args[1], state.cdir):
+            return "file {} has incorrect content".format(args[0])
+    elif op == '*':
+        if fileExists(args[0], state.cdir):
+            return "file {} present".format(args[0])
+    elif op == 'E':
+        if not fileExists(args[0], state.cdir):
+            return "file or directory {} not present".format(args[0])
+    elif op == 'H':
+        return checkTree(join(state.cdir, args[1]), *args)
+    elif op == 'D':
+        state.defns[args[0]] = args[1]
+    elif op == 'G':
+        generateFile(join(state.cdir, args[0]), fileSize(args[1]), args[2])
+    elif op == 'R':
+        var, count, body = args
+        try:
+            count = int(count)
+        except ValueError:
+            raise ValueError("bad repeat count: {}".format(count))
+        for k in range(1, count + 1):
+            state.defns[var] = str(k)
+            for instr in body:
+                msg = doStep(state, instr)
+                if msg is not None:
+                    return msg
+    return None
 
 def doTest(test):
-    last_groups = []
     base = splitext(basename(test))[0]
     print("{}:".format(base), end=" \n")
-    cdir = tmpdir = createTempDir(base)
+    program, included_files = compileTest(test)
+    state = TestState(createTempDir(base))
+    state.timeout = TIMEOUT
     if verbose:
-        print("Testing directory: {}".format(tmpdir))
-    timeout = TIMEOUT
-    defns = {}
-
-    def do_substs(L):
-        c = 0
-        L0 = None
-        while L0 != L and c < 10:
-            c += 1
-            L0 = L
-            L = re.sub(r'\$\{(.*?)\}', subst_var, L)
-        return L
-
-    def subst_var(M):
-        key = M.group(1)
-        if Match(r'\d+$', key):
-            try:
-                return last_groups[int(key)]
-            except IndexError:
-                raise ValueError("FAILED (nonexistent group: {{{}}})"
-                                 .format(key))
-        elif M.group(1) in defns:
-            return defns[M.group(1)]
-        else:
-            raise ValueError("undefined substitution: ${{{}}}".format(M.group(1)))
+        print("Testing directory: {}".format(state.tmpdir))
 
     try:
-        line_num = None
-        inp = line_reader(test, '')
-        included_files = []
-        while True:
-            line_num, line = next(inp, (line_num, ''))
-            if line == "":
-                print("OK")
-                return True
-            if not Match(r'\s*#', line):
-                line = do_substs(line)
-            if verbose:
-                print("+ {}".format(line.rstrip()))
-            if Match(r'\s*#', line) or Match(r'\s+$', line):
-                pass
-            elif Match(r'I\s+(\S+)', line):
-                inp.send(join(dirname(test), Group(1)))
-                included_files.append(Group(1))
-            elif Match(r'C\s*(\S*)', line):
-                if Group(1) == "":
-                    cdir = tmpdir
-                else:
-                    cdir = join(tmpdir, Group(1))
-                    if not exists(cdir):
-                        mkdir(cdir)
-            elif Match(r'T\s*(\S+)', line):
-                try:
-                    timeout = float(Group(1))
-                except:
-                    ValueError("bad time: {}".format(line))
-            elif Match(r'\+\s*(\S+)\s+(\S+)', line):
-                doCopy(Group(1), Group(2), cdir)
-            elif Match(r'-\s*(\S+)', line):
-                doDelete(Group(1), cdir)
-            elif Match(r'>\s*(.*)', line):
-                cmnd = Group(1)
-                expected = []
-                while True:
-                    line_num, L = next(inp, (line_num, ''))
-                    if L == '':
-                        raise ValueError("unterminated command: {}"
-                                         .format(line))
-                    L = L.rstrip()
-                    if Match(r'<<<(\*?)', L):
-                        is_regexp = Group(1)
-                        break
-                    expected.append(do_substs(L))
-                msg, out = doExecute(cmnd, cdir, timeout)
-                if verbose:
-                    if out:
-                        print(re.sub(r'(?m)^', '- ', chop_nl(out)))
-                if msg == "OK":
-                    if not correctProgramOutput(expected, out, last_groups,
-                                                is_regexp):
-                        msg = "incorrect output"
-                elif msg == "User Exit":
-                    print("Exiting Debug mode ...")
-                    break
-                if msg != 'OK':
-                    print("ERROR ({})".format(msg))
-                    reportDetails(test, included_files, line_num)
-                    return False
-            elif Match(r'=\s*(\S+)\s+(\S+)', line):
-                if not correctFileOutput(Group(1), Group(2), cdir):
-                    print("ERROR (file {} has incorrect content)"
-                          .format(Group(1)))
-                    reportDetails(test, included_files, line_num)
-                    return False
-            elif Match(r'\*\s*(\S+)', line):
-                if fileExists(Group(1), cdir):
-                    print("ERROR (file {} present)".format(Group(1)))
-                    reportDetails(test, included_files, line_num)
-                    return False
-            elif Match(r'E\s*(\S+)', line):
-                if not fileExists(Group(1), cdir):
-                    print("ERROR (file or directory {} not present)"
-                          .format(Group(1)))
-                    reportDetails(test, included_files, line_num)
-                    return False
-            elif Match(r'(?s)D\s*([a-zA-Z_][a-zA-Z_0-9]*)\s*"(.*)"\s*$', line):
-                defns[Group(1)] = Group(2)
-            else:
-                raise ValueError("bad test line at {}".format(line_num))
+        for instr in program:
+            msg = doStep(state, instr)
+            if msg == "User Exit":
+                print("Exiting Debug mode ...")
+                return None
+            elif msg is not None:
+                print("ERROR ({})".format(msg))
+                reportDetails(test, included_files, state.line_num)
+                return False
+        print("OK")
+        return True
     finally:
         if not keep:
-            cleanTempDir(tmpdir)
+            cleanTempDir(state.tmpdir)
         else:
-            print(f"\nDirectory state saved in {tmpdir}")
+            print(f"\nDirectory state saved in {state.tmpdir}")
+
+def runTest(test):
+    """Run TEST, returning "missing" if it does not exist, "passed" or
+    "error" according to its outcome, and "failed" if TEST itself is
+    faulty."""
+    try:
+        if not exists(test):
+            return "missing"
+        elif not doTest(test):
+            return "error"
+        return "passed"
+    except ValueError as excp:
+        print("FAILED ({})".format(excp.args[0]))
+        return "failed"
+
+def runBuffered(test):
+    """Run TEST in a worker thread, returning its result, its output, and
+    the arguments to reportDetails if it requested error details."""
+    _tls.buffer = StringIO()
+    _tls.details = None
+    try:
+        result = runTest(test)
+        return result, _tls.buffer.getvalue(), _tls.details
+    finally:
+        _tls.buffer = None
+
+# The result of the last run of each test, for --watch.
+last_results = {}
+
+def runTests(files, jobs):
+    """Run the tests in FILES using up to JOBS concurrent workers, printing
+    each test's output in order.  Returns the number of tests run, the
+    number with errors, and the number of faulty tests."""
+    global show
+    num_tests = len(files)
+    errs = 0
+    fails = 0
+
+    if jobs <= 1:
+        results = (runTest(test) for test in files)
+    else:
+        sys.stdout = ThreadOutput(sys.stdout)
+        pool = ThreadPoolExecutor(max_workers=jobs)
+        results = (future.result() for future in
+                   [pool.submit(runBuffered, test) for test in files])
+
+    try:
+        for test, result in zip(files, results):
+            if jobs > 1:
+                result, text, details = result
+                sys.stdout.write(text)
+                if details:
+                    reportDetails(*details)
+            last_results[test] = result
+            if result == "missing":
+                num_tests -= 1
+            elif result == "error":
+                errs += 1
+                if type(show) is int:
+                    show -= 1
+            elif result == "failed":
+                fails += 1
+    finally:
+        if jobs > 1:
+            pool.shutdown(cancel_futures=True)
+            sys.stdout = sys.stdout.stream
+    return num_tests, errs, fails
+
+def runAll(files):
+    """Run the tests in FILES and report the results.  Returns the exit
+    status for the runner."""
+    num_tests, errs, fails = runTests(files, jobs)
+
+    print()
+    print("Ran {} tests. ".format(num_tests), end="")
+    if errs == fails == 0:
+        print("All passed.")
+        return 0
+    else:
+        print("{} passed.".format(num_tests - errs - fails))
+        return 1
+
+def gitletSources():
+    return sorted(glob(join(gitlet_dir.strip('"'), "*.java")))
+
+def testInputs(test):
+    """The full names of TEST, the files it includes, and the src files it
+    copies or compares with (all of them, if a name has a substitution)."""
+    result = set()
+    pending = [abspath(test)]
+    while pending:
+        name = pending.pop()
+        if name in result:
+            continue
+        result.add(name)
+        try:
+            with open(name) as inp:
+                lines = inp.readlines()
+        except OSError:
+            continue
+        for line in lines:
+            mat = re.match(r'I\s+(\S+)', line)
+            if mat:
+                pending.append(abspath(join(dirname(test), mat.group(1))))
+            mat = re.match(r'[+=]\s*\S+\s+(\S+)', line)
+            if mat and '$' in mat.group(1):
+                result.update(glob(join(abspath(src_dir), '*')))
+            elif mat:
+                result.add(abspath(join(src_dir, mat.group(1))))
+    return result
+
+def inputsDigest(names):
+    """A digest of the names and contents of the files NAMES."""
+    digest = hashlib.sha1()
+    for name in sorted(names):
+        digest.update(name.encode())
+        try:
+            with open(name, 'rb') as inp:
+                digest.update(hashlib.sha1(inp.read()).digest())
+        except OSError:
+            digest.update(b"missing")
+    return digest.digest()
+
+def watchTests(files):
+    """Compile gitlet and run the tests in FILES, then wait for a change to
+    the gitlet sources, the tests, or the src files, and repeat with the
+    affected tests, until interrupted (see --watch)."""
+    global show
+    initial_show = show
+    sources_dir = abspath(gitlet_dir.strip('"'))
+    fixtures = abspath(src_dir)
+    digests = None
+    try:
+        while True:
+            inputs = { test: testInputs(test) for test in files }
+            names = set().union(*inputs.values())
+            def wanted(name):
+                return name in names or dirname(name) == fixtures \
+                    or (dirname(name) == sources_dir and name.endswith(".java"))
+            # Started before the run, so that edits made during it count.
+            watcher = Watcher([sources_dir, fixtures]
+                              + [dirname(name) for name in names], wanted)
+            try:
+                msg, out, compiled = doCompile(gitletSources())
+                if compiled:
+                    print("Compiled {}.".format(
+                        ", ".join(basename(name) for name in compiled)))
+                print(out, end="")
+                if msg != "OK":
+                    print("Your program failed to compile.")
+                else:
+                    current = { test: inputsDigest(inputs[test])
+                                for test in files }
+                    if digests is None or compiled:
+                        todo = files
+                    else:
+                        todo = [test for test in files
+                                if current[test] != digests.get(test)
+                                or last_results.get(test) != "passed"]
+                    digests = current
+                    show = initial_show
+                    if todo:
+                        runAll(todo)
+                    else:
+                        print("No tests affected.")
+                print("\nWatching for changes (interrupt to stop)...")
+                watcher.wait()
+            finally:
+                watcher.close()
+            print()
+    except KeyboardInterrupt:
+        print()
+        sys.exit(0)
 
 if __name__ == "__main__":
     show = None
@@ -451,12 +675,19 @@ if __name__ == "__main__":
     src_dir = 'src'
     gitlet_dir = join(dirname(abspath(getcwd())), "gitlet")
     output_tolerance = 0
+    match_limit = MATCH_LIMIT
+    jobs = 1
+    warm = False
+    direct = True
+    javac_server = False
+    watch = False
 
     try:
         opts, files = \
             getopt(sys.argv[1:], '',
                    ['show=', 'keep', 'lib=', 'verbose', 'src=',
-                    'tolerance=', 'superverbose', 'debug'])
+                    'tolerance=', 'match-limit=', 'superverbose', 'debug',
+                    'jobs=', 'warm', 'shell', 'javac-server', 'watch'])
         for opt, val in opts:
             if opt == '--show':
                 show = int(val)
@@ -470,11 +701,23 @@ if __name__ == "__main__":
                 verbose = True
             elif opt == "--tolerance":
                 output_tolerance = int(val)
+            elif opt == "--match-limit":
+                match_limit = float(val)
             elif opt == "--superverbose":
                 superverbose = True
             elif opt == "--debug":
                 DEBUG = True
                 TIMEOUT = 100000
+            elif opt == "--jobs":
+                jobs = int(val)
+            elif opt == "--warm":
+                warm = True
+            elif opt == "--shell":
+                direct = False
+            elif opt == "--javac-server":
+                javac_server = True
+            elif opt == "--watch":
+                watch = True
         if lib_dir is None:
             lib_dir = join(abspath(environ['REPO_DIR']),
                            "library-sp21/javalib")
@@ -486,6 +729,8 @@ if __name__ == "__main__":
         print(USAGE)
         sys.exit(0)
 
+    fixture_store = FixtureStore(src_dir)
+
     if not isdir(lib_dir):
         print(DIRECTORY_LAYOUT_ERROR.format("lib"))
         sys.exit(1)
@@ -500,53 +745,38 @@ if __name__ == "__main__":
     ON_WINDOWS = Match(r'.*\\', join('a', 'b'))
     if ON_WINDOWS:
         if ('CLASSPATH' in environ):
-            environ['CLASSPATH'] = "{};{};{}".format(abspath(getcwd()), lib_glob, environ['CLASSPATH'])
+            environ['CLASSPATH'] = "{};{};{}".format(abspath(CLASS_DIR), lib_glob, environ['CLASSPATH'])
         else:
-            environ['CLASSPATH'] = "{};{}".format(abspath(getcwd()), lib_glob)
+            environ['CLASSPATH'] = "{};{}".format(abspath(CLASS_DIR), lib_glob)
     else:
         if ('CLASSPATH' in environ):
-            environ['CLASSPATH'] = "{}:{}:{}".format(abspath(getcwd()), lib_glob, environ['CLASSPATH'])
+            environ['CLASSPATH'] = "{}:{}:{}".format(abspath(CLASS_DIR), lib_glob, environ['CLASSPATH'])
         else:
-            environ['CLASSPATH'] = "{}:{}".format(abspath(getcwd()), lib_glob)
+            environ['CLASSPATH'] = "{}:{}".format(abspath(CLASS_DIR), lib_glob)
         JAVA_COMMAND = 'exec ' + JAVA_COMMAND
         JAVAC_COMMAND = 'exec ' + JAVAC_COMMAND
 
-    compile_target = join(gitlet_dir, "*.java")
-    msg, output = doCompile(compile_target)
-    if output.find("error") >= 0:
-        print(output)
-        print("Your program failed to compile. Ran 0 tests.")
-        sys.exit(1)
+    if not watch:
+        msg, output, compiled = doCompile(gitletSources())
+        if output.find("error") >= 0:
+            print(output)
+            print("Your program failed to compile. Ran 0 tests.")
+            sys.exit(1)
+
+    warm_pool = None
+    if warm and not DEBUG:
+        warm_pool = WarmPool(JAVA_COMMAND, JAVAC_COMMAND, CAPERS_COMMAND)
 
     matching_files = []
     for path in files:
         matching_files += glob(path)
     files = matching_files
 
-    num_tests = len(files)
-    errs = 0
-    fails = 0
-
     print(DEBUG_MSG)
 
-    for test in files:
-        try:
-            if not exists(test):
-                num_tests -= 1
-            elif not doTest(test):
-                errs += 1
-                if type(show) is int:
-                    show -= 1
-        except ValueError as excp:
-            print("FAILED ({})".format(excp.args[0]))
-            fails += 1
-
-    cleanTempDir(join(abspath(getcwd()), "gitlet"))
+    if DEBUG:
+        jobs = 1
 
-    print()
-    print("Ran {} tests. ".format(num_tests), end="")
-    if errs == fails == 0:
-        print("All passed.")
-    else:
-        print("{} passed.".format(num_tests - errs - fails))
-        sys.exit(1)
+    if watch and not DEBUG:
+        watchTests(files)
+    sys.exit(runAll(files))
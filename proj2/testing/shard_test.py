@@ -0,0 +1,78 @@
+"""Checks that tester.py --shard=I/N divides the tests among the shards,
+balanced by their recorded durations, and that --merge combines the
+shards' reports.
+
+Usage: python3 shard_test.py"""
+
+import unittest
+from os.path import exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from directives_test import makeTests, runTester, outcomes
+
+CASES = {
+    "echo": "> echo hello\nhello\n<<<\n",
+    "wrong": "> echo hello\ngoodbye\n<<<\n",
+    "files": "G f.txt 100 s\nE f.txt\n",
+    "faulty": "Q nonsense\n",
+    "empty": "",
+}
+# Tests whose durations differ, for checking that shards are balanced.
+TIMED = {
+    "long": "> sleep 0.6\n<<<\n",
+    "short1": "> sleep 0.15\n<<<\n",
+    "short2": "> sleep 0.15\n<<<\n",
+    "quick": "> echo hello\nhello\n<<<\n",
+}
+
+class ShardTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp(prefix="shards")
+        self.names = makeTests(self.dir, CASES)
+
+    def tearDown(self):
+        rmtree(self.dir, ignore_errors=True)
+
+    def shards(self, count, *options):
+        """The outcomes of the tests in each of COUNT shards, run with
+        OPTIONS, whose reports are written to shardI.json."""
+        return [outcomes(runTester(self.dir, self.names,
+                                   ["--shard={}/{}".format(k, count)]
+                                   + list(options),
+                                   report="shard{}".format(k)),
+                         self.names)
+                for k in range(1, count + 1)]
+
+    def assertPartition(self, shards):
+        names = [name for shard in shards for name in shard]
+        self.assertEqual(sorted(names), sorted(self.names.values()))
+
+    def testPartition(self):
+        for count in 2, 7:
+            with self.subTest(count=count):
+                self.assertPartition(self.shards(count, "--cachedir="))
+
+    def testBalanced(self):
+        self.names = makeTests(self.dir, TIMED)
+        cache = "--cachedir=" + join(self.dir, "cache")
+        runTester(self.dir, self.names, [cache, "--no-cache"])
+        shards = self.shards(2, cache, "--no-cache")
+        self.assertPartition(shards)
+        self.assertIn(["long"], [list(shard) for shard in shards])
+
+    def testMerge(self):
+        whole = outcomes(runTester(self.dir, self.names, ["--cachedir="]),
+                         self.names)
+        self.shards(3, "--cachedir=")
+        merged = runTester(self.dir,
+                           [join(self.dir, "shard{}.json".format(k))
+                            for k in range(1, 4)],
+                           ["--cachedir=", "--merge=" + join(self.dir,
+                                                             "merged")],
+                           report="merged")
+        self.assertEqual(outcomes(merged, self.names), whole)
+        self.assertTrue(exists(join(self.dir, "merged.xml")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+"""Support for running commands without an intervening shell, used by
+tester.py and runner.py.
+
+The testers build command lines such as
+
+    exec java -ea gitlet.Main commit "a message"
+
+and traditionally ran them with shell=True, which costs a fork and exec of
+/bin/sh (and its startup) for every gitlet command.  shellWords splits
+such a line into words exactly as sh would, provided that the line uses
+only quoting and escapes (no variables, globbing, redirection, etc.);
+directArgv then turns it into an argument list whose program is an
+absolute path, so that subprocess can start it directly.  Lines that need
+the shell get None, and the caller runs them with the shell as before."""
+
+import os
+from subprocess import call, DEVNULL
+from shutil import which
+from shlex import quote
+from time import perf_counter
+
+# Characters that mean something to sh when they are not quoted.
+SHELL_SPECIAL = set("$`*?[]{}|&;<>()\n")
+# Characters that mean something to sh at the start of an unquoted word.
+SHELL_WORD_START = set("#~!")
+
+def shellWords(line):
+    """Returns the list of words into which sh would split command LINE,
+    or None if LINE contains anything other than words, quotes, and
+    escapes (or is incorrectly quoted)."""
+    words = []
+    word, in_word = [], False
+    k, n = 0, len(line)
+    while k < n:
+        c = line[k]
+        if c in " \t":
+            if in_word:
+                words.append("".join(word))
+                word, in_word = [], False
+        elif c == "'":
+            end = line.find("'", k + 1)
+            if end < 0:
+                return None
+            word.append(line[k + 1:end])
+            in_word, k = True, end
+        elif c == '"':
+            k += 1
+            while k < n and line[k] != '"':
+                c = line[k]
+                if c in "$`":
+                    return None
+                if c == "\\" and k + 1 < n and line[k + 1] in '$`"\\\n':
+                    k += 1
+                    if line[k] != "\n":
+                        word.append(line[k])
+                else:
+                    word.append(c)
+                k += 1
+            if k == n:
+                return None
+            in_word = True
+        elif c == "\\":
+            if k + 1 == n:
+                return None
+            k += 1
+            if line[k] != "\n":
+                word.append(line[k])
+                in_word = True
+        elif c in SHELL_SPECIAL or (not in_word and c in SHELL_WORD_START) \
+             or (c == "=" and not words):
+            return None
+        else:
+            word.append(c)
+            in_word = True
+        k += 1
+    if in_word:
+        words.append("".join(word))
+    return words
+
+# Absolute paths of programs found by directArgv.
+_programs = {}
+
+def directArgv(full_cmnd):
+    """Returns the shell command line FULL_CMND as an argument list for
+    running without a shell (dropping any leading "exec"), or None if it
+    needs the shell or names a program that cannot be found."""
+    if os.name == 'nt':
+        return None
+    words = shellWords(full_cmnd)
+    if words and words[0] == "exec":
+        words = words[1:]
+    if not words:
+        return None
+    if words[0] not in _programs:
+        _programs[words[0]] = which(words[0])
+    program = _programs[words[0]]
+    if program is None:
+        return None
+    return [program] + words[1:]
+
+def shellOverhead(samples=7):
+    """Returns an estimate of the time in seconds that running a command
+    through sh adds to running it directly, taken as the difference of the
+    median times of SAMPLES runs of 'true' each way, or None if it cannot
+    be measured here."""
+    true = which("true")
+    if true is None or os.name == 'nt':
+        return None
+    def median(args, shell):
+        times = []
+        for _ in range(samples):
+            start = perf_counter()
+            call(args, shell=shell, stdin=DEVNULL)
+            times.append(perf_counter() - start)
+        return sorted(times)[samples // 2]
+    return max(0.0, median("exec " + quote(true), True)
+                    - median([true], False))
@@ -0,0 +1,93 @@
+"""Checks that spawn.shellWords splits gitlet command lines as sh does.
+
+Usage: python3 spawn_test.py
+
+Each line in QUOTED is split by shellWords, by shlex.split, and by sh
+itself (which prints the words it sees), and the three must agree; the
+lines in SH_ONLY, which shlex splits differently from sh, are checked
+against sh alone.  Each line in NEEDS_SHELL must make shellWords return
+None."""
+
+import unittest, shlex
+from subprocess import check_output, DEVNULL
+from shutil import which
+from spawn import shellWords
+
+# Command lines that shellWords must split as sh does.
+QUOTED = [
+    'exec java -ea gitlet.Main init',
+    'java gitlet.Main add wug.txt',
+    'java gitlet.Main commit "added wug"',
+    "java gitlet.Main commit 'added wug'",
+    'java gitlet.Main commit "a \\"quoted\\" message"',
+    "java gitlet.Main commit 'it'\\''s done'",
+    'java gitlet.Main commit "back\\\\slash and \\\\n"',
+    'java gitlet.Main commit "single \' inside"',
+    'java gitlet.Main commit \'double " inside\'',
+    'java gitlet.Main commit a\\ b\\ c',
+    'java gitlet.Main commit ""',
+    "java gitlet.Main commit ''",
+    'java gitlet.Main commit "two  spaces"\t"and a tab"',
+    'java gitlet.Main checkout -- f.txt',
+    'java gitlet.Main find "x"y\'z\'',
+    'java gitlet.Main commit café',
+    'java -Da=b gitlet.Main log',
+    'java gitlet.Main commit a=b',
+    'java gitlet.Main commit x#y',
+]
+
+# Command lines that shellWords must split as sh does, but shlex does not.
+SH_ONLY = [
+    # sh removes an escaped newline inside double quotes; shlex keeps it.
+    'java gitlet.Main commit "line\\\njoined"',
+]
+
+# Command lines that need the shell (or are ill-formed), for which
+# shellWords must return None.
+NEEDS_SHELL = [
+    'java gitlet.Main commit "$HOME"',
+    'java gitlet.Main commit $HOME',
+    'java gitlet.Main commit `date`',
+    'java gitlet.Main commit "`date`"',
+    'java gitlet.Main add *.txt',
+    'java gitlet.Main add f?.txt',
+    'java gitlet.Main log > out',
+    'java gitlet.Main log | head',
+    'java gitlet.Main log; rm -rf x',
+    'java gitlet.Main log &',
+    'java gitlet.Main commit (x)',
+    'java gitlet.Main add ~/f.txt',
+    'java gitlet.Main commit # comment',
+    'CLASSPATH=x java gitlet.Main log',
+    'java gitlet.Main commit "unterminated',
+    "java gitlet.Main commit 'unterminated",
+    'java gitlet.Main commit trailing\\',
+]
+
+def shWords(line):
+    """The words into which sh splits LINE, as printed by sh itself."""
+    out = check_output(["sh", "-c", 'printf "%s\\0" ' + line[line.index(" "):]],
+                       stdin=DEVNULL)
+    return [line.split()[0]] \
+        + [word.decode() for word in out.split(b"\0")[:-1]]
+
+class ShellWordsTest(unittest.TestCase):
+
+    def testShlex(self):
+        for line in QUOTED:
+            with self.subTest(line=line):
+                self.assertEqual(shellWords(line), shlex.split(line))
+
+    @unittest.skipIf(which("sh") is None, "no sh")
+    def testShell(self):
+        for line in QUOTED + SH_ONLY:
+            with self.subTest(line=line):
+                self.assertEqual(shellWords(line), shWords(line))
+
+    def testNeedsShell(self):
+        for line in NEEDS_SHELL:
+            with self.subTest(line=line):
+                self.assertIsNone(shellWords(line))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,6 +7,12 @@ from os import chdir, environ, getcwd, mkdir, remove
 from shutil import copyfile, rmtree
 from math import log
 from glob import glob
+from patterns import outputMatch, PatternTooExpensive, MATCH_LIMIT
+from distance import editDistance
+from treedigest import treeDigest
+from tester import compileTest, substituted, TestState, checkTree, \
+     generateFile, fileSize
+from goldens import GoldenStore, maskedOutput, commandStatus, testDigest
 
 SHORT_USAGE = """\
 Usage: python3 staff-runner.py OPTIONS TEST.in ...
@@ -18,7 +24,13 @@ Usage: python3 staff-runner.py OPTIONS TEST.in ...
                       files referenced by + and =.
        --tolerance=N  Set the maximum allowed edit distance between program
                       output and expected output to N (default 3).
+       --match-limit=SECS  Give up matching the output of a command
+                      against a <<<* pattern after SECS seconds, reporting
+                      the pattern as too expensive (default 10; 0 for
+                      no limit).
        --verbose      Print extra information about execution.
+       --record=FILE  Record staff-gitlet's behavior on each test in FILE,
+                      for tester.py --replay=FILE.
 """
 
 USAGE = SHORT_USAGE + """\
@@ -65,10 +77,28 @@ The instructions each have one of the following forms:
    E NAME
           Check that file or directory NAME exists, and report an error if it
           does not.
+   H DIGEST [DIR]
+          Check that directory DIR (default the current test directory) and
+          all it contains, except .gitlet directories, have digest DIGEST
+          (as printed by treedigest.py; a prefix of 8 or more hex digits
+          will do), and report an error, with the actual digest, if not.
+          H* DIGEST [DIR] includes the .gitlet directories.
    D VAR "VALUE"
           Defines the variable VAR to have the literal value VALUE.  VALUE is
           taken to be a raw Python string (as in r"VALUE").  Substitutions are
           first applied to VALUE.
+   R VAR N
+   ...
+   R
+          Execute the instructions between the two R lines N times, with
+          ${VAR} defined as 1, 2, ..., N in turn.  Blocks may be nested.
+          The instructions are not copied for each repetition, so even
+          very long repetitions take little memory.
+   G NAME SIZE SEED
+          Create a file named NAME containing SIZE bytes (SIZE may end in
+          K, M, or G) of lines of random lowercase letters, which are
+          always the same for a given SEED.  The file is written in pieces,
+          so that its size is not limited by memory.
 
 For each TEST.in, reports at most one error.  Without the --show option,
 simply indicates tests passed and failed.  If N is postive, also prints details
@@ -76,6 +106,15 @@ of the first N failing tests. With --show=all, shows details of all failing
 tests.  With --keep, keeps the directories created for the tests (with names
 TEST.dir).
 
+With --record, the exit status and output of each ">" command and the digest
+of the test directory after it (without .gitlet, as for H in tester.py)
+are added to FILE (replacing earlier recordings of the same tests), with
+commit ids and the contents of "Date:" lines masked as for tester.py
+--diff.  staff-gitlet's behavior is taken as correct: expected output
+lines are ignored, except that "<<<*" patterns are matched against the
+output to capture its groups, and exit codes are recorded rather than
+reported.  Only tests that pass their other checks are recorded.
+
 When finished, reports number of tests passed and failed, and the number of
 faulty TEST.in files."""
 
@@ -151,16 +190,6 @@ def contents(filename):
     except FileNotFoundError:
         return None
 
-def editDistance(s1, s2):
-    dist = [list(range(len(s2) + 1))] + \
-           [ [i] + [ 0 ] * len(s2) for i in range(1, len(s1) + 1) ]
-    for i in range(1, len(s1) + 1):
-        for j in range(1, len(s2) + 1):
-            dist[i][j] = min(dist[i-1][j] + 1,
-                             dist[i][j-1] + 1,
-                             dist[i-1][j-1] + (s1[i-1] != s2[j-1]))
-    return dist[len(s1)][len(s2)]
-
 def nextCommand(full_cmnd, timeout):
     return check_output(full_cmnd, shell=True, universal_newlines=True,
                         stdin=DEVNULL, stderr=STDOUT, timeout=timeout)
@@ -241,22 +270,28 @@ def correctFileOutput(name, expected, dir):
     stdData = canonicalize(contents(join(src_dir, expected)))
     return userData == stdData
 
+def normalizedOutput(text):
+    text = re.sub(r'[ \t]+\n', '\n', text)
+    return re.sub(r'(?m)^[ \t]+', ' ', text)
+
 def correctProgramOutput(expected, actual, last_groups, is_regexp):
-    expected = re.sub(r'[ \t]+\n', '\n', '\n'.join(expected))
-    expected = re.sub(r'(?m)^[ \t]+', ' ', expected)
-    actual = re.sub(r'[ \t]+\n', '\n', actual)
-    actual = re.sub(r'(?m)^[ \t]+', ' ', actual)
+    expected = normalizedOutput('\n'.join(expected))
+    actual = normalizedOutput(actual)
 
     last_groups[:] = (actual,)
     if is_regexp:
         try:
-            if not Match(expected.rstrip() + r"\Z", actual) \
-                    and not Match(expected.rstrip() + r"\Z", actual.rstrip()):
-                return False
-        except:
+            groups = outputMatch(expected.rstrip(), actual, match_limit)
+        except PatternTooExpensive:
+            raise ValueError("pattern too expensive (over {:g} s)"
+                             .format(match_limit))
+        except re.error:
             raise ValueError("bad pattern")
-        last_groups[:] += Mat.groups()
-    elif editDistance(expected.rstrip(), actual.rstrip()) > output_tolerance:
+        if groups is None:
+            return False
+        last_groups[:] += groups
+    elif editDistance(expected.rstrip(), actual.rstrip(),
+                      output_tolerance) > output_tolerance:
         return False
     return True
 
@@ -285,142 +320,104 @@ def chop_nl(s):
     else:
         return s
 
-def line_reader(f, prefix):
-    n = 0
-    try:
-        with open(f) as inp:
-            while True:
-                L = inp.readline()
-                if L == '':
-                    return
-                n += 1
-                included_file = yield (prefix + str(n), L)
-                if included_file:
-                    yield None
-                    yield from line_reader(included_file, prefix + str(n) + ".")
-    except FileNotFoundError:
-        raise ValueError("file {} not found".format(f))
+def doStep(state, instr, steps):
+    """Execute the compiled instruction INSTR (see tester.compileTest) in
+    STATE, a tester.TestState.  With --record, adds the golden step of a
+    ">" command to STEPS.  Returns None if it succeeds, and otherwise a
+    description of the error."""
+    line_num, _, _, op, _ = instr
+    state.line_num = line_num
+    text, args = substituted(state, instr)
+    if verbose:
+        print("+ {}".format(text))
+    if op == 'C':
+        state.sub = args[0]
+        if not exists(state.cdir):
+            mkdir(state.cdir)
+    elif op == 'T':
+        try:
+            state.timeout = float(args[0])
+        except:
+            ValueError("bad time: {}".format(text))
+    elif op == '+':
+        doCopy(args[0], args[1], state.cdir)
+    elif op == '-':
+        doDelete(args[0], state.cdir)
+    elif op == '>':
+        cmnd, expected, is_regexp = args
+        msg, out = doExecute(cmnd, state.cdir, state.timeout)
+        if verbose:
+            if out:
+                print(re.sub(r'(?m)^', '- ', chop_nl(out)))
+        if msg == "OK":
+            if not correctProgramOutput(expected, out, state.last_groups,
+                                        is_regexp) \
+               and golden_store is None:
+                msg = "incorrect output"
+        if golden_store is not None:
+            steps.append((line_num, commandStatus(msg),
+                          out and maskedOutput(normalizedOutput(out),
+                                               state.ids),
+                          treeDigest(state.tmpdir)))
+            msg = "OK"
+        if msg != "OK":
+            return msg
+    elif op == '=':
+        if not correctFileOutput(args[0], args[1], state.cdir):
+            return "file {} has incorrect content".format(args[0])
+    elif op == '*':
+        if fileExists(args[0], state.cdir):
+            return "file {} present".format(args[0])
+    elif op == 'E':
+        if not fileExists(args[0], state.cdir):
+            return "file or directory {} not present".format(args[0])
+    elif op == 'H':
+        return checkTree(join(state.cdir, args[1]), *args)
+    elif op == 'D':
+        state.defns[args[0]] = args[1]
+    elif op == 'G':
+        generateFile(join(state.cdir, args[0]), fileSize(args[1]), args[2])
+    elif op == 'R':
+        var, count, body = args
+        try:
+            count = int(count)
+        except ValueError:
+            raise ValueError("bad repeat count: {}".format(count))
+        for k in range(1, count + 1):
+            state.defns[var] = str(k)
+            for instr in body:
+                msg = doStep(state, instr, steps)
+                if msg is not None:
+                    return msg
+    return None
 
 def doTest(test):
-    last_groups = []
     base = splitext(basename(test))[0]
     print("{}:".format(base), end=" \n")
-    cdir = tmpdir = createTempDir(base)
+    program, included_files = compileTest(test)
+    state = TestState(createTempDir(base))
+    state.timeout = TIMEOUT
     if verbose:
-        print("Testing directory: {}".format(tmpdir))
-    timeout = TIMEOUT
-    defns = {}
-
-    def do_substs(L):
-        c = 0
-        L0 = None
-        while L0 != L and c < 10:
-            c += 1
-            L0 = L
-            L = re.sub(r'\$\{(.*?)\}', subst_var, L)
-        return L
-
-    def subst_var(M):
-        key = M.group(1)
-        if Match(r'\d+$', key):
-            try:
-                return last_groups[int(key)]
-            except IndexError:
-                raise ValueError("FAILED (nonexistent group: {{{}}})"
-                                 .format(key))
-        elif M.group(1) in defns:
-            return defns[M.group(1)]
-        else:
-            raise ValueError("undefined substitution: ${{{}}}".format(M.group(1)))
+        print("Testing directory: {}".format(state.tmpdir))
+    steps = []
 
     try:
-        line_num = None
-        inp = line_reader(test, '')
-        included_files = []
-        while True:
-            line_num, line = next(inp, (line_num, ''))
-            if line == "":
-                print("OK")
-                return True
-            if not Match(r'\s*#', line):
-                line = do_substs(line)
-            if verbose:
-                print("+ {}".format(line.rstrip()))
-            if Match(r'\s*#', line) or Match(r'\s+$', line):
-                pass
-            elif Match(r'I\s+(\S+)', line):
-                inp.send(join(dirname(test), Group(1)))
-                included_files.append(Group(1))
-            elif Match(r'C\s*(\S*)', line):
-                if Group(1) == "":
-                    cdir = tmpdir
-                else:
-                    cdir = join(tmpdir, Group(1))
-                    if not exists(cdir):
-                        mkdir(cdir)
-            elif Match(r'T\s*(\S+)', line):
-                try:
-                    timeout = float(Group(1))
-                except:
-                    ValueError("bad time: {}".format(line))
-            elif Match(r'\+\s*(\S+)\s+(\S+)', line):
-                doCopy(Group(1), Group(2), cdir)
-            elif Match(r'-\s*(\S+)', line):
-                doDelete(Group(1), cdir)
-            elif Match(r'>\s*(.*)', line):
-                cmnd = Group(1)
-                expected = []
-                while True:
-                    line_num, L = next(inp, (line_num, ''))
-                    if L == '':
-                        raise ValueError("unterminated command: {}"
-                                         .format(line))
-                    L = L.rstrip()
-                    if Match(r'<<<(\*?)', L):
-                        is_regexp = Group(1)
-                        break
-                    expected.append(do_substs(L))
-                msg, out = doExecute(cmnd, cdir, timeout)
-                if verbose:
-                    if out:
-                        print(re.sub(r'(?m)^', '- ', chop_nl(out)))
-                if msg == "OK":
-                    if not correctProgramOutput(expected, out, last_groups,
-                                                is_regexp):
-                        msg = "incorrect output"
-                elif msg == "User Exit":
-                    print("Exiting Debug mode ...")
-                    break
-                if msg != 'OK':
-                    print("ERROR ({})".format(msg))
-                    reportDetails(test, included_files, line_num)
-                    return False
-            elif Match(r'=\s*(\S+)\s+(\S+)', line):
-                if not correctFileOutput(Group(1), Group(2), cdir):
-                    print("ERROR (file {} has incorrect content)"
-                          .format(Group(1)))
-                    reportDetails(test, included_files, line_num)
-                    return False
-            elif Match(r'\*\s*(\S+)', line):
-                if fileExists(Group(1), cdir):
-                    print("ERROR (file {} present)".format(Group(1)))
-                    reportDetails(test, included_files, line_num)
-                    return False
-            elif Match(r'E\s*(\S+)', line):
-                if not fileExists(Group(1), cdir):
-                    print("ERROR (file or directory {} not present)"
-                          .format(Group(1)))
-                    reportDetails(test, included_files, line_num)
-                    return False
-            elif Match(r'(?s)D\s*([a-zA-Z_][a-zA-Z_0-9]*)\s*"(.*)"\s*$', line):
-                defns[Group(1)] = Group(2)
-            else:
-                raise ValueError("bad test line at {}".format(line_num))
+        for instr in program:
+            msg = doStep(state, instr, steps)
+            if msg is not None:
+                print("ERROR ({})".format(msg))
+                reportDetails(test, included_files, state.line_num)
+                return False
+        if golden_store is not None:
+            golden_store.record(test, testDigest(test, included_files),
+                                steps)
+        print("OK")
+        return True
     finally:
         if not keep:
-            cleanTempDir(tmpdir)
+            cleanTempDir(state.tmpdir)
         else:
-            print(f"\nDirectory state saved in {tmpdir}")
+            print(f"\nDirectory state saved in {state.tmpdir}")
 
 if __name__ == "__main__":
     show = None
@@ -431,12 +428,15 @@ if __name__ == "__main__":
     src_dir = 'src'
     gitlet_dir = join(dirname(abspath(getcwd())), "gitlet")
     output_tolerance = 0
+    match_limit = MATCH_LIMIT
+    golden_store = None
 
     try:
         opts, files = \
             getopt(sys.argv[1:], '',
                    ['show=', 'keep', 'lib=', 'verbose', 'src=',
-                    'tolerance=', 'superverbose', 'debug'])
+                    'tolerance=', 'match-limit=', 'superverbose', 'debug',
+                    'record='])
         for opt, val in opts:
             if opt == '--show':
                 show = int(val)
@@ -450,8 +450,12 @@ if __name__ == "__main__":
                 verbose = True
             elif opt == "--tolerance":
                 output_tolerance = int(val)
+            elif opt == "--match-limit":
+                match_limit = float(val)
             elif opt == "--superverbose":
                 superverbose = True
+            elif opt == "--record":
+                golden_store = GoldenStore(val)
             elif opt == "--debug":
                 DEBUG = True
                 TIMEOUT = 100000
@@ -486,6 +490,14 @@ if __name__ == "__main__":
 
     cleanTempDir(join(abspath(getcwd()), "gitlet"))
 
+    if golden_store is not None:
+        try:
+            golden_store.save()
+        except OSError as excp:
+            print("Could not write {}: {}".format(golden_store.filename,
+                                                  excp.strerror))
+            fails += 1
+
     print()
     print("Ran {} tests. ".format(num_tests), end="")
     if errs == fails == 0:
@@ -1,11 +1,49 @@
-import sys, re
+import sys, re, threading, hashlib, pickle, json, atexit, random, difflib, \
+     signal
 from subprocess import \
-     check_output, PIPE, STDOUT, DEVNULL, CalledProcessError, TimeoutExpired
-from os.path import abspath, basename, dirname, exists, join, splitext
+     check_output, Popen, PIPE, STDOUT, DEVNULL, CalledProcessError, \
+     TimeoutExpired
+from os.path import abspath, basename, dirname, exists, isfile, join, \
+     splitext
 from getopt import getopt, GetoptError
-from os import chdir, environ, getcwd, mkdir, remove, access, W_OK
-from shutil import copyfile, rmtree
-from math import log
+from os import environ, getcwd, getpid, mkdir, makedirs, remove, replace, \
+     stat, pathsep, access, W_OK, scandir, killpg
+from shutil import copytree, rmtree
+from math import log, ceil
+from glob import glob
+from io import StringIO
+from queue import Queue
+from tempfile import mkdtemp
+from time import perf_counter, time
+from xml.etree import ElementTree
+from shlex import quote
+try:
+    from os import wait4, waitstatus_to_exitcode
+except ImportError:
+    wait4 = None
+try:
+    from os import waitid, P_PID, WEXITED, WNOWAIT, CLD_EXITED
+except ImportError:
+    waitid = None
+try:
+    import resource
+except ImportError:
+    resource = None
+prlimit = resource and getattr(resource, "prlimit", None)
+from concurrent.futures import ThreadPoolExecutor, Future
+from warmjvm import WarmPool, WarmJVMError, java_argv
+from spawn import directArgv, shellOverhead
+from cds import ClassDataArchive
+from javacache import CompileCache
+from watch import Watcher
+from patterns import outputMatch, PatternTooExpensive, MATCH_LIMIT
+from distance import editDistance, commonPrefixLength, bandRow, \
+     firstBandRow
+from fixtures import FixtureStore
+from treedigest import treeDigest, treeFiles
+from goldens import GoldenStore, maskedOutput, commandStatus, testDigest
+from profiles import Profiler
+from growth import GrowthLog, gitletUsage
 
 SHORT_USAGE = """\
 Usage: python3 tester.py OPTIONS TEST.in ...
@@ -23,7 +61,70 @@ Usage: python3 tester.py OPTIONS TEST.in ...
                       attach a remote debugger
        --tolerance=N  Set the maximum allowed edit distance between program
                       output and expected output to N (default 3).
+       --match-limit=SECS  Give up matching the output of a command
+                      against a <<<* pattern after SECS seconds, reporting
+                      the pattern as too expensive (default 10; 0 for
+                      no limit).
+       --max-output=SIZE
+                      Kill a gitlet command that writes more than SIZE
+                      characters (a number, optionally followed by K, M,
+                      or G; default 64M; 0 for no limit).
+       --limit-memory=SIZE
+                      Limit the address space of each gitlet command to
+                      SIZE bytes (as for --max-output).
+       --limit-cpu=SECS
+                      Limit each gitlet command to SECS seconds of CPU
+                      time.
+       --limit-files=N
+                      Report an error if a gitlet command leaves more than
+                      N files and directories in its directory.
        --verbose      Print extra information about execution.
+       --jobs=N       Run up to N tests concurrently (default 1).  Output
+                      for each test is still reported in order.
+       --warm         Run gitlet commands in a long-lived JVM (one per test
+                      directory and job) rather than starting a new JVM
+                      for each command.
+       --cachedir=DIR Keep cached information, such as compiled tests and
+                      the tests that passed, in DIR (default .testcache).
+                      --cachedir= disables caching.
+       --no-cache     Run every test, even those that passed last time and
+                      whose inputs have not changed since.
+       --workdir=DIR  Create test directories in DIR (default the current
+                      directory); a memory file system such as /dev/shm
+                      makes this faster.
+       --report=FILE  Write the time and resources used by each gitlet
+                      command and test, with summaries, to FILE.json (as
+                      JSON) and FILE.xml (as JUnit XML).
+       --share-prefixes
+                      Run instructions that begin several tests only once,
+                      copying the resulting directory for each test.
+       --shell        Run every gitlet command through the shell, rather
+                      than directly when its operands need only quoting.
+       --cds          Start each JVM from a class data sharing archive of
+                      gitlet and the JDK classes it uses.
+       --shard=I/N    Run only the Ith of N parts of the tests, balanced by
+                      the tests' durations on earlier runs.
+       --merge=FILE   Rather than run tests, combine the --report JSON files
+                      given in place of tests into FILE.json and FILE.xml.
+       --order=ORDER  Run the tests in the order given (the default), with
+                      the longest first (ORDER=longest), or with those that
+                      failed most recently first (ORDER=failed).
+       --maxfail=N    Stop running gitlet commands once N tests have failed.
+       --watch        After running the tests, wait for changes to gitlet's
+                      sources or the tests and rerun the affected tests.
+       --profile=SUBCOMMANDS
+                      Profile the gitlet commands whose subcommands are in
+                      the comma-separated list SUBCOMMANDS (or all of them,
+                      for "all") with Java Flight Recorder, summarizing
+                      the results in profile.txt and profile.collapsed.
+       --growth=FILE  After each gitlet command, measure the .gitlet
+                      directory, writing the results to FILE as JSON.
+       --diff         Rather than check gitlet's output against the tests,
+                      run each test with staff-gitlet as well, and report
+                      where the two first differ.
+       --replay=FILE  Rather than check gitlet's output against the tests,
+                      compare it with staff-gitlet's, as recorded in FILE
+                      by staff-runner.py --record.
 """
 
 USAGE = SHORT_USAGE + """\
@@ -72,24 +173,215 @@ The instructions each have one of the following forms:
    E NAME
           Check that file or directory NAME exists, and report an error if it
           does not.
+   H DIGEST [DIR]
+          Check that directory DIR (default the current test directory) and
+          all it contains, except .gitlet directories, have digest DIGEST
+          (as printed by treedigest.py; a prefix of 8 or more hex digits
+          will do), and report an error, with the actual digest, if not.
+          H* DIGEST [DIR] includes the .gitlet directories.
    D VAR "VALUE"
           Defines the variable VAR to have the literal value VALUE.  VALUE is
           taken to be a raw Python string (as in r"VALUE").  Substitutions are
           first applied to VALUE.
+   R VAR N
+   ...
+   R
+          Execute the instructions between the two R lines N times, with
+          ${VAR} defined as 1, 2, ..., N in turn.  Blocks may be nested.
+          The instructions are not copied for each repetition, so even
+          very long repetitions take little memory.
+   G NAME SIZE SEED
+          Create a file named NAME containing SIZE bytes (SIZE may end in
+          K, M, or G) of lines of random lowercase letters, which are
+          always the same for a given SEED.  The file is written in pieces,
+          so that its size is not limited by memory.
 
 For each TEST.in, reports at most one error.  Without the --show option,
 simply indicates tests passed and failed.  If N is postive, also prints details
 of the first N failing tests. With --show=all, shows details of all failing
 tests.  With --keep, keeps the directories created for the tests (with names
-TEST.dir).
+TEST_XXXXXXXX, in the --workdir directory).  Otherwise, each test's
+directory is deleted in the background after the test finishes.  With
+--jobs=N, up to N tests run at once, each in its own directory; their
+output is buffered and printed in the order the tests were given.  With
+--warm, each ">" command is run by WarmDriver in a JVM that stays up
+between the commands of a test.  The JVM is started in the test's
+directory, since Java resolves relative file names against the directory
+a JVM started in, whatever user.dir says; a JVM is replaced when its job
+moves on to another directory.  A command that crashes that JVM or times
+out is rerun in a JVM of its own.
+
+The output of a ">" command ending in "<<<" is compared with the expected
+lines as it arrives, a batch of lines at a time, keeping only the part
+that differs from them, so that a command that prints tens of megabytes
+as expected needs no more memory than the test's expected lines.  As soon
+as the output is certain to be more than --tolerance edits from them,
+the command is killed and the output reported incorrect.  (With --verbose,
+which shows the output, it is read in full and compared afterward.)  A
+command whose output exceeds --max-output is killed and reported as an
+error.
+
+Each file in the src directory is read at most once per run (see
+fixtures.py).  A "=" check reads only the file under test, comparing a
+digest of it with the fixture's, and skips reading it if it is too short
+to match.  A "+" copy of a large file is a copy-on-write clone where the
+file system supports them.
+
+Unless --shell is given, a ">" command whose operands use nothing of the
+shell's but quotes and backslashes (the usual case) is split into words as
+the shell would and java is started directly, saving the startup of a
+shell for each command.  With --debug, commands still go through the
+shell.  The --report file records how each command was started, along
+with an estimate of the time this saved.
+
+With --cds, the tester packs the gitlet classes into a JAR, runs them on a
+few commands to see which classes they load, and dumps those classes into
+a class data sharing archive that every JVM it starts then maps in rather
+than loading and verifying the classes afresh.  The archive (which needs
+JDK 10 or later) is kept in the --cachedir directory and rebuilt when the
+class files or the JVM change.  The time it saves on each JVM start is
+measured and reported at the end.
+
+Before it is run, each TEST.in is compiled into a list of instructions, with
+its includes resolved and the substitutions that do not depend on captured
+groups already made, so that malformed tests are reported before any
+command runs.  The compiled form is cached in the --cachedir directory and
+reused as long as neither TEST.in nor the files it includes have changed.
+
+The --cachedir directory also records the tests that passed.  A test that
+passed last time is not run again (and is reported as unchanged) unless
+TEST.in, its includes, the src files it uses, the gitlet classes on the
+CLASSPATH, or the tester's settings have changed since, or --no-cache is
+given.  Tests that failed are always rerun.
+
+With --share-prefixes, the compiled tests are arranged in a tree in which
+tests that begin with the same instructions share a path.  Each instruction
+on a shared path is executed once, and where the tests diverge, the test
+directory, the definitions, and the captured groups are copied for each
+branch, so that each test sees the same state it would have had on its
+own.  Output is reported per test, as usual.  With --keep, the directories
+kept are the ones in which each branch finished.
+
+Each run records how long each test took in durations.json in the
+--cachedir directory.  With --shard=I/N, the tests are divided into N
+shards whose total recorded durations are as nearly equal as possible, and
+only those in shard I (numbered from 1) are run.  A test with no recorded
+duration is assumed to take time proportional to its size (including the
+files it includes).  Every shard must be given the same tests and see the
+same durations.json, or some tests may be run twice and others not at all.
+Given --report on each shard, --merge=FILE combines the reports into one
+(which also updates durations.json), prints the overall results, and
+exits with a failing status if any shard had a failing test.
+
+With --order=longest, the tests are run (and reported) in decreasing order
+of their durations, estimated as for --shard, so that with --jobs the
+slowest tests do not start last and hold up the end of the run.  With
+--order=failed, tests that have failed before come first, most recent
+failure first, followed by the others in the order given.  With
+--maxfail=N, once N tests have had errors or been found faulty, no more
+gitlet commands are started; the tests that are cut short, or not begun,
+are reported as skipped.
+
+With --watch, the tester does not exit after running the tests.  Instead,
+it waits for a change to a gitlet source file, a TEST.in or file it
+includes, or a file in the src directory, then recompiles the gitlet
+sources that need it (see javacache.py) and reruns the tests, and so on
+until interrupted.  As usual, a test is skipped if it passed last time and
+nothing it depends on has changed (unless the --cachedir directory is
+disabled), so only the affected tests and those that failed are rerun.
+The compiled tests are kept from one round to the next.  --cds is ignored
+with --watch, since its archive would hold stale classes after a
+recompilation.
+
+With --diff, each test is run in two directories at once, one with
+gitlet.Main and the other with staff-gitlet, which serves as the expected
+behavior, so that tests (generated ones, say) need no expected output.
+The two ">" commands of each step run concurrently.  After them, the two
+exit statuses, the two outputs, and the digests of the two test
+directories (without .gitlet, as for H) must agree, or the test fails
+with a description of the first difference.  The outputs are compared
+after normalizing blanks as usual and replacing each commit id by its
+number in order of first appearance (abbreviations included) and the
+contents of "Date:" lines by a placeholder, since these differ between
+correct implementations.  Expected output lines are ignored, except that
+"<<<*" patterns are matched against each output to capture its groups.
+Other checks (=, *, E, H) are made in both directories and must have the
+same outcome.  --share-prefixes is ignored with --diff.
+
+--replay checks each ">" command as --diff does, but against staff-gitlet's
+exit status, output, and test directory digest as recorded by
+staff-runner.py --record=FILE, so that staff-gitlet itself is not needed
+(nor run).  A test that has changed since it was recorded, or was never
+recorded, is reported as faulty.  --share-prefixes is ignored with
+--replay.
+
+Each gitlet command runs in a process group of its own, all of which is
+killed when the command times out, is killed for its output, or exceeds
+one of the --limit options.  --limit-memory and --limit-cpu are applied to
+the command's process (they limit each JVM, not the tester) with prlimit
+as soon as it starts, or, where prlimit is unavailable or the command
+needs the shell, by a small Python wrapper that sets them before it runs
+the command.  A command that runs out of address space or CPU time
+reports "memory limit exceeded" or "CPU limit exceeded" rather than a
+crash or timeout.  A JVM reserves much more address space than it uses,
+so --limit-memory should allow a few gigabytes more than the Java heap
+(-Xmx) needs.  The limits apply where commands are timed (not on
+Windows, nor with --debug); --warm is ignored with any of the --limit
+options, since its commands share one JVM.  Commands stopped by each kind
+of limit (timeout, memory, cpu, output, and files) are counted in the
+--report summary and, if there are any, at the end of the run.
+
+With --profile, each selected gitlet command runs with Java Flight Recorder
+sampling its execution and allocation, which slows it (allow for this
+with T), and not in a warm JVM.  The recordings are kept in a directory
+named profile_XXXXXXXX in the --workdir directory (deleted at the end,
+unless --keep), and afterwards combined with the JDK's jfr tool into
+profile.txt, listing the methods in which the most samples fell and the
+classes and methods that allocated the most, and profile.collapsed, the
+samples of each distinct stack (as "ROOT;...;LEAF COUNT") for drawing
+flame graphs with flamegraph.pl or speedscope.
+
+With --growth, the total bytes, number of files, and largest file in the
+.gitlet directory of the current test directory (see C) are measured
+after each ">" command, and FILE gets each test's series of these
+measurements, with the growth due to each command, and the mean and
+largest growth for each subcommand.  growth.py runs a set of scaling
+scenarios this way and reports on them.
 
 When finished, reports number of tests passed and failed, and the number of
 faulty TEST.in files."""
 
 TIMEOUT = 10
+MAX_OUTPUT = "64M"
+# What programs say when they cannot get the memory they need, taken to
+# mean that --limit-memory was exceeded.
+MEMORY_ERROR = re.compile(r'OutOfMemoryError|Could not reserve enough space|'
+                          r'insufficient memory|Cannot allocate memory')
+# Characters at the end of a command's output kept to look for MEMORY_ERROR.
+MEMORY_ERROR_TAIL = 4096
+# The files written by --profile are PROFILE_PREFIX.txt and
+# PROFILE_PREFIX.collapsed.
+PROFILE_PREFIX = "profile"
+# The kinds of limit on which the status of a command stopped by one is
+# named, in the order in which they are reported.
+LIMIT_KINDS = ("timeout", "memory", "cpu", "output", "files")
+# Characters read from a command's output at a time.
+OUTPUT_CHUNK = 1 << 16
 
 JAVA_COMMAND = "java -ea"
 GITLET_CLASS = "gitlet.Main"
+STAFF_COMMAND = "staff-gitlet"
+# Lines of the differences between outputs shown by --diff and --replay.
+DIFF_LINES = 12
+# Commands used to find the classes for --cds to archive, run in order in a
+# directory containing CDS_FILES.
+CDS_TRAINING = [["init"], ["add", "wug.txt"], ["commit", "added wug"],
+                ["status"], ["log"], ["global-log"], ["find", "added wug"],
+                ["branch", "other"], ["rm", "wug.txt"], ["commit", "gone"],
+                ["checkout", "other"], ["merge", "master"], []]
+CDS_FILES = { "wug.txt": "This is a wug.\n" }
+# How --watch compiles the gitlet sources (in place, as the Makefile does).
+WATCH_JAVAC = "javac -g -Xlint:unchecked -Xlint:deprecation"
 JVM_OPTIONS = "-agentlib:jdwp=transport=dt_socket,server=y,suspend=y,address=5005"
 
 DEBUG = False
@@ -103,14 +395,34 @@ def Usage():
     print(SHORT_USAGE, file=sys.stderr)
     sys.exit(1)
 
-Mat = None
+# Per-thread state: the last Match result, and (when running tests in
+# parallel) the buffer that receives a test's output.
+_tls = threading.local()
+
 def Match(patn, s):
-    global Mat
-    Mat = re.match(patn, s)
-    return Mat
+    _tls.mat = re.match(patn, s)
+    return _tls.mat
 
 def Group(n):
-    return Mat.group(n)
+    return _tls.mat.group(n)
+
+class ThreadOutput:
+    """A stand-in for sys.stdout that sends output written by a thread to
+    that thread's buffer, if it has one, and otherwise to STREAM."""
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        buffer = getattr(_tls, 'buffer', None)
+        if buffer is None:
+            return self.stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
 
 def contents(filename):
     try:
@@ -119,29 +431,203 @@ def contents(filename):
     except FileNotFoundError:
         return None
 
-def editDistance(s1, s2):
-    dist = [list(range(len(s2) + 1))] + \
-           [ [i] + [ 0 ] * len(s2) for i in range(1, len(s1) + 1) ]
-    for i in range(1, len(s1) + 1):
-        for j in range(1, len(s2) + 1):
-            dist[i][j] = min(dist[i-1][j] + 1,
-                             dist[i][j-1] + 1,
-                             dist[i-1][j-1] + (s1[i-1] != s2[j-1]))
-    return dist[len(s1)][len(s2)]
+class Timings:
+    """The resources used by each gitlet command that is run and the
+    outcome and duration of each test, for --report."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = []
+        self.tests = []
+        self.failures = 0
+
+    def command(self, cmnd, line_num, status, wall, usage, spawn):
+        """Record that gitlet CMND, from line LINE_NUM of the tests being
+        run by this thread, finished with STATUS (an exit code, the kind
+        of limit that stopped it, or "killed" if stopped for incorrect
+        output) after WALL seconds.  USAGE is its resource usage from
+        wait4, or None if unavailable.  SPAWN is how it was run: "direct",
+        "shell", or "warm"."""
+        record = {
+            "tests": list(getattr(_tls, 'tests', [])),
+            "line": line_num,
+            "command": cmnd,
+            "subcommand": (cmnd.split() or [""])[0],
+            "status": status,
+            "wall": wall,
+            "user": usage and usage.ru_utime,
+            "sys": usage and usage.ru_stime,
+            "max_rss_kb": usage and usage.ru_maxrss // RSS_SCALE,
+            "spawn": spawn,
+        }
+        with self.lock:
+            self.commands.append(record)
+
+    def test(self, test, result, message, wall):
+        """Record that TEST had RESULT ("passed", "error", "failed",
+        "unchanged", or "skipped") with error MESSAGE, taking WALL
+        seconds."""
+        with self.lock:
+            if result in ("error", "failed"):
+                self.failures += 1
+            self.tests.append({"name": splitext(basename(test))[0],
+                               "file": test, "result": result,
+                               "message": message, "wall": wall})
+
+    def summary(self):
+        """Returns the report as a dictionary suitable for JSON."""
+        by_test = {}
+        by_subcommand = {}
+        for record in self.commands:
+            for test in record["tests"]:
+                by_test.setdefault(test, []).append(record)
+            by_subcommand.setdefault(record["subcommand"], []).append(record)
+        spawns = { "direct": 0, "shell": 0, "warm": 0 }
+        for record in self.commands:
+            spawns[record.get("spawn", "shell")] += 1
+        spawns["shell_overhead"] = spawns["saved"] = None
+        if spawns["direct"]:
+            overhead = shellOverhead()
+            if overhead is not None:
+                spawns["shell_overhead"] = overhead
+                spawns["saved"] = overhead * spawns["direct"]
+        tests = []
+        for info in self.tests:
+            info = dict(info)
+            info["commands"] = resourceStats(by_test.get(info["file"], []))
+            tests.append(info)
+        return {
+            "tests": tests,
+            "limits": self.limits(),
+            "subcommands": { sub: resourceStats(records)
+                             for sub, records in sorted(by_subcommand
+                                                        .items()) },
+            "spawn": spawns,
+            "commands": self.commands,
+        }
+
+    def limits(self):
+        """The number of commands stopped by each kind of limit."""
+        counts = { kind: 0 for kind in LIMIT_KINDS }
+        for record in self.commands:
+            if record["status"] in counts:
+                counts[record["status"]] += 1
+        return counts
+
+    def load(self, filename):
+        """Add the tests and commands in the report FILENAME, as written by
+        write, to those recorded."""
+        with open(filename) as inp:
+            summary = json.load(inp)
+        with self.lock:
+            self.tests += [{ key: info[key] for key in
+                             ("name", "file", "result", "message", "wall") }
+                           for info in summary["tests"]]
+            self.commands += summary["commands"]
+
+    def write(self, prefix):
+        """Write the report as JSON to PREFIX.json and as JUnit XML to
+        PREFIX.xml."""
+        summary = self.summary()
+        with open(prefix + ".json", 'w') as out:
+            json.dump(summary, out, indent=1)
+
+        suite = ElementTree.Element("testsuite", name="gitlet")
+        counts = { "tests": 0, "failures": 0, "errors": 0, "skipped": 0 }
+        total = 0.0
+        for info in summary["tests"]:
+            counts["tests"] += 1
+            total += info["wall"] or 0.0
+            classname = dirname(info["file"]).strip("/").replace("/", ".")
+            case = ElementTree.SubElement(
+                suite, "testcase", name=info["name"],
+                classname=classname or ".",
+                time="{:.3f}".format(info["wall"] or 0.0))
+            if info["result"] == "error":
+                counts["failures"] += 1
+                ElementTree.SubElement(case, "failure",
+                                       message=info["message"])
+            elif info["result"] == "failed":
+                counts["errors"] += 1
+                ElementTree.SubElement(case, "error",
+                                       message=info["message"])
+            elif info["result"] == "unchanged":
+                counts["skipped"] += 1
+                ElementTree.SubElement(case, "skipped",
+                                       message="unchanged since last pass")
+            elif info["result"] == "skipped":
+                counts["skipped"] += 1
+                ElementTree.SubElement(case, "skipped",
+                                       message="--maxfail reached")
+            stats = info["commands"]
+            if stats["count"]:
+                ElementTree.SubElement(case, "system-out").text = \
+                    "{} gitlet commands, wall time mean {:.3f}s, " \
+                    "p95 {:.3f}s, max {:.3f}s".format(
+                        stats["count"], stats["wall"]["mean"],
+                        stats["wall"]["p95"], stats["wall"]["max"])
+        for key, value in counts.items():
+            suite.set(key, str(value))
+        suite.set("time", "{:.3f}".format(total))
+        ElementTree.ElementTree(suite).write(prefix + ".xml",
+                                             encoding="utf-8",
+                                             xml_declaration=True)
+
+# ru_maxrss is in bytes on macOS, and kilobytes elsewhere.
+RSS_SCALE = 1024 if sys.platform == "darwin" else 1
+
+def stats(values):
+    """Returns the count, mean, median, 95th percentile, and maximum of the
+    numbers in VALUES (ignoring Nones)."""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    def percentile(p):
+        return values[max(0, -(-len(values) * p // 100) - 1)]
+    return { "count": len(values), "mean": sum(values) / len(values),
+             "p50": percentile(50), "p95": percentile(95),
+             "max": values[-1] }
+
+def resourceStats(records):
+    """Returns statistics for each resource used by the gitlet commands
+    in RECORDS."""
+    result = { "count": len(records) }
+    for key in "wall", "user", "sys", "max_rss_kb":
+        result[key] = stats(record[key] for record in records)
+    return result
 
 def createTempDir(base):
-    for n in range(100):
-        name = "{}_{}".format(base, n)
-        try:
-            mkdir(name)
-            return name
-        except OSError:
-            pass
-    else:
+    try:
+        return mkdtemp(prefix="{}_".format(base), dir=work_dir)
+    except OSError:
         raise ValueError("could not create temp directory for {}".format(base))
 
+class Cleaner(threading.Thread):
+    """A thread that removes the directories given to cleanTempDir, so that
+    tests need not wait for their directories to be deleted."""
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.queue = Queue()
+
+    def run(self):
+        while True:
+            dir = self.queue.get()
+            rmtree(dir, ignore_errors=True)
+            self.queue.task_done()
+
+    def finish(self):
+        """Wait for all queued directories to be removed."""
+        self.queue.join()
+
+cleaner = None
+
 def cleanTempDir(dir):
-    rmtree(dir, ignore_errors=True)
+    if warm_pool:
+        warm_pool.leave(dir)
+    if cleaner:
+        cleaner.queue.put(dir)
+    else:
+        rmtree(dir, ignore_errors=True)
 
 def doDelete(name, dir):
     try:
@@ -152,17 +638,38 @@ def doDelete(name, dir):
 def doCopy(dest, src, dir):
     try:
         doDelete(dest, dir)
-        copyfile(join(src_dir, src), join(dir, dest))
+        fixture_store.copy(src, join(dir, dest))
     except OSError:
         raise ValueError("file {} could not be copied to {}".format(src, dest))
 
-def doExecute(cmnd, dir, timeout, line_num):
-    here = getcwd()
+class OutputError(Exception):
+    """Raised when a command is killed because of its output."""
+
+class LimitExceeded(OutputError):
+    """Raised when a command exceeds its limit of the kind KIND (one of
+    LIMIT_KINDS other than "timeout")."""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+def doExecute(cmnd, dir, timeout, line_num, check=None):
+    """Run gitlet CMND in DIR, from line LINE_NUM of a test, and return a
+    message ("OK" if it succeeded) and its output.  If CHECK is not
+    None, it is the OutputCheck that the output is fed to, and the output
+    returned is normalized."""
     out = ""
     try:
-        chdir(dir)
         full_cmnd = "{} {} {}".format(JAVA_COMMAND, GITLET_CLASS, cmnd)
         skip_first_line = False
+        profiled = profiler and profiler.wanted(cmnd)
+        if profiled:
+            name = "{}-{}".format(
+                splitext(basename(getattr(_tls, 'tests', ["gitlet"])[0]))[0],
+                line_num)
+            full_cmnd = "{} {} {} {}".format(
+                JAVA_COMMAND, " ".join(map(quote, profiler.options(name))),
+                GITLET_CLASS, cmnd)
 
         if DEBUG:
             print("[line {}]: gitlet {}".format(line_num, cmnd))
@@ -175,58 +682,365 @@ def doExecute(cmnd, dir, timeout, line_num):
             if next_cmd == "s":
                 full_cmnd = "{} {} {} {}".format(JAVA_COMMAND, JVM_OPTIONS, GITLET_CLASS, cmnd)
                 timeout, skip_first_line = None, True
+        elif warm_pool and not profiled:
+            try:
+                start = perf_counter()
+                status, out = warm_pool.run(cmnd, dir, timeout)
+                timings.command(cmnd, line_num, status,
+                                perf_counter() - start, None, "warm")
+                if status != 0:
+                    raise CalledProcessError(status, full_cmnd, out)
+                return "OK", finishedOutput(out, check)
+            except WarmJVMError:
+                pass
 
-        out = doCommand(full_cmnd, timeout, skip_first_line)
+        start = perf_counter()
+        _tls.usage = None
+        try:
+            out = doCommand(full_cmnd, dir, timeout, skip_first_line, check)
+        except CalledProcessError as excp:
+            timings.command(cmnd, line_num, excp.returncode,
+                            perf_counter() - start, _tls.usage, _tls.spawn)
+            raise
+        except TimeoutExpired:
+            timings.command(cmnd, line_num, "timeout",
+                            perf_counter() - start, None, _tls.spawn)
+            raise
+        except OutputError as excp:
+            timings.command(cmnd, line_num, getattr(excp, 'kind', "killed"),
+                            perf_counter() - start, _tls.usage, _tls.spawn)
+            raise
+        timings.command(cmnd, line_num, 0, perf_counter() - start,
+                        _tls.usage, _tls.spawn)
         return "OK", out
     except CalledProcessError as excp:
         return ("java gitlet.Main exited with code {}".format(excp.args[0]),
                 excp.output)
     except TimeoutExpired:
         return "timeout", None
-    finally:
-        chdir(here)
+    except OutputError as excp:
+        return excp.args[0], None
 
-def doCommand(full_cmnd, timeout, skip_first_line=False):
-    out = check_output(full_cmnd, shell=True, universal_newlines=True,
-                        stdin=DEVNULL, stderr=STDOUT, timeout=timeout)
-    if skip_first_line:
-        out = out.split("\n", 1)[1]
+def doCommand(full_cmnd, dir, timeout, skip_first_line=False, check=None):
+    """Run FULL_CMND in DIR, as for check_output, and return its output
+    (fed to CHECK, if not None, as for doExecute).  Unless --shell or
+    --debug was given, a command that needs nothing from the shell is run
+    directly, and _tls.spawn records which ("direct" or "shell").  Where
+    possible, the command is reaped with wait4 and its resource usage left
+    in _tls.usage."""
+    argv = direct and not DEBUG and directArgv(full_cmnd)
+    _tls.spawn = "direct" if argv else "shell"
+    if wait4 is None or DEBUG:
+        out = check_output(argv or full_cmnd, shell=not argv,
+                           universal_newlines=True, stdin=DEVNULL,
+                           stderr=STDOUT, timeout=timeout, cwd=dir)
+        if skip_first_line:
+            out = out.split("\n", 1)[1]
+        return finishedOutput(out, check)
+    return measuredOutput(argv or full_cmnd, dir, timeout, check)
 
+def finishedOutput(out, check):
+    """Returns OUT, the complete output of a command that was not read as
+    it arrived, after applying --max-output and CHECK (if not None) to
+    it."""
+    if max_output and len(out) > max_output:
+        raise LimitExceeded("output", "output exceeded {} characters"
+                            .format(max_output))
+    if check:
+        check.feed(out)
+        out = check.finish()
     return out
 
-def canonicalize(s):
-    if s is None:
-        return None
-    return re.sub('\r', '', s)
+def measuredOutput(full_cmnd, dir, timeout, check=None):
+    """Equivalent to check_output for doCommand, except that it sets
+    _tls.usage to the resource usage of FULL_CMND, which is a shell
+    command line or an argument list.  The output is read as it arrives;
+    FULL_CMND is killed, raising OutputError, if it exceeds --max-output
+    or if CHECK (as for doExecute) finds that it is wrong.  FULL_CMND runs
+    in a new process group, subject to the --limit options, raising
+    LimitExceeded if it exceeds one.  The group is killed on a timeout or
+    when a limit is exceeded, always before FULL_CMND's process is reaped
+    (so that its process group id cannot have been reused)."""
+    limited = rlimits and not (prlimit and isinstance(full_cmnd, list))
+    proc = Popen(limitedCommand(full_cmnd) if limited else full_cmnd,
+                 shell=isinstance(full_cmnd, str) and not limited,
+                 universal_newlines=True,
+                 stdin=DEVNULL, stdout=PIPE, stderr=STDOUT, cwd=dir,
+                 start_new_session=True)
+    if rlimits and not limited:
+        try:
+            for kind, limits in rlimits:
+                prlimit(proc.pid, kind, limits)
+        except OSError:
+            pass
+    lock = threading.Lock()
+    reaped = False
+    expired = threading.Event()
+    def expire():
+        with lock:
+            if not reaped:
+                expired.set()
+                killGroup(proc)
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, expire)
+        timer.start()
+    chunks, size, error, tail = [], 0, None, ""
+    try:
+        with proc.stdout:
+            while error is None:
+                chunk = proc.stdout.read(OUTPUT_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                tail = (tail + chunk)[-MEMORY_ERROR_TAIL:]
+                if max_output and size > max_output:
+                    error = LimitExceeded("output",
+                                          "output exceeded {} characters"
+                                          .format(max_output))
+                elif check:
+                    check.feed(chunk)
+                    if check.failed:
+                        error = OutputError("incorrect output")
+                else:
+                    chunks.append(chunk)
+                if error:
+                    killGroup(proc)
+        if waitid:
+            info = waitid(P_PID, proc.pid, WEXITED | WNOWAIT)
+            returncode = info.si_status if info.si_code == CLD_EXITED \
+                         else -info.si_status
+            with lock:
+                reaped = True
+            if not isinstance(error, LimitExceeded) \
+               and not expired.is_set():
+                error = exceededLimit(returncode, error is not None, tail,
+                                      dir) or error
+                if error:
+                    killGroup(proc)
+        pid, status, _tls.usage = wait4(proc.pid, 0)
+        proc.returncode = waitstatus_to_exitcode(status)
+    finally:
+        with lock:
+            reaped = True
+        if timer:
+            timer.cancel()
+    out = "".join(chunks)
+    if expired.is_set():
+        raise TimeoutExpired(full_cmnd, timeout, out)
+    if not waitid and not isinstance(error, LimitExceeded):
+        error = exceededLimit(proc.returncode, error is not None, tail,
+                              dir) or error
+    if error:
+        raise error
+    if check:
+        out = check.finish()
+    if proc.returncode != 0:
+        raise CalledProcessError(proc.returncode, full_cmnd, out)
+    return out
+
+def killGroup(proc):
+    """Kill the process PROC, started in a process group of its own, and
+    everything else in its group.  PROC must not have been reaped."""
+    try:
+        killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+# Run as "python3 -c LIMIT_WRAPPER LIMITS ARGV...": applies LIMITS, a JSON
+# list of [kind, soft, hard], with setrlimit, then executes ARGV.
+LIMIT_WRAPPER = """\
+import os, sys, json, resource
+for kind, soft, hard in json.loads(sys.argv[1]):
+    resource.setrlimit(kind, (soft, hard))
+os.execvp(sys.argv[2], sys.argv[2:])
+"""
+
+def limitedCommand(full_cmnd):
+    """An argument list that runs FULL_CMND (a shell command line or an
+    argument list) subject to the --limit-memory and --limit-cpu limits
+    (RLIMITS), applied before it starts, where prlimit cannot apply them
+    afterwards."""
+    if isinstance(full_cmnd, str):
+        full_cmnd = ["/bin/sh", "-c", full_cmnd]
+    limits = json.dumps([[kind, soft, hard]
+                         for kind, (soft, hard) in rlimits])
+    return [sys.executable, "-c", LIMIT_WRAPPER, limits] + full_cmnd
+
+def exceededLimit(returncode, killed, tail, dir):
+    """Returns a LimitExceeded for the limit exceeded by a command that
+    ran in DIR and exited with RETURNCODE (negative for a signal), and
+    whose output ended with TAIL, or None if it exceeded none.  KILLED is
+    true iff the tester killed the command for its output; otherwise, a
+    SIGKILL under --limit-cpu is taken to be the hard CPU limit."""
+    if cpu_limit and (returncode == -signal.SIGXCPU
+                      or returncode == -signal.SIGKILL and not killed):
+        return LimitExceeded("cpu", "CPU limit exceeded")
+    if memory_limit and returncode != 0 and MEMORY_ERROR.search(tail):
+        return LimitExceeded("memory", "memory limit exceeded")
+    if files_limit and countFiles(dir, files_limit) > files_limit:
+        return LimitExceeded("files", "more than {} files"
+                             .format(files_limit))
+    return None
+
+def countFiles(dir, limit):
+    """The number of files and directories under DIR, or some number
+    greater than LIMIT if there are more than LIMIT."""
+    count = 0
+    pending = [dir]
+    while pending and count <= limit:
+        try:
+            with scandir(pending.pop()) as entries:
+                for entry in entries:
+                    count += 1
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+        except OSError:
+            pass
+    return count
 
 def fileExists(f, dir):
     return exists(join(dir, f))
 
+def checkTree(path, digest, name, everything):
+    """Returns None if directory PATH (NAME in the test) has a tree digest
+    (see treedigest.py) that begins with DIGEST, leaving out .gitlet
+    directories unless EVERYTHING, and an error message otherwise."""
+    actual = treeDigest(path, not everything)
+    if actual is None:
+        return "directory {} not present".format(name)
+    if not actual.startswith(digest):
+        return "directory {} has digest {}".format(name, actual)
+    return None
+
 def correctFileOutput(name, expected, dir):
-    userData = canonicalize(contents(join(dir, name)))
-    stdData = canonicalize(contents(join(src_dir, expected)))
-    return userData == stdData
+    return fixture_store.matches(join(dir, name), expected)
+
+def normalizedOutput(text):
+    """TEXT with blanks removed from the ends of its lines and replaced by
+    a single space at their beginnings.  Lines are normalized
+    independently, so TEXT may be output split after any newline."""
+    text = re.sub(r'[ \t]+\n', '\n', text)
+    return re.sub(r'(?m)^[ \t]+', ' ', text)
 
 def correctProgramOutput(expected, actual, last_groups, is_regexp):
-    expected = re.sub(r'[ \t]+\n', '\n', '\n'.join(expected))
-    expected = re.sub(r'(?m)^[ \t]+', ' ', expected)
-    actual = re.sub(r'[ \t]+\n', '\n', actual)
-    actual = re.sub(r'(?m)^[ \t]+', ' ', actual)
+    expected = normalizedOutput('\n'.join(expected))
+    actual = normalizedOutput(actual)
 
     last_groups[:] = (actual,)
     if is_regexp:
         try:
-            if not Match(expected.rstrip() + r"\Z", actual) \
-                   and not Match(expected.rstrip() + r"\Z", actual.rstrip()):
-                return False
-        except:
+            groups = outputMatch(expected.rstrip(), actual, match_limit)
+        except PatternTooExpensive:
+            raise ValueError("pattern too expensive (over {:g} s)"
+                             .format(match_limit))
+        except re.error:
             raise ValueError("bad pattern")
-        last_groups[:] += Mat.groups()
-    elif editDistance(expected.rstrip(), actual.rstrip()) > output_tolerance:
+        if groups is None:
+            return False
+        last_groups[:] += groups
+    elif editDistance(expected.rstrip(), actual.rstrip(),
+                      output_tolerance) > output_tolerance:
         return False
     return True
 
+class OutputCheck:
+    """Compares the output of a command, fed to it as it arrives, with the
+    lines EXPECTED of a "<<<" block, as correctProgramOutput does with
+    TOLERANCE as the allowed edit distance.  Only the output following the
+    longest prefix that matches EXPECTED is kept.  FAILED is true once the
+    output is known to be wrong, which may be before all of it is fed:
+    when it is too long, or when the output so far (up to its last
+    non-blank) is more than TOLERANCE edits from every prefix of EXPECTED,
+    a lower bound on its distance from EXPECTED however it continues.
+    The bound is kept as a band of the edit distance matrix, computed by
+    distance.bandRow as in editDistance, one row per character of output
+    past the matched prefix."""
+
+    def __init__(self, expected, tolerance):
+        self.expected = normalizedOutput('\n'.join(expected)).rstrip()
+        self.tolerance = tolerance
+        self.failed = False
+        self.matched = 0
+        self.rest = []
+        self.rest_size = 0
+        self.partial = []
+        self.row = None
+        self.row_num = self.blanks = None
+
+    def feed(self, text):
+        """Add TEXT to the output."""
+        k = text.rfind('\n')
+        if k < 0:
+            self.partial.append(text)
+            return
+        self.partial.append(text[:k + 1])
+        self.add(normalizedOutput("".join(self.partial)))
+        self.partial = [text[k + 1:]]
+
+    def add(self, text):
+        """Add TEXT, normalized output ending at the end of a line, or the
+        normalized end of the output."""
+        if not self.rest:
+            if self.expected.startswith(text, self.matched):
+                self.matched += len(text)
+                return
+            k = commonPrefixLength(text,
+                                   self.expected[self.matched:
+                                                 self.matched + len(text)])
+            self.matched += k
+            text = text[k:]
+        self.rest.append(text)
+        self.rest_size += len(text)
+        solid = len(text.rstrip())
+        # The distance is at least the excess of the output past the
+        # matched prefix, up to its last non-blank, over the rest of
+        # EXPECTED.
+        if solid and self.rest_size - len(text) + solid \
+           > len(self.expected) - self.matched + self.tolerance:
+            self.failed = True
+        else:
+            self.bound(text)
+
+    def bound(self, text):
+        """Extend the band of edit distances between the output and the
+        prefixes of EXPECTED with TEXT, the latest of the output past the
+        matched prefix, setting FAILED if every distance exceeds the
+        tolerance.  Trailing blanks are held back until followed by
+        something else, since they do not count at the end."""
+        limit, expected = self.tolerance, self.expected
+        if self.row is None:
+            self.row_num, self.blanks = self.matched, ""
+            self.row = firstBandRow(self.matched, len(expected), limit)
+        text = self.blanks + text
+        solid = len(text.rstrip())
+        self.blanks = text[solid:]
+        row, i = self.row, self.row_num
+        for k in range(solid):
+            i += 1
+            row = bandRow(row, i, text[k], expected, 0, len(expected), limit)
+            if min(row) > limit:
+                self.failed = True
+                break
+        self.row, self.row_num = row, i
+
+    def finish(self):
+        """Returns the normalized output, once it is all fed, setting
+        FAILED if it is wrong."""
+        self.add(normalizedOutput("".join(self.partial)))
+        self.partial = []
+        actual = self.expected[:self.matched] + "".join(self.rest)
+        if editDistance(self.expected, actual.rstrip(),
+                        self.tolerance) > self.tolerance:
+            self.failed = True
+        return actual
+
 def reportDetails(test, included_files, line_num):
+    if getattr(_tls, 'buffer', None) is not None:
+        # Running in a worker: leave the decision to the main thread, which
+        # sees the tests' results in order.
+        _tls.details = (test, included_files, line_num)
+        return
     if show is None:
         return
     if show <= 0:
@@ -267,126 +1081,1219 @@ def line_reader(f, prefix):
     except FileNotFoundError:
         raise ValueError("file {} not found".format(f))
 
-def doTest(test):
-    last_groups = []
-    base = splitext(basename(test))[0]
-    print("{}:".format(base))
-    cdir = tmpdir = createTempDir(base)
-
-    if verbose:
-        print("Testing directory: {}".format(tmpdir))
+# Format of compiled tests; change whenever compileTest's output changes.
+COMPILED_FORMAT = 3
+# Directory of the compiled tests cached by compileTest (set from
+# --cachedir), or None.
+compile_cache = None
 
-    if DEBUG:
-        print(DEBUG_MSG)
+def compileTest(test):
+    """Returns the instructions of TEST, with includes resolved, as a list
+    of tuples (LINE_NUM, TEXT, DYNAMIC, OP, ARGS), together with the list
+    of files it includes.  OP is one of the instruction letters, TEXT is
+    the line after substitution, and ARGS are OP's operands.  For ">",
+    ARGS is (COMMAND, EXPECTED, IS_REGEXP), where EXPECTED is a tuple of
+    lines.  For "R", ARGS is (VAR, COUNT, BODY), where BODY is a tuple of
+    the instructions to be repeated.  Substitutions of variables defined
+    with constant values are made here; DYNAMIC is true if TEXT or ARGS
+    still contain references to captured groups (or to variables defined
+    from them, or defined in the body of a repeat), which doTest must
+    substitute when the instruction is executed.  Raises ValueError for an
+    ill-formed test.  Compiled tests are cached in compile_cache, if set,
+    keyed by the contents of TEST and its includes."""
+    key = None
+    if compile_cache:
+        data = fileBytes(test)
+        if data is None:
+            raise ValueError("file {} not found".format(test))
+        key = hashlib.sha1(repr((COMPILED_FORMAT, abspath(test))).encode()
+                           + data).hexdigest()
+        cached = loadCompiled(key)
+        if cached is not None:
+            return cached
 
-    timeout = TIMEOUT
     defns = {}
+    dynamic_vars = set()
+    program = []
+    included_files = []
+    dependencies = []
 
-    def do_substs(L):
+    def static_substs(L):
         c = 0
         L0 = None
         while L0 != L and c < 10:
             c += 1
             L0 = L
-            L = re.sub(r'\$\{(.*?)\}', subst_var, L)
+            L = re.sub(r'\$\{(.*?)\}', static_var, L)
         return L
 
-    def subst_var(M):
+    def static_var(M):
+        key = M.group(1)
+        if re.match(r'\d+$', key) or key in dynamic_vars:
+            return M.group(0)
+        elif key in defns:
+            return defns[key]
+        else:
+            raise ValueError("undefined substitution: ${{{}}}".format(key))
+
+    def is_dynamic(*texts):
+        return any('${' in text for text in texts)
+
+    # Lines read ahead of the current one, to be read again.
+    pending = []
+
+    def next_line():
+        if pending:
+            return pending.pop(0)
+        return next(inp, (line_num, ''))
+
+    def include(name):
+        inp.send(join(dirname(test), name))
+        included_files.append(name)
+        dependencies.append(join(dirname(test), name))
+
+    def repeated_definitions():
+        """The variables that D defines in the body of the repeat just
+        begun, whose lines (other than includes, which are followed) are
+        read ahead into PENDING."""
+        lines = []
+        names = set()
+        depth = 1
+        in_output = False
+        while depth > 0:
+            item = next_line()
+            L = item[1]
+            if L == '':
+                break
+            if in_output:
+                in_output = not re.match(r'<<<', L)
+            elif re.match(r'I\s+(\S+)', L):
+                include(re.match(r'I\s+(\S+)', static_substs(L)).group(1))
+                continue
+            elif re.match(r'>', L):
+                in_output = True
+            elif re.match(r'R\s+\S+\s+\S+\s*$', L):
+                depth += 1
+            elif re.match(r'R\s*$', L):
+                depth -= 1
+            elif re.match(r'D\s*[a-zA-Z_][a-zA-Z_0-9]*\s*"', L):
+                names.add(re.match(r'D\s*(\w*)', L).group(1))
+            lines.append(item)
+        pending[:0] = lines
+        return names
+
+    # The instruction lists and "R" lines of the enclosing repeat blocks.
+    enclosing = []
+    line_num = None
+    inp = line_reader(test, '')
+    while True:
+        line_num, line = next_line()
+        if line == "":
+            if enclosing:
+                raise ValueError("unterminated repeat at line {}"
+                                 .format(enclosing[-1][1]))
+            break
+        if not Match(r'\s*#', line):
+            line = static_substs(line)
+        if Match(r'\s*#', line) or Match(r'\s+$', line):
+            continue
+        text = line.rstrip()
+        if Match(r'I\s+(\S+)', line):
+            include(Group(1))
+            continue
+        elif Match(r'C\s*(\S*)', line):
+            op, args = 'C', (Group(1),)
+        elif Match(r'T\s*(\S+)', line):
+            op, args = 'T', (Group(1),)
+        elif Match(r'\+\s*(\S+)\s+(\S+)', line):
+            op, args = '+', (Group(1), Group(2))
+        elif Match(r'-\s*(\S+)', line):
+            op, args = '-', (Group(1),)
+        elif Match(r'>\s*(.*)', line):
+            cmnd = Group(1)
+            expected = []
+            while True:
+                line_num, L = next_line()
+                if L == '':
+                    raise ValueError("unterminated command: {}"
+                                     .format(line))
+                L = L.rstrip()
+                if Match(r'<<<(\*?)', L):
+                    is_regexp = Group(1)
+                    break
+                expected.append(static_substs(L))
+            op, args = '>', (cmnd, tuple(expected), is_regexp)
+            program.append((line_num, text, is_dynamic(cmnd, *expected),
+                            op, args))
+            continue
+        elif Match(r'=\s*(\S+)\s+(\S+)', line):
+            op, args = '=', (Group(1), Group(2))
+        elif Match(r'\*\s*(\S+)', line):
+            op, args = '*', (Group(1),)
+        elif Match(r'E\s*(\S+)', line):
+            op, args = 'E', (Group(1),)
+        elif Match(r'H(\*?)\s*([0-9a-fA-F]{8,})(?:\s+(\S+))?\s*$', line):
+            op, args = 'H', (Group(2).lower(), Group(3) or '.', Group(1))
+        elif Match(r'R\s+([a-zA-Z_][a-zA-Z_0-9]*)\s+(\S+)\s*$', line):
+            enclosing.append((program, line_num, text, Group(1), Group(2)))
+            # The variables defined in the body may change from one
+            # iteration to the next (and the body may not run at all), so
+            # they are substituted as it is executed, as is its counter.
+            for var in {Group(1)} | repeated_definitions():
+                dynamic_vars.add(var)
+                defns.pop(var, None)
+            program = []
+            continue
+        elif Match(r'R\s*$', line):
+            if not enclosing:
+                raise ValueError("unmatched end of repeat at line {}"
+                                 .format(line_num))
+            body = tuple(program)
+            program, start, text, var, count = enclosing.pop()
+            program.append((start, text, is_dynamic(count), 'R',
+                            (var, count, body)))
+            continue
+        elif Match(r'G\s*(\S+)\s+(\S+)\s+(\S+)', line):
+            op, args = 'G', (Group(1), Group(2), Group(3))
+        elif Match(r'(?s)D\s*([a-zA-Z_][a-zA-Z_0-9]*)\s*"(.*)"\s*$', line):
+            op, args = 'D', (Group(1), Group(2))
+            if is_dynamic(Group(2)) or enclosing:
+                dynamic_vars.add(Group(1))
+                defns.pop(Group(1), None)
+            else:
+                dynamic_vars.discard(Group(1))
+                defns[Group(1)] = Group(2)
+        else:
+            raise ValueError("bad test line at {}".format(line_num))
+        program.append((line_num, text, is_dynamic(*args), op, args))
+
+    result = program, included_files
+    if key:
+        saveCompiled(key, result, dependencies)
+    return result
+
+def fileBytes(name):
+    """Returns the contents of file NAME as bytes, or None if it does not
+    exist or cannot be read (a directory, say)."""
+    try:
+        with open(name, 'rb') as inp:
+            return inp.read()
+    except OSError:
+        return None
+
+# Compiled tests already loaded or saved by this process, as for
+# loadCompiled, so that --watch does not read them again.
+_compiled = {}
+
+def loadCompiled(key):
+    """Returns the compiled test cached under KEY, or None if there is none
+    or any of the files it included have changed since."""
+    if key in _compiled:
+        result, dependencies = _compiled[key]
+    else:
+        try:
+            with open(join(compile_cache, key), 'rb') as inp:
+                result, dependencies = pickle.load(inp)
+        except (OSError, pickle.PickleError, EOFError, ValueError):
+            return None
+        _compiled[key] = result, dependencies
+    for name, digest in dependencies:
+        data = fileBytes(name)
+        if data is None or hashlib.sha1(data).hexdigest() != digest:
+            return None
+    return result
+
+def saveCompiled(key, result, dependencies):
+    """Cache the compiled test RESULT under KEY, together with the digests
+    of the files named in DEPENDENCIES."""
+    digests = [(name, hashlib.sha1(fileBytes(name)).hexdigest())
+               for name in set(dependencies)]
+    _compiled[key] = result, digests
+    try:
+        makedirs(compile_cache, exist_ok=True)
+        temp = join(compile_cache, "{}.{}".format(key, threading.get_ident()))
+        with open(temp, 'wb') as out:
+            pickle.dump((result, digests), out)
+        replace(temp, join(compile_cache, key))
+    except OSError:
+        pass
+
+class ResultCache:
+    """Fingerprints of the tests that passed on earlier runs, kept in the
+    JSON file FILENAME.  A test's fingerprint covers TEST.in, the files it
+    includes, the files in the source directory it refers to, the gitlet
+    class files on the CLASSPATH, and the tester settings that affect the
+    outcome.  If REUSE, tests whose fingerprint matches that of an earlier
+    passing run are not run again."""
+
+    def __init__(self, filename, reuse):
+        self.filename = filename
+        self.reuse = reuse
+        self.lock = threading.Lock()
+        try:
+            with open(filename) as inp:
+                self.passed = json.load(inp)
+        except (OSError, ValueError):
+            self.passed = {}
+        self.refresh()
+
+    def refresh(self):
+        """Recompute the part of the fingerprints that covers the gitlet
+        classes and the tester settings and sources (tester.py and the
+        helper modules it imports from its directory), which --watch calls
+        after recompiling gitlet."""
+        self.setup = hashlib.sha1(repr(
+            (JAVA_COMMAND, TIMEOUT, output_tolerance, match_limit,
+             max_output, memory_limit, cpu_limit, files_limit,
+             abspath(src_dir), classDigest(),
+             [(basename(name), fileBytes(name))
+              for name in testerSources()])).encode()).digest()
+
+    def fingerprint(self, test):
+        """Returns TEST's fingerprint."""
+        program, included_files = compileTest(test)
+        digest = hashlib.sha1(self.setup)
+        for name in [test] + [join(dirname(test), f) for f in included_files]:
+            digest.update(fileDigest(name).encode())
+        fixtures = set()
+        for line_num, text, dynamic, op, args in allInstructions(program):
+            if op in "+=":
+                if dynamic:
+                    fixtures.update(srcFiles())
+                else:
+                    fixtures.add(args[1])
+        for name in sorted(fixtures):
+            digest.update(name.encode() + fileDigest(join(src_dir, name))
+                          .encode())
+        return digest.hexdigest()
+
+    def unchanged(self, test, fingerprint):
+        """True iff TEST need not be run again, given its FINGERPRINT."""
+        return self.reuse and self.passed.get(abspath(test)) == fingerprint
+
+    def record(self, test, fingerprint, passed):
+        with self.lock:
+            if passed:
+                self.passed[abspath(test)] = fingerprint
+            else:
+                self.passed.pop(abspath(test), None)
+
+    def save(self):
+        try:
+            makedirs(dirname(self.filename) or '.', exist_ok=True)
+            with open(self.filename, 'w') as out:
+                json.dump(self.passed, out, indent=1, sort_keys=True)
+        except OSError:
+            pass
+
+class TestHistory:
+    """The durations of tests on earlier runs and the times they last
+    failed, kept in the JSON file FILENAME."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            with open(filename) as inp:
+                self.tests = json.load(inp)
+        except (OSError, ValueError):
+            self.tests = {}
+
+    def duration(self, test):
+        """The recorded duration of TEST in seconds, or None."""
+        return self.tests.get(abspath(test), {}).get("duration")
+
+    def failed(self, test):
+        """The time (as from time.time) when TEST last had an error or was
+        found faulty, or None."""
+        return self.tests.get(abspath(test), {}).get("failed")
+
+    def update(self, records):
+        """Record the durations and failures of the tests in RECORDS, as
+        kept by Timings.  Each duration is averaged with the one recorded
+        before, to damp the noise in a single run.  The durations of tests
+        that were not run to completion are ignored."""
+        for info in records:
+            entry = self.tests.setdefault(abspath(info["file"]), {})
+            if info["result"] in ("error", "failed"):
+                entry["failed"] = time()
+            if info["result"] not in ("passed", "error") \
+               or info["wall"] is None:
+                continue
+            old = entry.get("duration")
+            entry["duration"] = info["wall"] if old is None \
+                                else (old + info["wall"]) / 2
+
+    def save(self):
+        try:
+            makedirs(dirname(self.filename) or '.', exist_ok=True)
+            temp = "{}.{}".format(self.filename, getpid())
+            with open(temp, 'w') as out:
+                json.dump(self.tests, out, indent=1, sort_keys=True)
+            replace(temp, self.filename)
+        except OSError:
+            pass
+
+def testSize(test):
+    """The number of bytes in TEST and the files it includes."""
+    try:
+        included_files = compileTest(test)[1]
+    except (ValueError, OSError):
+        included_files = []
+    size = 0
+    for name in [test] + [join(dirname(test), f) for f in included_files]:
+        try:
+            size += stat(name).st_size
+        except OSError:
+            pass
+    return size
+
+def estimatedDurations(files):
+    """Returns a list of the estimated durations of the tests in FILES.
+    Tests with no recorded duration are assumed to run at the average
+    rate, in seconds per byte of testSize, of those that have one."""
+    recorded = [history.duration(test) if history else None
+                for test in files]
+    sizes = [testSize(test) for test in files]
+    known = [(d, n) for d, n in zip(recorded, sizes) if d is not None]
+    rate = 1.0
+    if known and sum(n for d, n in known) > 0:
+        rate = sum(d for d, n in known) / sum(n for d, n in known)
+    return [rate * n if d is None else d for d, n in zip(recorded, sizes)]
+
+def shardTests(files, shard, shards):
+    """Returns the tests in FILES (in order) that make up shard SHARD,
+    numbered from 1, of SHARDS shards.  Tests are assigned, longest
+    estimated duration first, to the shard with the least total so far."""
+    durations = estimatedDurations(files)
+    loads = [0.0] * shards
+    owners = [None] * len(files)
+    for k in sorted(range(len(files)),
+                    key=lambda k: (-durations[k], files[k])):
+        owner = min(range(shards), key=lambda s: (loads[s], s))
+        loads[owner] += durations[k]
+        owners[k] = owner
+    return [test for test, owner in zip(files, owners)
+            if owner == shard - 1]
+
+def orderTests(files, order):
+    """Returns the tests in FILES in the order ORDER: "given", "longest"
+    (by estimated duration), or "failed" (most recent failure first)."""
+    if order == "longest":
+        keys = [-duration for duration in estimatedDurations(files)]
+    elif order == "failed" and history:
+        keys = [-(history.failed(test) or 0) for test in files]
+    else:
+        return files
+    # Python's sort is stable, so ties stay in the order given.
+    return [files[k] for k in sorted(range(len(files)),
+                                     key=lambda k: keys[k])]
+
+def mergeReports(prefix, reports):
+    """Combine the --report JSON files REPORTS into PREFIX.json and
+    PREFIX.xml, record their tests' durations, and print the results.
+    Returns the exit status for the tester."""
+    merged = Timings()
+    for name in reports:
+        start = len(merged.tests)
+        try:
+            merged.load(name)
+        except (OSError, ValueError, KeyError):
+            print("Could not read report {}.".format(name), file=sys.stderr)
+            return 1
+        print("{}: {} tests, {:.1f}s".format(
+            name, len(merged.tests) - start,
+            sum(info["wall"] or 0.0 for info in merged.tests[start:])))
+    merged.write(prefix)
+    if history:
+        history.update(merged.tests)
+        history.save()
+    results = [info["result"] for info in merged.tests
+               if info["result"] != "skipped"]
+    passed = results.count("passed") + results.count("unchanged")
+    print("Ran {} tests. ".format(len(results)), end="")
+    if passed == len(results):
+        print("All passed.")
+        return 0
+    print("{} passed.".format(passed))
+    return 1
+
+def allInstructions(program):
+    """Yields the instructions in PROGRAM, including those in the bodies
+    of repeat blocks."""
+    for instr in program:
+        yield instr
+        if instr[3] == 'R':
+            yield from allInstructions(instr[4][2])
+
+def testerSources():
+    """The source files of tester.py and of the modules loaded from its
+    directory, in order."""
+    home = dirname(abspath(__file__))
+    sources = {abspath(__file__)}
+    for module in list(sys.modules.values()):
+        name = getattr(module, '__file__', None)
+        if name and name.endswith(".py") and dirname(abspath(name)) == home:
+            sources.add(abspath(name))
+    return sorted(sources)
+
+def srcFiles():
+    """The names of the regular files in src_dir."""
+    try:
+        return [entry.name for entry in scandir(src_dir) if entry.is_file()]
+    except OSError:
+        return []
+
+def fileDigest(name):
+    """Returns the SHA-1 digest of file NAME's contents, or "missing"."""
+    data = fileBytes(name)
+    return "missing" if data is None else hashlib.sha1(data).hexdigest()
+
+def classDigest():
+    """Returns a digest of the gitlet class files on the CLASSPATH and of
+    the sizes and modification times of any JAR files on it."""
+    digest = hashlib.sha1()
+    for entry in environ.get('CLASSPATH', '').split(pathsep):
+        if entry.endswith('*'):
+            jars = sorted(glob(join(entry[:-1] or '.', '*.jar')))
+        elif isfile(entry):
+            jars = [entry]
+        else:
+            jars = []
+            for name in sorted(glob(join(entry or '.', 'gitlet',
+                                         '*.class'))):
+                digest.update(name.encode() + fileDigest(name).encode())
+        for jar in jars:
+            info = stat(jar)
+            digest.update(repr((jar, info.st_size, info.st_mtime_ns))
+                          .encode())
+    return digest.hexdigest()
+
+class TestState:
+    """The state of a test in progress: its directory TMPDIR, the
+    subdirectory SUB of TMPDIR selected by the last C instruction, the
+    timeout set by T, the variables defined by D, and the groups captured
+    by the last > command.  ELAPSED is the time spent so far, and LINE_NUM
+    the line number of the last instruction executed.  IDS numbers the
+    commit ids seen in output, for --diff and --replay, and USAGE holds
+    the last --growth measurement of each subdirectory."""
+
+    def __init__(self, tmpdir):
+        self.tmpdir = tmpdir
+        self.sub = ""
+        self.timeout = TIMEOUT
+        self.defns = {}
+        self.last_groups = []
+        self.elapsed = 0.0
+        self.line_num = None
+        self.ids = {}
+        self.usage = {}
+
+    @property
+    def cdir(self):
+        return join(self.tmpdir, self.sub) if self.sub else self.tmpdir
+
+    def fork(self, base):
+        """Returns a copy of this state, with a copy of its directory in a
+        new directory named after BASE."""
+        other = TestState(createTempDir(base))
+        copytree(self.tmpdir, other.tmpdir, symlinks=True,
+                 dirs_exist_ok=True)
+        other.sub, other.timeout = self.sub, self.timeout
+        other.defns = dict(self.defns)
+        other.last_groups = list(self.last_groups)
+        other.elapsed = self.elapsed
+        other.ids = dict(self.ids)
+        other.usage = dict(self.usage)
+        return other
+
+    def substitute(self, L):
+        """Returns L with its ${...} references replaced."""
+        c = 0
+        L0 = None
+        while L0 != L and c < 10:
+            c += 1
+            L0 = L
+            L = re.sub(r'\$\{(.*?)\}', self.subst_var, L)
+        return L
+
+    def subst_var(self, M):
         key = M.group(1)
         if Match(r'\d+$', key):
             try:
-                return last_groups[int(key)]
+                return self.last_groups[int(key)]
             except IndexError:
                 raise ValueError("FAILED (nonexistent group: {{{}}})"
                                  .format(key))
-        elif M.group(1) in defns:
-            return defns[M.group(1)]
+        elif M.group(1) in self.defns:
+            return self.defns[M.group(1)]
         else:
             raise ValueError("undefined substitution: ${{{}}}".format(M.group(1)))
 
+class Stopped(Exception):
+    """Raised in place of running a gitlet command once --maxfail tests
+    have failed."""
+
+def stopped():
+    """True iff no more gitlet commands should be started."""
+    return maxfail is not None and timings.failures >= maxfail
+
+def substituted(state, instr):
+    """Returns the text and operands of the compiled instruction INSTR,
+    with the substitutions still needed in STATE made."""
+    line_num, text, dynamic, op, args = instr
+    if dynamic:
+        text = state.substitute(text)
+        if op == '>':
+            args = (state.substitute(args[0]),
+                    [state.substitute(L) for L in args[1]], args[2])
+        elif op == 'R':
+            args = (args[0], state.substitute(args[1]), args[2])
+        else:
+            args = tuple(map(state.substitute, args))
+    return text, args
+
+def doStep(state, instr):
+    """Execute the compiled instruction INSTR in STATE.  Returns None if it
+    succeeds, and otherwise a description of the error."""
+    line_num, _, _, op, _ = instr
+    state.line_num = line_num
+    text, args = substituted(state, instr)
+    if verbose:
+        print("+ {}".format(text))
+    if op == 'C':
+        state.sub = args[0]
+        if not exists(state.cdir):
+            mkdir(state.cdir)
+    elif op == 'T':
+        try:
+            state.timeout = float(args[0])
+        except:
+            ValueError("bad time: {}".format(text))
+    elif op == '+':
+        doCopy(args[0], args[1], state.cdir)
+    elif op == '-':
+        doDelete(args[0], state.cdir)
+    elif op == '>':
+        if stopped():
+            raise Stopped()
+        cmnd, expected, is_regexp = args
+        check = None
+        if not is_regexp and not verbose:
+            check = OutputCheck(expected, output_tolerance)
+        msg, out = doExecute(cmnd, state.cdir, state.timeout, line_num,
+                             check)
+        if growth_log:
+            usage = gitletUsage(state.cdir)
+            growth_log.record(list(getattr(_tls, 'tests', [])), line_num,
+                              cmnd, state.usage.get(state.sub, (0, 0, 0)),
+                              usage)
+            state.usage[state.sub] = usage
+        if verbose:
+            if out:
+                print(re.sub(r'(?m)^', '- ', chop_nl(out)))
+        if msg == "OK":
+            if check:
+                state.last_groups[:] = (out,)
+                if check.failed:
+                    msg = "incorrect output"
+            elif not correctProgramOutput(expected, out, state.last_groups,
+                                          is_regexp):
+                msg = "incorrect output"
+        if msg != "OK":
+            return msg
+    elif op == '=':
+        if not correctFileOutput(args[0], args[1], state.cdir):
+            return "file {} has incorrect content".format(args[0])
+    elif op == '*':
+        if fileExists(args[0], state.cdir):
+            return "file {} present".format(args[0])
+    elif op == 'E':
+        if not fileExists(args[0], state.cdir):
+            return "file or directory {} not present".format(args[0])
+    elif op == 'H':
+        msg = checkTree(join(state.cdir, args[1]), *args)
+        if msg is not None:
+            return msg
+    elif op == 'D':
+        state.defns[args[0]] = args[1]
+    elif op == 'G':
+        generateFile(join(state.cdir, args[0]), fileSize(args[1]), args[2])
+    elif op == 'R':
+        var, count, body = args
+        try:
+            count = int(count)
+        except ValueError:
+            raise ValueError("bad repeat count: {}".format(count))
+        for k in range(1, count + 1):
+            state.defns[var] = str(k)
+            for instr in body:
+                msg = doStep(state, instr)
+                if msg is not None:
+                    return msg
+    return None
+
+def diffStep(student, staff, instr):
+    """Execute the compiled instruction INSTR in the states STUDENT and
+    STAFF of a test run with --diff.  Returns None if the two agree, and
+    otherwise a description of the first difference."""
+    line_num, _, _, op, _ = instr
+    student.line_num = staff.line_num = line_num
+    if op == '>':
+        return diffCommand(student, staff, instr)
+    elif op == 'R':
+        var, count, body = substituted(student, instr)[1]
+        try:
+            count = int(count)
+        except ValueError:
+            raise ValueError("bad repeat count: {}".format(count))
+        for k in range(1, count + 1):
+            student.defns[var] = staff.defns[var] = str(k)
+            for instr in body:
+                msg = diffStep(student, staff, instr)
+                if msg is not None:
+                    return msg
+        return None
+    msg, staff_msg = doStep(student, instr), doStep(staff, instr)
+    if msg != staff_msg:
+        return "{} with gitlet.Main, but {} with staff-gitlet" \
+            .format(msg or "OK", staff_msg or "OK")
+    return None
+
+def diffCommand(student, staff, instr):
+    """Run the ">" instruction INSTR with gitlet.Main in STUDENT and with
+    staff-gitlet in STAFF, at the same time, and compare the results, as
+    for diffStep."""
+    if stopped():
+        raise Stopped()
+    line_num = instr[0]
+    cmnd, expected, is_regexp = substituted(student, instr)[1]
+    staff_cmnd, staff_expected, _ = substituted(staff, instr)[1]
+    if verbose:
+        print("+ {}".format(instr[1]))
+    staff_run = diff_pool.submit(staffExecute, staff_cmnd, staff.cdir,
+                                 staff.timeout)
+    msg, out = doExecute(cmnd, student.cdir, student.timeout, line_num)
+    staff_msg, staff_out = staff_run.result()
+    status, staff_status = commandStatus(msg), commandStatus(staff_msg)
+    if status != staff_status:
+        return "exit status {} with gitlet.Main, but {} with staff-gitlet" \
+            .format(status, staff_status)
+    if out is None or staff_out is None:
+        return None
+    # Fill in the captured groups of each run from its own output.
+    correctProgramOutput(expected, out, student.last_groups, is_regexp)
+    correctProgramOutput(staff_expected, staff_out, staff.last_groups,
+                         is_regexp)
+    out = maskedOutput(normalizedOutput(out), student.ids)
+    staff_out = maskedOutput(normalizedOutput(staff_out), staff.ids)
+    if out != staff_out:
+        printDifferences(staff_out, out)
+        return "output differs from staff-gitlet's"
+    if treeDigest(student.tmpdir) != treeDigest(staff.tmpdir):
+        files, staff_files = treeFiles(student.tmpdir), treeFiles(staff.tmpdir)
+        names = sorted(name for name in set(files) | set(staff_files)
+                       if files.get(name, 0) != staff_files.get(name, 0))
+        return "files differ from staff-gitlet's: {}".format(", ".join(names))
+    return None
+
+def printDifferences(staff_out, out):
+    """Print the start of the differences between the masked outputs
+    STAFF_OUT of staff-gitlet and OUT of gitlet.Main."""
+    for line in list(difflib.unified_diff(
+            staff_out.split('\n'), out.split('\n'), "staff-gitlet",
+            "gitlet.Main", n=1, lineterm=''))[:DIFF_LINES]:
+        print("    " + line)
+
+def staffExecute(cmnd, dir, timeout):
+    """Run staff-gitlet CMND in DIR, returning a message and its output as
+    for doExecute."""
     try:
-        line_num = None
-        inp = line_reader(test, '')
-        included_files = []
-        while True:
-            line_num, line = next(inp, (line_num, ''))
-            if line == "":
-                print("OK")
-                return True
-            if not Match(r'\s*#', line):
-                line = do_substs(line)
-            if verbose:
-                print("+ {}".format(line.rstrip()))
-            if Match(r'\s*#', line) or Match(r'\s+$', line):
-                pass
-            elif Match(r'I\s+(\S+)', line):
-                inp.send(join(dirname(test), Group(1)))
-                included_files.append(Group(1))
-            elif Match(r'C\s*(\S*)', line):
-                if Group(1) == "":
-                    cdir = tmpdir
-                else:
-                    cdir = join(tmpdir, Group(1))
-                    if not exists(cdir):
-                        mkdir(cdir)
-            elif Match(r'T\s*(\S+)', line):
-                try:
-                    timeout = float(Group(1))
-                except:
-                    ValueError("bad time: {}".format(line))
-            elif Match(r'\+\s*(\S+)\s+(\S+)', line):
-                doCopy(Group(1), Group(2), cdir)
-            elif Match(r'-\s*(\S+)', line):
-                doDelete(Group(1), cdir)
-            elif Match(r'>\s*(.*)', line):
-                cmnd = Group(1)
-                expected = []
-                while True:
-                    line_num, L = next(inp, (line_num, ''))
-                    if L == '':
-                        raise ValueError("unterminated command: {}"
-                                         .format(line))
-                    L = L.rstrip()
-                    if Match(r'<<<(\*?)', L):
-                        is_regexp = Group(1)
-                        break
-                    expected.append(do_substs(L))
-                msg, out = doExecute(cmnd, cdir, timeout, line_num)
-                if verbose:
-                    if out:
-                        print(re.sub(r'(?m)^', '- ', chop_nl(out)))
-                if msg == "OK":
-                    if not correctProgramOutput(expected, out, last_groups,
-                                                is_regexp):
-                        msg = "incorrect output"
-                if msg != "OK":
-                    print("ERROR ({})".format(msg))
-                    reportDetails(test, included_files, line_num)
-                    return False
-            elif Match(r'=\s*(\S+)\s+(\S+)', line):
-                if not correctFileOutput(Group(1), Group(2), cdir):
-                    print("ERROR (file {} has incorrect content)"
-                          .format(Group(1)))
-                    reportDetails(test, included_files, line_num)
-                    return False
-            elif Match(r'\*\s*(\S+)', line):
-                if fileExists(Group(1), cdir):
-                    print("ERROR (file {} present)".format(Group(1)))
-                    reportDetails(test, included_files, line_num)
-                    return False
-            elif Match(r'E\s*(\S+)', line):
-                if not fileExists(Group(1), cdir):
-                    print("ERROR (file or directory {} not present)"
-                          .format(Group(1)))
-                    reportDetails(test, included_files, line_num)
-                    return False
-            elif Match(r'(?s)D\s*([a-zA-Z_][a-zA-Z_0-9]*)\s*"(.*)"\s*$', line):
-                defns[Group(1)] = Group(2)
+        return "OK", doCommand("{} {}".format(STAFF_COMMAND, cmnd), dir,
+                               timeout)
+    except CalledProcessError as excp:
+        return ("staff-gitlet exited with code {}".format(excp.args[0]),
+                excp.output)
+    except TimeoutExpired:
+        return "timeout", None
+    except OutputError as excp:
+        return excp.args[0], None
+
+def replayStep(state, instr, goldens):
+    """Execute the compiled instruction INSTR in STATE, comparing each ">"
+    command with the next of GOLDENS, an iterator over the golden steps of
+    the test, as for --replay.  Returns None if they agree, and otherwise
+    a description of the first difference."""
+    line_num, _, _, op, _ = instr
+    if op == '>':
+        return replayCommand(state, instr, next(goldens, None))
+    elif op == 'R':
+        state.line_num = line_num
+        var, count, body = substituted(state, instr)[1]
+        try:
+            count = int(count)
+        except ValueError:
+            raise ValueError("bad repeat count: {}".format(count))
+        for k in range(1, count + 1):
+            state.defns[var] = str(k)
+            for instr in body:
+                msg = replayStep(state, instr, goldens)
+                if msg is not None:
+                    return msg
+        return None
+    return doStep(state, instr)
+
+def replayCommand(state, instr, golden):
+    """Run the ">" instruction INSTR with gitlet.Main in STATE and compare
+    the result with the golden step GOLDEN, as for replayStep."""
+    if stopped():
+        raise Stopped()
+    line_num = state.line_num = instr[0]
+    if golden is None or golden[0] != line_num:
+        raise ValueError("recorded steps do not match the test")
+    _, staff_status, staff_out, staff_tree = golden
+    cmnd, expected, is_regexp = substituted(state, instr)[1]
+    if verbose:
+        print("+ {}".format(instr[1]))
+    msg, out = doExecute(cmnd, state.cdir, state.timeout, line_num)
+    status = commandStatus(msg)
+    if status != staff_status:
+        return "exit status {} with gitlet.Main, but {} with staff-gitlet" \
+            .format(status, staff_status)
+    if out is None:
+        return None
+    correctProgramOutput(expected, out, state.last_groups, is_regexp)
+    out = maskedOutput(normalizedOutput(out), state.ids)
+    if out != staff_out:
+        printDifferences(staff_out, out)
+        return "output differs from staff-gitlet's"
+    if treeDigest(state.tmpdir) != staff_tree:
+        return "files differ from staff-gitlet's"
+    return None
+
+# Size of the blocks written by generateFile.
+GENERATE_BLOCK = 1 << 20
+# Translates random bytes into lowercase letters and (about one time in 64)
+# newlines.
+GENERATE_TABLE = bytes((ord('\n') if b % 64 == 0 else ord('a') + b % 26)
+                       for b in range(256))
+
+def fileSize(size):
+    """Returns the number of bytes denoted by SIZE, a decimal numeral
+    optionally followed by K, M, or G (for multiples of 1024)."""
+    mat = re.match(r'(\d+)([KMG]?)$', size.upper())
+    if not mat:
+        raise ValueError("bad file size: {}".format(size))
+    return int(mat.group(1)) << (10 * " KMG".index(mat.group(2) or " "))
+
+def generateFile(name, size, seed):
+    """Write SIZE bytes of text to file NAME, whose contents are determined
+    by the string SEED.  The file is written a block at a time, so that
+    memory use does not depend on SIZE."""
+    rand = random.Random(seed)
+    try:
+        with open(name, 'wb') as out:
+            while size > 0:
+                n = min(size, GENERATE_BLOCK)
+                out.write(rand.randbytes(n).translate(GENERATE_TABLE))
+                size -= n
+    except OSError:
+        raise ValueError("could not generate file {}".format(name))
+
+def doTest(test):
+    base = splitext(basename(test))[0]
+    print("{}:".format(base))
+    program, included_files = compileTest(test)
+    goldens = None
+    if golden_store:
+        steps = golden_store.steps(test, testDigest(test, included_files))
+        if steps is None:
+            raise ValueError("not recorded, or changed since recorded")
+        goldens = iter(steps)
+    state = TestState(createTempDir(base))
+    staff = diff and TestState(createTempDir(base + "_staff"))
+
+    if verbose:
+        print("Testing directory: {}".format(state.tmpdir))
+
+    if DEBUG:
+        print(DEBUG_MSG)
+
+    _tls.tests = [test]
+    start = perf_counter()
+    try:
+        for instr in program:
+            if staff:
+                msg = diffStep(state, staff, instr)
+            elif goldens:
+                msg = replayStep(state, instr, goldens)
             else:
-                raise ValueError("bad test line at {}".format(line_num))
+                msg = doStep(state, instr)
+            if msg is not None:
+                print("ERROR ({})".format(msg))
+                reportDetails(test, included_files, state.line_num)
+                timings.test(test, "error", msg, perf_counter() - start)
+                return False
+        print("OK")
+        timings.test(test, "passed", None, perf_counter() - start)
+        return True
+    except Stopped:
+        print("SKIPPED (--maxfail reached)")
+        timings.test(test, "skipped", None, perf_counter() - start)
+        return None
     finally:
         if not keep:
-            cleanTempDir(tmpdir)
+            cleanTempDir(state.tmpdir)
+            if staff:
+                cleanTempDir(staff.tmpdir)
+
+def runTest(test):
+    """Run TEST, returning "missing" if it does not exist, "passed" or
+    "error" according to its outcome, "failed" if TEST itself is faulty,
+    and "skipped" if it was stopped by --maxfail."""
+    try:
+        if not exists(test):
+            return "missing"
+        fingerprint = None
+        if result_cache:
+            fingerprint = result_cache.fingerprint(test)
+            if result_cache.unchanged(test, fingerprint):
+                print("{}:".format(splitext(basename(test))[0]))
+                print("OK (unchanged)")
+                timings.test(test, "unchanged", None, 0.0)
+                return "passed"
+        passed = doTest(test)
+        if passed is None:
+            return "skipped"
+        if result_cache:
+            result_cache.record(test, fingerprint, passed)
+        return "passed" if passed else "error"
+    except ValueError as excp:
+        print("FAILED ({})".format(excp.args[0]))
+        timings.test(test, "failed", excp.args[0], None)
+        return "failed"
+
+def runBuffered(test):
+    """Run TEST in a worker thread, returning its result, its output, and
+    the arguments to reportDetails if it requested error details."""
+    _tls.buffer = StringIO()
+    _tls.details = None
+    try:
+        result = runTest(test)
+        return result, _tls.buffer.getvalue(), _tls.details
+    finally:
+        _tls.buffer = None
+
+class PrefixNode:
+    """A node in a tree of the compiled instruction sequences of several
+    tests.  The edge into a node corresponds to one instruction, KEY (an
+    instruction without its line number), shared by the tests that reach
+    the node; LINES maps the index of each of those tests to the line
+    number of that instruction in it.  ENDING lists the indices of the
+    tests whose instructions end here."""
+
+    def __init__(self, key=None):
+        self.key = key
+        self.lines = {}
+        self.ending = []
+        self.children = {}
+
+    def add(self, index, program):
+        """Add the instructions PROGRAM of the test with index INDEX to the
+        tree rooted here."""
+        node = self
+        for instr in program:
+            key = instr[1:]
+            if key not in node.children:
+                node.children[key] = PrefixNode(key)
+            node = node.children[key]
+            node.lines[index] = instr[0]
+        node.ending.append(index)
+
+    def instruction(self):
+        """The instruction on the edge into this node."""
+        return (next(iter(self.lines.values())),) + self.key
+
+def runShared(files, pool):
+    """Run the tests in FILES, executing each instruction sequence common to
+    the beginnings of several tests only once.  After a shared prefix, the
+    test directory is copied for each test (or group of tests) that
+    continues differently.  Branches run in POOL, if it is not None.
+    Returns a list of futures giving the result of each test, its output,
+    and the arguments to reportDetails, as for runBuffered."""
+    slots = [Future() for test in files]
+    headers = {}
+    root = PrefixNode()
+
+    for index, test in enumerate(files):
+        header = "{}:\n".format(splitext(basename(test))[0])
+        if not exists(test):
+            slots[index].set_result(("missing", "", None))
+            continue
+        try:
+            fingerprint = None
+            if result_cache:
+                fingerprint = result_cache.fingerprint(test)
+                if result_cache.unchanged(test, fingerprint):
+                    slots[index].set_result(
+                        ("passed", header + "OK (unchanged)\n", None))
+                    timings.test(test, "unchanged", None, 0.0)
+                    continue
+            program, included_files = compileTest(test)
+        except ValueError as excp:
+            timings.test(test, "failed", excp.args[0], None)
+            slots[index].set_result(
+                ("failed", header + "FAILED ({})\n".format(excp.args[0]),
+                 None))
+            continue
+        headers[index] = (test, included_files, fingerprint, header)
+        root.add(index, program)
+
+    def subtree(node):
+        """The indices of the tests that reach NODE."""
+        return list(node.lines) if node.key else list(headers)
+
+    def finish(index, result, state, transcript, details=None,
+               message=None):
+        test, included_files, fingerprint, header = headers[index]
+        if result_cache and result in ("passed", "error"):
+            result_cache.record(test, fingerprint, result == "passed")
+        timings.test(test, result, message, state.elapsed)
+        if verbose:
+            header += "Testing directory: {}\n".format(state.tmpdir)
+        slots[index].set_result((result, header + "".join(transcript),
+                                 details))
+
+    def failedLine(node, index, state):
+        """The line number of the instruction in the test with index INDEX
+        that failed at NODE."""
+        if node.key[2] == 'R':
+            # Tests share a repeat block only if its body, with its line
+            # numbers, is identical.
+            return state.line_num
+        return node.lines[index]
+
+    def launch(node, state, transcript):
+        if pool:
+            pool.submit(runNode, node, state, transcript)
+        else:
+            runNode(node, state, transcript)
+
+    def runNode(node, state, transcript):
+        """Execute the instruction into NODE (if any) and those below it in
+        STATE, whose output so far is TRANSCRIPT."""
+        try:
+            while True:
+                if node.key is not None:
+                    _tls.buffer = StringIO()
+                    _tls.tests = [headers[index][0]
+                                  for index in subtree(node)]
+                    start = perf_counter()
+                    try:
+                        msg = doStep(state, node.instruction())
+                        transcript.append(_tls.buffer.getvalue())
+                    finally:
+                        _tls.buffer = None
+                        state.elapsed += perf_counter() - start
+                    if msg is not None:
+                        for index in subtree(node):
+                            finish(index, "error", state,
+                                   transcript + ["ERROR ({})\n".format(msg)],
+                                   (headers[index][0], headers[index][1],
+                                    failedLine(node, index, state)), msg)
+                        return
+                for index in node.ending:
+                    finish(index, "passed", state, transcript + ["OK\n"])
+                children = list(node.children.values())
+                if not children:
+                    return
+                for child in children[:-1]:
+                    test = headers[next(iter(child.lines))][0]
+                    launch(child,
+                           state.fork(splitext(basename(test))[0]),
+                           list(transcript))
+                node = children[-1]
+        except ValueError as excp:
+            for index in subtree(node):
+                finish(index, "failed", state,
+                       transcript + ["FAILED ({})\n".format(excp.args[0])],
+                       message=excp.args[0])
+        except Stopped:
+            for index in subtree(node):
+                finish(index, "skipped", state,
+                       transcript + ["SKIPPED (--maxfail reached)\n"])
+        except BaseException as excp:
+            for index in subtree(node):
+                if not slots[index].done():
+                    slots[index].set_exception(excp)
+            raise
+        finally:
+            if not keep:
+                cleanTempDir(state.tmpdir)
+
+    if headers:
+        first = headers[next(iter(headers))][0]
+        launch(root, TestState(createTempDir(splitext(basename(first))[0])),
+               [])
+    return slots
+
+def runTests(files, jobs):
+    """Run the tests in FILES using up to JOBS concurrent workers, printing
+    each test's output in order.  Returns the number of tests run, the
+    number with errors, the number of faulty tests, and the number skipped
+    because of --maxfail."""
+    global show
+    num_tests = len(files)
+    errs = 0
+    fails = 0
+    skipped = 0
+
+    buffered = jobs > 1 or share_prefixes
+    pool = None
+    if buffered:
+        sys.stdout = ThreadOutput(sys.stdout)
+    if jobs > 1:
+        pool = ThreadPoolExecutor(max_workers=jobs)
+    if share_prefixes:
+        results = (future.result() for future in runShared(files, pool))
+    elif jobs <= 1:
+        results = (runTest(test) for test in files)
+    else:
+        results = (future.result() for future in
+                   [pool.submit(runBuffered, test) for test in files])
+
+    try:
+        for result in results:
+            if buffered:
+                result, text, details = result
+                sys.stdout.write(text)
+                if details:
+                    reportDetails(*details)
+            if result == "missing":
+                num_tests -= 1
+            elif result == "skipped":
+                num_tests -= 1
+                skipped += 1
+            elif result == "error":
+                errs += 1
+                if type(show) is int:
+                    show -= 1
+            elif result == "failed":
+                fails += 1
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if buffered:
+            sys.stdout = sys.stdout.stream
+    return num_tests, errs, fails, skipped
+
+def runAll(files):
+    """Run the tests in FILES, save what was learned about them, and report
+    the results.  Returns the exit status for the tester."""
+    num_tests, errs, fails, skipped = runTests(files, jobs)
+    if result_cache:
+        result_cache.save()
+    if history and not DEBUG:
+        history.update(timings.tests)
+        history.save()
+    if report:
+        timings.write(report)
+    if growth_log:
+        growth_log.write(growth_file)
+    if profiler:
+        recordings = profiler.summarize(PROFILE_PREFIX, keep)
+        if recordings is None:
+            print("Could not find the JDK's jfr tool to read the profiles "
+                  "in {}.".format(profiler.dir), file=sys.stderr)
+        else:
+            print("Profiled {} commands; see {}.txt and {}.collapsed."
+                  .format(recordings, PROFILE_PREFIX, PROFILE_PREFIX))
+
+    print()
+    if cds_archive and cds_archive.saving is not None:
+        starts = sum(1 for record in timings.commands
+                     if record["spawn"] != "warm")
+        print("Class data sharing saved about {:.0f} ms per JVM start "
+              "({:.1f} s over {} starts).".format(
+                  1000 * cds_archive.saving, cds_archive.saving * starts,
+                  starts))
+    if skipped:
+        print("Stopped after {} failures; skipped {} tests."
+              .format(errs + fails, skipped))
+    limits = timings.limits()
+    if any(limits.values()):
+        print("Commands stopped by limits: {}.".format(
+            ", ".join("{} {}".format(count, kind)
+                      for kind, count in limits.items() if count)))
+    print("Ran {} tests. ".format(num_tests), end="")
+    if errs == fails == 0:
+        print("All passed.")
+        return 0
+    else:
+        print("{} passed.".format(num_tests - errs - fails))
+        return 1
+
+def watchedInputs(files):
+    """The full names of the tests in FILES and the files they include."""
+    result = set()
+    for test in files:
+        result.add(abspath(test))
+        try:
+            included_files = compileTest(test)[1]
+        except ValueError:
+            continue
+        result.update(abspath(join(dirname(test), name))
+                      for name in included_files)
+    return result
+
+def watchTests(files):
+    """Run the tests in FILES, then wait for a change to the gitlet sources,
+    the tests, or the src files, recompile, and run them again, until
+    interrupted (see --watch)."""
+    global timings, show
+    initial_show = show
+    gitlet_dir = abspath(join(prog_dir, "gitlet"))
+    fixtures = abspath(src_dir)
+    if cache_dir:
+        record = join(cache_dir, "javac.json")
+    else:
+        record = join(mkdtemp(prefix="javac"), "javac.json")
+        atexit.register(rmtree, dirname(record), ignore_errors=True)
+    compiler = CompileCache(record, java_argv(WATCH_JAVAC),
+                            environ.get('CLASSPATH', ''))
+    try:
+        while True:
+            inputs = watchedInputs(files)
+            def wanted(name):
+                return name in inputs or dirname(name) == fixtures \
+                    or (dirname(name) == gitlet_dir and name.endswith(".java"))
+            # Started before the run, so that edits made during it count.
+            watcher = Watcher([gitlet_dir, fixtures]
+                              + [dirname(name) for name in inputs], wanted)
+            try:
+                sources = sorted(glob(join(gitlet_dir, "*.java")))
+                status, out, compiled = compiler.compile(sources)
+                if compiled:
+                    print("Compiled {}.".format(
+                        ", ".join(basename(name) for name in compiled)))
+                print(out, end="")
+                if status != 0:
+                    print("Your program failed to compile.")
+                else:
+                    timings = Timings()
+                    show = initial_show
+                    if result_cache:
+                        result_cache.refresh()
+                    runAll(orderTests(files, order))
+                    if result_cache:
+                        result_cache.reuse = True
+                print("\nWatching for changes (interrupt to stop)...")
+                watcher.wait()
+            finally:
+                watcher.close()
+            print()
+    except KeyboardInterrupt:
+        print()
+        sys.exit(0)
 
 if __name__ == "__main__":
     show = None
@@ -395,12 +2302,38 @@ if __name__ == "__main__":
     verbose = False
     src_dir = 'src'
     output_tolerance = 3
+    match_limit = MATCH_LIMIT
+    max_output = fileSize(MAX_OUTPUT)
+    memory_limit = cpu_limit = files_limit = None
+    jobs = 1
+    warm = False
+    cache_dir = '.testcache'
+    reuse_results = True
+    share_prefixes = False
+    work_dir = '.'
+    report = None
+    direct = True
+    cds = False
+    shard = None
+    merge = None
+    order = "given"
+    maxfail = None
+    watch = False
+    diff = False
+    golden_store = None
+    profile = None
+    growth_file = None
 
     try:
         opts, files = \
             getopt(sys.argv[1:], '',
                    ['show=', 'keep', 'progdir=', 'verbose', 'src=',
-                    'tolerance=', 'debug'])
+                    'tolerance=', 'match-limit=', 'max-output=',
+                    'limit-memory=', 'limit-cpu=', 'limit-files=', 'debug',
+                    'jobs=', 'warm', 'cachedir=', 'no-cache',
+                    'share-prefixes', 'workdir=', 'report=', 'shell', 'cds',
+                    'shard=', 'merge=', 'order=', 'maxfail=', 'watch', 'diff',
+                    'replay=', 'profile=', 'growth='])
         for opt, val in opts:
             if opt == '--show':
                 val = val.lower()
@@ -420,8 +2353,68 @@ if __name__ == "__main__":
                 verbose = True
             elif opt == "--tolerance":
                 output_tolerance = int(val)
+            elif opt == "--match-limit":
+                match_limit = float(val)
+            elif opt == "--max-output":
+                max_output = fileSize(val)
+            elif opt == "--limit-memory":
+                memory_limit = fileSize(val)
+            elif opt == "--limit-cpu":
+                cpu_limit = ceil(float(val))
+            elif opt == "--limit-files":
+                files_limit = int(val)
             elif opt == "--debug":
                 DEBUG = True
+            elif opt == "--jobs":
+                jobs = int(val)
+            elif opt == "--warm":
+                warm = True
+            elif opt == "--cachedir":
+                cache_dir = val
+            elif opt == "--no-cache":
+                reuse_results = False
+            elif opt == "--share-prefixes":
+                share_prefixes = True
+            elif opt == "--workdir":
+                work_dir = val
+            elif opt == "--report":
+                report = re.sub(r'\.(json|xml)$', '', val)
+            elif opt == "--shell":
+                direct = False
+            elif opt == "--cds":
+                cds = True
+            elif opt == "--shard":
+                mat = re.match(r'(\d+)/(\d+)$', val)
+                if not mat or not 1 <= int(mat.group(1)) <= int(mat.group(2)):
+                    Usage()
+                shard = int(mat.group(1)), int(mat.group(2))
+            elif opt == "--merge":
+                merge = re.sub(r'\.(json|xml)$', '', val)
+            elif opt == "--order":
+                if val not in ("given", "longest", "failed"):
+                    Usage()
+                order = val
+            elif opt == "--maxfail":
+                maxfail = int(val)
+            elif opt == "--watch":
+                watch = True
+            elif opt == "--diff":
+                diff = True
+            elif opt == "--growth":
+                growth_file = val
+            elif opt == "--profile":
+                profile = val
+            elif opt == "--replay":
+                golden_store = GoldenStore(val)
+                if not golden_store.tests:
+                    print("No golden output recorded in {}.".format(val),
+                          file=sys.stderr)
+                    sys.exit(1)
+        history = None
+        if cache_dir:
+            history = TestHistory(join(cache_dir, "durations.json"))
+        if merge is not None:
+            sys.exit(mergeReports(merge, files))
         if prog_dir is None:
             prog_dir = abspath(getcwd())
             k = 10
@@ -439,6 +2432,8 @@ if __name__ == "__main__":
         print(USAGE)
         sys.exit(0)
 
+    fixture_store = FixtureStore(src_dir)
+
     ON_WINDOWS = Match(r'.*\\', join('a', 'b'))
     if ON_WINDOWS:
         if 'CLASSPATH' in environ:
@@ -451,27 +2446,75 @@ if __name__ == "__main__":
         else:
             environ['CLASSPATH'] = "{}".format(prog_dir)
         JAVA_COMMAND = 'exec ' + JAVA_COMMAND
+        STAFF_COMMAND = 'exec ' + STAFF_COMMAND
 
-    num_tests = len(files)
-    errs = 0
-    fails = 0
+    try:
+        makedirs(work_dir, exist_ok=True)
+    except OSError:
+        print("Could not create {}.".format(work_dir), file=sys.stderr)
+        sys.exit(1)
+    cleaner = Cleaner()
+    cleaner.start()
+    atexit.register(cleaner.finish)
 
-    for test in files:
-        try:
-            if not exists(test):
-                num_tests -= 1
-            elif not doTest(test):
-                errs += 1
-                if type(show) is int:
-                    show -= 1
-        except ValueError as excp:
-            print("FAILED ({})".format(excp.args[0]))
-            fails += 1
+    growth_log = growth_file and GrowthLog()
 
-    print()
-    print("Ran {} tests. ".format(num_tests), end="")
-    if errs == fails == 0:
-        print("All passed.")
-    else:
-        print("{} passed.".format(num_tests - errs - fails))
-        sys.exit(1)
+    profiler = None
+    if profile and not DEBUG:
+        profile_dir = abspath(mkdtemp(prefix="profile_", dir=work_dir))
+        profiler = Profiler(profile_dir,
+                            None if profile == "all"
+                            else set(profile.split(",")),
+                            java_argv(JAVA_COMMAND)[0])
+        if not keep:
+            atexit.register(rmtree, profiler.dir, True)
+
+    timings = Timings()
+    compile_cache = cache_dir and join(cache_dir, "compiled")
+    result_cache = None
+    if cache_dir and not DEBUG and not diff and not golden_store \
+       and not profile and not growth_file:
+        result_cache = ResultCache(join(cache_dir, "results.json"),
+                                   reuse_results)
+
+    rlimits = []
+    if resource:
+        for kind, value, slack in ((resource.RLIMIT_AS, memory_limit, 0),
+                                   (resource.RLIMIT_CPU, cpu_limit, 1)):
+            if value:
+                hard = resource.getrlimit(kind)[1]
+                if hard != resource.RLIM_INFINITY:
+                    value = min(value, hard)
+                    slack = min(slack, hard - value)
+                rlimits.append((kind, (value, value + slack)))
+
+    warm_pool = None
+    if warm and not DEBUG and not (memory_limit or cpu_limit or files_limit):
+        warm_pool = WarmPool(JAVA_COMMAND, "javac", GITLET_CLASS)
+
+    cds_archive = None
+    if cds and not DEBUG and not watch:
+        cds_archive = ClassDataArchive(JAVA_COMMAND, GITLET_CLASS, prog_dir,
+                                       cache_dir and join(cache_dir, "cds"),
+                                       CDS_TRAINING, CDS_FILES)
+        if cds_archive.enabled:
+            cds_archive.measure()
+            environ['CLASSPATH'] = cds_archive.classpath(cds_archive.jar)
+            JAVA_COMMAND = " ".join([JAVA_COMMAND] +
+                                    [quote(opt) for opt in cds_archive.options])
+
+    if DEBUG:
+        jobs = 1
+        share_prefixes = False
+    diff_pool = None
+    if diff or golden_store:
+        share_prefixes = False
+    if diff:
+        diff_pool = ThreadPoolExecutor(max_workers=jobs)
+
+    if shard:
+        files = shardTests(files, *shard)
+
+    if watch and not DEBUG:
+        watchTests(files)
+    sys.exit(runAll(orderTests(files, order)))
@@ -0,0 +1,93 @@
+"""Digests of whole directory trees, used by the testers' H instruction to
+check the state of a test directory with one walk of it.
+
+The digest of a directory is the SHA-1 of its entries in order of name,
+each given as its kind (file, directory, or symbolic link), its name, and
+the digest of what it holds: for a file, its canonical contents (as for
+=, with \r\n and lone \r taken as \n); for a directory, its own digest,
+computed in the same way; for a link, its target.  Two trees thus have
+the same digest exactly when they have the same names, structure, and
+contents (up to line terminators), as with Git's tree objects.
+Directories named .gitlet are left out, unless they are asked for.
+
+Usage: python3 treedigest.py [--all] DIR ...
+
+prints the digest of each DIR (including .gitlet directories, with
+--all), for use in an H (or, with --all, H*) instruction.  Running a test
+that ends where the H instruction will go with tester.py --keep leaves a
+directory to run this on."""
+
+import os, sys, hashlib
+from os.path import isdir
+from fixtures import canonicalDigest
+
+GITLET_DIR = ".gitlet"
+
+def treeDigest(path, skip_gitlet=True):
+    """Returns the hexadecimal digest of the directory PATH and all it
+    contains (except directories named .gitlet, if SKIP_GITLET), or None
+    if PATH is not a directory."""
+    if not isdir(path):
+        return None
+    return _treeDigest(path, skip_gitlet).hex()
+
+def _treeDigest(path, skip_gitlet):
+    digest = hashlib.sha1(b"tree\0")
+    with os.scandir(path) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_symlink():
+            kind = b"l"
+            child = hashlib.sha1(os.fsencode(os.readlink(entry.path))).digest()
+        elif entry.is_dir():
+            if skip_gitlet and entry.name == GITLET_DIR:
+                continue
+            kind, child = b"d", _treeDigest(entry.path, skip_gitlet)
+        else:
+            kind, child = b"f", canonicalDigest(entry.path)[1]
+        digest.update(kind + os.fsencode(entry.name) + b"\0" + child)
+    return digest.digest()
+
+def treeFiles(path, skip_gitlet=True):
+    """Returns a dictionary mapping the name relative to the directory PATH
+    of each file, directory, and link under it (with .gitlet directories
+    left out as for treeDigest) to a digest of its contents (None for a
+    directory), for describing how two trees differ."""
+    result = {}
+    def walk(dir, prefix):
+        with os.scandir(dir) as entries:
+            for entry in entries:
+                name = prefix + entry.name
+                if entry.is_symlink():
+                    result[name] = os.readlink(entry.path)
+                elif entry.is_dir():
+                    if not (skip_gitlet and entry.name == GITLET_DIR):
+                        result[name + "/"] = None
+                        walk(entry.path, name + "/")
+                else:
+                    result[name] = canonicalDigest(entry.path)[1]
+    if isdir(path):
+        walk(path, "")
+    return result
+
+def main(args):
+    skip_gitlet = args[:1] != ["--all"]
+    if not skip_gitlet:
+        args = args[1:]
+    if not args:
+        print(__doc__.split("Usage: ")[1], file=sys.stderr)
+        sys.exit(1)
+    status = 0
+    for dir in args:
+        digest = treeDigest(dir, skip_gitlet)
+        if digest is None:
+            print("{}: not a directory".format(dir), file=sys.stderr)
+            status = 1
+        elif len(args) == 1:
+            print(digest)
+        else:
+            print(digest, dir)
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,190 @@
+"""Support for running a Java program's main class repeatedly in one
+long-lived JVM (see WarmDriver.java), used by tester.py and runner.py
+with --warm.
+
+A WarmPool compiles WarmDriver once and hands each thread its own
+WarmJVM, since a JVM running a request has its standard output and
+user.dir set for that request alone.  Each WarmJVM is started in the
+directory its commands run in, and replaced by a new one when its thread
+runs a command in another directory: setting user.dir is not enough,
+since java.io.File and java.nio.file resolve relative paths (".gitlet",
+say) against the directory the JVM started in (since JDK 11).  A JVM is
+thus shared by the commands of one test, not by the whole run.  When a
+WarmJVM crashes, times out, or otherwise fails to produce a reply, run
+raises WarmJVMError after killing the JVM; the caller is expected to fall
+back to running the command in a fresh JVM."""
+
+import shlex, sys, threading, atexit
+from subprocess import \
+    Popen, check_output, PIPE, STDOUT, DEVNULL, CalledProcessError
+from os import environ, pathsep
+from os.path import abspath, dirname, join
+from locale import getpreferredencoding
+from spawn import shellWords
+from tempfile import mkdtemp
+from shutil import rmtree
+
+DRIVER_SOURCE = join(dirname(abspath(__file__)), "WarmDriver.java")
+DRIVER_CLASS = "WarmDriver"
+# Needed by JDK 18 and later to permit System.setSecurityManager, but an
+# error before JDK 12, so WarmPool tries it both ways.
+DRIVER_OPTIONS = ["-Djava.security.manager=allow"]
+
+class WarmJVMError(Exception):
+    """The warm JVM could not run a command."""
+
+def java_argv(java_command):
+    """Returns JAVA_COMMAND (e.g., "exec java -ea") as an argument list,
+    without any leading shell "exec"."""
+    argv = shlex.split(java_command)
+    if argv and argv[0] == "exec":
+        argv = argv[1:]
+    return argv
+
+class WarmJVM:
+    """A JVM running WarmDriver for MAIN_CLASS in directory DIR."""
+
+    def __init__(self, java, main_class, driver_dir, options, dir):
+        classpath = driver_dir
+        if environ.get('CLASSPATH'):
+            classpath += pathsep + environ['CLASSPATH']
+        self.proc = Popen(java + options +
+                          ["-cp", classpath, DRIVER_CLASS, main_class],
+                          stdin=PIPE, stdout=PIPE, stderr=DEVNULL, cwd=dir)
+        self.dir = dir
+        self.timed_out = False
+        if self.proc.stdout.readline() != b"READY\n":
+            self.close()
+            raise WarmJVMError("could not trap System.exit")
+
+    def run(self, args, timeout):
+        """Run the main class with arguments ARGS (a list of strings) in
+        this JVM's directory, allowing TIMEOUT seconds (None for no
+        limit).  Returns the exit status and the combined output."""
+        fields = [self.dir.encode()] + [arg.encode() for arg in args]
+        request = "RUN {}\n".format(len(fields)).encode()
+        for field in fields:
+            request += "{}\n".format(len(field)).encode() + field
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, self._expire)
+            timer.start()
+        try:
+            self.proc.stdin.write(request)
+            self.proc.stdin.flush()
+            header = self.proc.stdout.readline().split()
+            if header == [b"WRONGDIR"]:
+                raise ValueError("started in another directory")
+            status, size = int(header[0]), int(header[1])
+            out = self.proc.stdout.read(size)
+            if len(out) != size:
+                raise ValueError("truncated reply")
+        except (OSError, ValueError, IndexError):
+            self.close()
+            raise WarmJVMError("timeout" if self.timed_out else "crashed")
+        finally:
+            if timer:
+                timer.cancel()
+        out = out.decode(getpreferredencoding(False), errors="replace")
+        return status, out.replace("\r\n", "\n").replace("\r", "\n")
+
+    def _expire(self):
+        self.timed_out = True
+        self.proc.kill()
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+class WarmPool:
+    """Per-thread WarmJVMs running MAIN_CLASS, launched with JAVA_COMMAND
+    and with WarmDriver compiled using JAVAC_COMMAND."""
+
+    def __init__(self, java_command, javac_command, main_class):
+        self.java = java_argv(java_command)
+        self.main_class = main_class
+        self.driver_dir = mkdtemp(prefix="warmjvm")
+        self.options = None
+        self.local = threading.local()
+        self.jvms = []
+        self.lock = threading.Lock()
+        self.enabled = True
+        atexit.register(self.close)
+        try:
+            check_output(java_argv(javac_command)[:1] +
+                         ["-nowarn", "-d", self.driver_dir, DRIVER_SOURCE],
+                         stdin=DEVNULL, stderr=STDOUT)
+        except (OSError, CalledProcessError):
+            self.disable("could not compile {}".format(DRIVER_SOURCE))
+
+    def disable(self, why):
+        if self.enabled:
+            self.enabled = False
+            print("Warning: --warm disabled ({}).".format(why),
+                  file=sys.__stderr__)
+
+    def run(self, cmnd, dir, timeout):
+        """Run the main class with the shell-quoted operands CMND in DIR,
+        as for WarmJVM.run, starting a JVM in DIR for this thread if its
+        JVM is in another directory or there is none.  Raises WarmJVMError
+        if the pool is disabled or the command failed."""
+        if not self.enabled:
+            raise WarmJVMError("disabled")
+        args = shellWords(cmnd)
+        if args is None:
+            raise WarmJVMError("needs the shell")
+        dir = abspath(dir)
+        jvm = getattr(self.local, 'jvm', None)
+        if jvm is None or jvm.dir != dir or not jvm.alive():
+            if jvm is not None:
+                self.retire(jvm)
+            self.local.jvm = None
+            jvm = self.local.jvm = self.start(dir)
+        try:
+            return jvm.run(args, timeout)
+        except WarmJVMError:
+            self.local.jvm = None
+            self.retire(jvm)
+            raise
+
+    def leave(self, dir):
+        """Stop any JVMs running in DIR (so that it can be removed)."""
+        dir = abspath(dir)
+        with self.lock:
+            jvms = [jvm for jvm in self.jvms if jvm.dir == dir]
+        for jvm in jvms:
+            self.retire(jvm)
+
+    def retire(self, jvm):
+        with self.lock:
+            if jvm in self.jvms:
+                self.jvms.remove(jvm)
+        jvm.close()
+
+    def start(self, dir):
+        """Returns a new WarmJVM in DIR, disabling the pool if none will
+        start."""
+        for options in ([self.options] if self.options is not None
+                        else [DRIVER_OPTIONS, []]):
+            try:
+                jvm = WarmJVM(self.java, self.main_class, self.driver_dir,
+                              options, dir)
+                self.options = options
+                with self.lock:
+                    self.jvms.append(jvm)
+                return jvm
+            except (OSError, WarmJVMError) as excp:
+                why = excp
+        self.disable(why)
+        raise WarmJVMError("disabled")
+
+    def close(self):
+        with self.lock:
+            for jvm in self.jvms:
+                jvm.close()
+            self.jvms = []
+        rmtree(self.driver_dir, ignore_errors=True)
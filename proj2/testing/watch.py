@@ -0,0 +1,114 @@
+"""Waiting for files to change, used by tester.py and runner.py with
+--watch.
+
+A Watcher is given a list of directories and a predicate on file names.
+Its wait method returns once some file in one of the directories for
+which the predicate is true has been written, created, deleted, or
+renamed, and has then stayed unchanged for QUIET seconds (editors often
+save a file in several steps).  On Linux, it uses inotify (through
+ctypes, so that it needs no extra packages); elsewhere, or if inotify is
+unavailable, it compares the modification times and sizes of the files
+every POLL seconds.  Subdirectories are not watched, so test directories
+created by the testers do not count as changes."""
+
+import os, struct, select, ctypes, ctypes.util
+from os.path import abspath, isdir, isfile, join
+from time import sleep
+
+QUIET = 0.2
+POLL = 0.5
+
+# From <sys/inotify.h>.
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM \
+             | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+class Watcher:
+    """Watches the files in the directories DIRS whose full names satisfy
+    the predicate WANTED."""
+
+    def __init__(self, dirs, wanted):
+        self.dirs = sorted(set(abspath(dir) for dir in dirs if isdir(dir)))
+        self.wanted = wanted
+        self.fd = None
+        self.wds = {}
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1")
+            for dir in self.dirs:
+                wd = libc.inotify_add_watch(fd, dir.encode(), WATCH_MASK)
+                if wd < 0:
+                    os.close(fd)
+                    raise OSError(ctypes.get_errno(), "inotify_add_watch")
+                self.wds[wd] = dir
+            self.fd = fd
+        except (OSError, AttributeError, TypeError):
+            self.snapshot = self.scan()
+
+    def wait(self):
+        """Return once a wanted file has changed and then settled."""
+        if self.fd is None:
+            while self.scan() == self.snapshot:
+                sleep(POLL)
+            while True:
+                self.snapshot = self.scan()
+                sleep(QUIET)
+                if self.scan() == self.snapshot:
+                    return
+        while not self.events(None):
+            pass
+        while self.events(QUIET):
+            pass
+
+    def events(self, timeout):
+        """True iff a wanted file changed within TIMEOUT seconds (None for
+        no limit).  Reads all pending events."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        data = os.read(self.fd, 1 << 16)
+        found = False
+        k = 0
+        while k < len(data):
+            wd, mask, cookie, size = EVENT_HEADER.unpack_from(data, k)
+            k += EVENT_HEADER.size
+            name = data[k:k + size].rstrip(b"\0").decode(errors="replace")
+            k += size
+            if not mask & IN_ISDIR and wd in self.wds \
+               and self.wanted(join(self.wds[wd], name)):
+                found = True
+        return found
+
+    def scan(self):
+        """Returns the modification times and sizes of the wanted files."""
+        result = {}
+        for dir in self.dirs:
+            try:
+                names = os.listdir(dir)
+            except OSError:
+                continue
+            for name in names:
+                full = join(dir, name)
+                if self.wanted(full) and isfile(full):
+                    try:
+                        info = os.stat(full)
+                    except OSError:
+                        continue
+                    result[full] = (info.st_mtime_ns, info.st_size)
+        return result
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None